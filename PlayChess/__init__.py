@@ -38,8 +38,8 @@ celery.conf.update(app.config)
 
 Worker.worker = celery
 
-# Socket IO connection.
-socketio = SocketIO(app)
+# Socket IO connection. Celery workers emit through the message queue.
+socketio = SocketIO(app, message_queue=os.environ.get('REDIS_URL', None))
 
 # Imports
 from PlayChess.site.routes import mod
@@ -10,10 +10,10 @@ from datetime import timedelta
 
 mod = Blueprint('admin', __name__, template_folder='admin_templates')
 
-from ..utils import site_admin
+from ..utils import site_admin, engine_pool, eval_cache
 from .decorators import login_required, logout_required
 # Import global vars
-from ..config import ADMIN_DICT, EMAIL_PATTERN_COMPILED, USERNAME_REGEX, TERMINAL_COLORS
+from ..config import ADMIN_DICT, EMAIL_PATTERN_COMPILED, USERNAME_REGEX, TERMINAL_COLORS, ENGINE_SEARCHES
 
 from .. import database
 db = database.db
@@ -114,6 +114,17 @@ def update():
         "authentication": request.form["authentication"], 
     })
 
+# Hit and miss counts of the evaluation cache, searches shared by identical requests
+# and the engines of the pool
+@mod.route('/engine_stats')
+@login_required
+def engine_stats():
+    return jsonify({
+        "cache": eval_cache.get_cache().stats(),
+        "searches": ENGINE_SEARCHES.stats(),
+        "engines": engine_pool.get_pool().stats(),
+    })
+
 @mod.route('/logout')
 @login_required
 def logout():
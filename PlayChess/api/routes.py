@@ -1,12 +1,17 @@
 # Blog application could be accessed by both admins and the users!
 
-import os
-
 from flask import Blueprint, request, jsonify
+from flask_socketio import emit
 from ..utils import token
-from ..config import Worker
+from ..utils import analysis
+from ..utils import engine_pool
+from ..utils import eval_cache
+from ..utils.exceptions import EngineUnavailable
+from ..config import Worker, ENGINE_MAX_LINES, ENGINE_SEARCHES, ANALYSIS_QUEUE
+from .. import socketio
 
 import chess, chess.engine
+import uuid
 
 mod = Blueprint('api', __name__)
 clry = Worker.worker
@@ -16,37 +21,146 @@ clry = Worker.worker
 def getToken():
     return "token: hello"
 
+def _search(cache, board, limit, lines):
+    with engine_pool.get_pool().engine() as engine:
+        result = engine.search(board, limit, lines)
+    cache.put(board, limit, lines, result)
+    return result
+
 @mod.route('/stockfish/', methods=['GET'])
 def getEngineEval():
     if token.validate_token(request.args.get('token', False)):
-        __location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
-        __filename__ = 'stockfish-prod' if os.environ.get("Production", False) else 'stockfish-dev'
-
         # Assign game Position
-        with chess.engine.SimpleEngine.popen_uci(os.path.join(__location__, __filename__)) as engine:
-            try:
-                fen_notation = request.args.get('fen_notation', "")
-                board = chess.Board(fen_notation)
-            except ValueError:
-                return jsonify({
-                    "fen_notation_error": "Please supply a valid fen notation",
-                })
-            strength = request.args.get('strength', 1)
-            time = min(1, 0.01 * 10 ** int(strength))
-            res = engine.play(board, chess.engine.Limit(time=time, depth=20))
-            info = engine.analyse(board, chess.engine.Limit(time=time, depth=20))
+        try:
+            fen_notation = request.args.get('fen_notation', "")
+            board = chess.Board(fen_notation)
+        except ValueError:
+            return jsonify({
+                "fen_notation_error": "Please supply a valid fen notation",
+            })
+        strength = request.args.get('strength', 1)
+        time = min(1, 0.01 * 10 ** int(strength))
+        # Top lines to show, all of them come from the same search
+        lines = min(max(int(request.args.get('lines', 1)), 1), ENGINE_MAX_LINES)
+        limit = chess.engine.Limit(time=time, depth=20)
 
-            engine.close()
+        # Engines are shared by every request, this waits for a free one unless the
+        # position was searched at least as hard before. Requests for a search that's
+        # already running wait for its result.
+        cache = eval_cache.get_cache()
+        result = cache.get(board, limit, lines)
+        try:
+            if result is None:
+                key = (eval_cache.position_key(board), limit.time, limit.depth, lines)
+                result = ENGINE_SEARCHES.do(key, lambda: _search(cache, board, limit, lines))
+        except EngineUnavailable:
+            return jsonify({
+                "engine_busy_error": "All engines are busy, please try again later",
+            })
+        except engine_pool.ENGINE_ERRORS:
+            return jsonify({
+                "engine_error": "The engine failed to evaluate the position, please try again",
+            })
+
+        return jsonify({
+            "best_move": str(result["best_move"]), 
+            "ponder": str(result["ponder"]),
+            "evaluation": str(result["evaluation"]),
+            "depth": result["depth"],
+            "pv": result["pv"],
+            "nodes": result["nodes"],
+            "lines": result["lines"],
+        })
+    return jsonify({
+        "access_token_error": "There seems to be a problem with your access token",
+    })
 
+# Starts an analysis job on a celery worker and returns its id right away. Lines and
+# the result are sent to the socketio client whose sid is given, on the /analysis
+# namespace. With infinite=1 the engine analyses until the client stops the job or
+# goes away.
+@mod.route('/analysis/', methods=['GET'])
+def startAnalysis():
+    if token.validate_token(request.args.get('token', False)):
+        fen_notation = request.args.get('fen_notation', "")
+        try:
+            chess.Board(fen_notation)
+        except ValueError:
             return jsonify({
-                "best_move": str(res.move), 
-                "ponder": str(res.ponder),
-                "evaluation": str(info["score"].white()),
+                "fen_notation_error": "Please supply a valid fen notation",
             })
+        sid = request.args.get('sid', None)
+        if not sid:
+            return jsonify({
+                "sid_error": "Please supply the sid of your /analysis socket",
+            })
+        # Socketio clients may prefix their id with the namespace, eg-> "/analysis#<sid>"
+        sid = sid.split('#')[-1]
+        lines = min(max(int(request.args.get('lines', 1)), 1), ENGINE_MAX_LINES)
+        time, depth = None, None
+        if request.args.get('infinite') != '1':
+            strength = request.args.get('strength', 1)
+            time = min(1, 0.01 * 10 ** int(strength))
+            depth = 20
+
+        # The job is known before it's queued, so it can't end before it's added
+        job_id = str(uuid.uuid4())
+        analysis.add_job(sid, job_id)
+        _analyse_position.apply_async(args=[fen_notation, sid, time, depth, lines], queue=ANALYSIS_QUEUE, task_id=job_id)
+        return jsonify({"job": job_id})
+    return jsonify({
+        "access_token_error": "There seems to be a problem with your access token",
+    })
+
+@mod.route('/analysis/<job_id>/stop', methods=['GET'])
+def stopAnalysis(job_id):
+    if token.validate_token(request.args.get('token', False)):
+        analysis.request_stop(job_id)
+        return jsonify({"success": True})
     return jsonify({
         "access_token_error": "There seems to be a problem with your access token",
     })
 
+@clry.task(bind=True)
+def _analyse_position(self, fen_notation, sid, time, depth, lines):
+    job_id = self.request.id
+
+    def send(event, data):
+        socketio.emit(event, data, room=sid, namespace='/analysis')
+
+    try:
+        analysis.run_analysis(
+            engine_pool.get_pool(),
+            fen_notation,
+            analysis.analysis_limit(time, depth),
+            lines,
+            send,
+            lambda: analysis.stop_requested(job_id),
+            job_id,
+            eval_cache.get_cache(),
+        )
+    except (EngineUnavailable,) + engine_pool.ENGINE_ERRORS:
+        send("analysis_error", {"job": job_id, "engine_error": "The engine failed to analyse the position"})
+    finally:
+        analysis.remove_job(sid, job_id)
+
+## Socket connections
+
+@socketio.on('connect', namespace='/analysis')
+def analysis_connect():
+    emit('analysis_connect', request.sid)
+
+@socketio.on('stop_analysis', namespace='/analysis')
+def stop_analysis(job_id):
+    if analysis.has_job(request.sid, job_id):
+        analysis.request_stop(job_id)
+
+# Jobs of a client that closes or leaves the page are stopped
+@socketio.on('disconnect', namespace='/analysis')
+def analysis_disconnect():
+    for job_id in analysis.pop_jobs(request.sid):
+        analysis.request_stop(job_id)
+
 # Send start date and end date as the string "None" if you want to fetch all events
 @mod.route('/events', methods=['GET'])
 def getAicfEvents():
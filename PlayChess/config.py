@@ -1,7 +1,7 @@
 import os
 import re as regex
 
-from .utils import game_queue
+from .utils import game_queue, single_flight
 
 # Contains secret key 
 configurations = {
@@ -19,6 +19,9 @@ CONTESTS = {}
 # Keeps track of players finding matches.
 PLAYERS_QUEUE = game_queue.GameQueue()
 
+# Engine searches running, identical requests wait for them instead of searching again
+ENGINE_SEARCHES = single_flight.SingleFlight()
+
 # Regex expression for email and username verification
 EMAIL_PATTERN_COMPILED = regex.compile(r"^([a-zA-Z0-9_\-\.]+)@((\[[0-9]{1,3}\.[0-9]{1,3}\.[0-9]{1,3}\.)|(([a-zA-Z0-9\-]+\.)+))([a-zA-Z]{2,4}|[0-9]{1,3})(\]?)$")
 # Username regex also limits the string to be b/w 5 and 30!
@@ -72,11 +75,52 @@ CHESS_PIECE_CLASS = {
     'n': ('Knight', 'black'),
 }
 
+# Castling right -> (king square, king destination, rook square, squares b/w king and rook, square passed by king)
+CASTLING_MOVES = {
+    'K': ('e1', 'g1', 'h1', ('f1', 'g1'), 'f1'),
+    'Q': ('e1', 'c1', 'a1', ('b1', 'c1', 'd1'), 'd1'),
+    'k': ('e8', 'g8', 'h8', ('f8', 'g8'), 'f8'),
+    'q': ('e8', 'c8', 'a8', ('b8', 'c8', 'd8'), 'd8'),
+}
+
 # Starting Position Notation
 START_POSITION_NOTATION = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
 
 # Branching Limit
 BRANCHING_LIMIT = 1000
 
+# Number of parsed fen notations kept in memory
+FEN_CACHE_SIZE = 512
+
+# States keep a full fen only every this many plies, the others are replayed from it
+STATE_KEYFRAME_INTERVAL = 16
+
+# Stories sent to the database in a single insert while importing pgn files
+PGN_IMPORT_BATCH_SIZE = 500
+
+# Stockfish processes kept running for engine evaluations, and the threads and hash
+# table size (in MB) each of them is given. Requests wait up to ENGINE_QUEUE_TIMEOUT
+# seconds for a free engine, an engine taking ENGINE_TIMEOUT seconds longer than a
+# search should is restarted.
+ENGINE_POOL_SIZE = int(os.environ.get('ENGINE_POOL_SIZE', 2))
+ENGINE_THREADS = int(os.environ.get('ENGINE_THREADS', 1))
+ENGINE_HASH = int(os.environ.get('ENGINE_HASH', 16))
+ENGINE_QUEUE_TIMEOUT = 30
+ENGINE_TIMEOUT = 10
+
+# Most lines an engine search may be asked to show
+ENGINE_MAX_LINES = 5
+
+# Engine evaluations kept in memory by every process, and seconds they're kept in
+# the database for
+EVAL_CACHE_SIZE = 4096
+EVAL_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Celery queue of engine analysis jobs, the longest an analysis without a limit may
+# run for and seconds between checks of whether a job was asked to stop
+ANALYSIS_QUEUE = 'analysis'
+ANALYSIS_MAX_SECONDS = 300
+ANALYSIS_POLL_INTERVAL = 0.25
+
 class Worker:
     worker = None
\ No newline at end of file
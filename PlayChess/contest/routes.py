@@ -96,7 +96,8 @@ def fetch_puzzle(contest_code):
             board = USER_DICT['current_user_'+str(session['username'])].puzzle.board.draw_chessboard_for_white()
         else:
             board = USER_DICT['current_user_'+str(session['username'])].puzzle.board.draw_chessboard_for_black()
-        return jsonify({'success': True, 'board': board})
+        legal_moves = USER_DICT['current_user_'+str(session['username'])].puzzle.generate_all_legal_moves()
+        return jsonify({'success': True, 'board': board, 'legal_moves': legal_moves})
     puzzle_index = request.args.get('index', 0)
     puzzle = cntst.get_puzzle(db, int(puzzle_index), USER_DICT['current_user_'+str(session['username'])])
     if puzzle is None:
@@ -107,7 +108,8 @@ def fetch_puzzle(contest_code):
         board = USER_DICT['current_user_'+str(session['username'])].puzzle.board.draw_chessboard_for_white()
     else:
         board = USER_DICT['current_user_'+str(session['username'])].puzzle.board.draw_chessboard_for_black()
-    return jsonify({'success': True, 'board': board})
+    legal_moves = USER_DICT['current_user_'+str(session['username'])].puzzle.generate_all_legal_moves()
+    return jsonify({'success': True, 'board': board, 'legal_moves': legal_moves})
 
 @mod.route('/<contest_code>/makemove/<move>')
 def make_move(contest_code, move):
@@ -130,20 +132,21 @@ def make_move(contest_code, move):
     success = move_info['success']
     puzzleOver = move_info['puzzleOver']
     changes = move_info['changes']
+    legal_moves = move_info['legal_moves']
 
     if puzzleOver and success:
         score = puzzle.get_score()
         cntst.submit_ans(db, index, USER_DICT['current_user_'+str(session['username'])], score)
         USER_DICT['current_user_'+str(session['username'])].puzzle = None
-        return jsonify({'move': True, 'success': True, 'puzzleOver': True, 'changes': changes})
+        return jsonify({'move': True, 'success': True, 'puzzleOver': True, 'changes': changes, 'legal_moves': legal_moves})
     
     if success:
-        return jsonify({'move': True, 'success': True, 'puzzleOver': False, 'changes': changes})
+        return jsonify({'move': True, 'success': True, 'puzzleOver': False, 'changes': changes, 'legal_moves': legal_moves})
         
     score = puzzle.get_score()
     cntst.submit_ans(db, index, USER_DICT['current_user_'+str(session['username'])], score)
     USER_DICT['current_user_'+str(session['username'])].puzzle = None
-    return jsonify({'move': True, 'success': False, 'puzzleOver': True, 'changes': changes})
+    return jsonify({'move': True, 'success': False, 'puzzleOver': True, 'changes': changes, 'legal_moves': legal_moves})
 
 
 @mod.route('/<contest_code>/generateLegalMoves/<init_pos>')
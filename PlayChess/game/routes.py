@@ -34,6 +34,13 @@ def generate_legal_moves(game_url, init_pos):
         return GAMES[game_url].generate_legal_moves(init_pos, session.get('username'))
     abort(404)
 
+@mod.route('/<game_url>/getLegalMoves')
+@decorators.login_required
+def get_legal_moves(game_url):
+    if GAMES.get(game_url):
+        return GAMES[game_url].generate_all_legal_moves(session.get('username'))
+    abort(404)
+
 @mod.route('/<game_url>/makemove/<move>')
 @decorators.login_required
 def make_move(game_url, move):
@@ -89,6 +96,8 @@ def realtime_make_move(move_info):
     reciever = player1 if player1!=session['username'] else player2
     if GAMES.get(game_url):
         move = GAMES[game_url].prev_move
+        if move['success']:
+            move = dict(move, legal_moves=GAMES[game_url].legal_moves_for(reciever))
     else:
         move = {'success': False}
     emit("make_move", move, room = USER_DICT['current_user_' + reciever].sessionid)
\ No newline at end of file
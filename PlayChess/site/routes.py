@@ -15,9 +15,10 @@ from ..utils import story
 from ..utils import exceptions
 from ..utils import decorators
 from ..utils import game
+from ..utils import packed
 
 # Import global variables and settings
-from ..config import PLAYERS_QUEUE, USER_DICT, FEN_NOTATION_REGEX ,USERNAME_REGEX, EMAIL_PATTERN_COMPILED, GAMES, TERMINAL_COLORS
+from ..config import PLAYERS_QUEUE, USER_DICT, USERNAME_REGEX, EMAIL_PATTERN_COMPILED, GAMES, TERMINAL_COLORS
 
 # Database initialisation
 from .. import database
@@ -154,26 +155,30 @@ def index():
 @decorators.login_required
 def flipBoard(configuration):
     flipped_board = USER_DICT['current_user_' + str(session['username'])].chessboard.draw_chessboard(configuration)
-    return jsonify({"board": flipped_board})
+    legal_moves = USER_DICT['current_user_' + str(session['username'])].chessboard.generate_all_legal_moves()
+    return jsonify({"board": flipped_board, "legal_moves": legal_moves})
 
 @mod.route('/board/reset')
 @decorators.login_required
 def resetBoard():
     fen_notation = request.args.get('fen', None)
-    if fen_notation == 'default':
+    packed_position = request.args.get('packed', None)
+    if packed_position is not None:
+        try:
+            USER_DICT['current_user_' + str(session['username'])].chessboard.load_packed(packed.from_text(packed_position))
+        except (exceptions.InvalidPackedPosition, ValueError):
+            USER_DICT['current_user_' + str(session['username'])].chessboard.reset_chessboard(hard=True)
+    elif fen_notation == 'default':
         USER_DICT['current_user_' + str(session['username'])].chessboard.reset_chessboard(hard=True)
     else:
-        valid_fen = bool(regex.match(FEN_NOTATION_REGEX, fen_notation))
-        if not valid_fen:
+        try:
+            USER_DICT['current_user_' + str(session['username'])].chessboard.reset_chessboard(fen_notation=fen_notation, hard=True)
+        except exceptions.InvalidFenNotation:
             USER_DICT['current_user_' + str(session['username'])].chessboard.reset_chessboard(hard=True)
-        else:
-            try:
-                USER_DICT['current_user_' + str(session['username'])].chessboard.reset_chessboard(fen_notation=fen_notation, hard=True)
-            except exceptions.InvalidFenNotation:
-                USER_DICT['current_user_' + str(session['username'])].chessboard.reset_chessboard(hard=True)
     configuration = request.args.get('configuration', 1)
     reset_board = USER_DICT['current_user_' + str(session['username'])].chessboard.draw_chessboard(configuration)
-    return jsonify({"board": reset_board})
+    legal_moves = USER_DICT['current_user_' + str(session['username'])].chessboard.generate_all_legal_moves()
+    return jsonify({"board": reset_board, "legal_moves": legal_moves})
 
 @mod.route('/board/generateLegalMoves/<init_pos>')
 @decorators.login_required
@@ -184,9 +189,18 @@ def generateLegalMoves(init_pos):
         return jsonify({'moves': []})
     return jsonify({'moves': moves})
 
+@mod.route('/board/getLegalMoves')
+@decorators.login_required
+def getLegalMoves():
+    legal_moves = USER_DICT['current_user_' + str(session['username'])].chessboard.generate_all_legal_moves()
+    return jsonify({'legal_moves': legal_moves})
+
 @mod.route('/board/generateFenNotation')
 @decorators.login_required
 def generateFenNotation():
+    if request.args.get('format') == 'packed':
+        position = USER_DICT['current_user_' + str(session['username'])].chessboard.packed_position
+        return jsonify({'packed': packed.to_text(position)})
     notation = USER_DICT['current_user_' + str(session['username'])].chessboard.fen_notation
     return jsonify({'notation': notation})
 
@@ -220,6 +234,7 @@ def make_move(move):
     return jsonify({
         'success': True,
         'changes': changes,
+        'legal_moves': USER_DICT['current_user_' + str(session['username'])].chessboard.generate_all_legal_moves(),
     })
 
 @mod.route('/board/getGameStatus')
@@ -251,21 +266,21 @@ def check_parent():
 @mod.route('/board/getNextState/<branchId>/<configuration>')
 @decorators.login_required
 def get_next_state(branchId, configuration):
-    success = USER_DICT['current_user_' + str(session['username'])].chessboard.get_next_state(int(branchId))
-    if success:
-        new_board = USER_DICT['current_user_' + str(session['username'])].chessboard.draw_chessboard(configuration)
+    changes = USER_DICT['current_user_' + str(session['username'])].chessboard.get_next_state(int(branchId))
+    if changes is not None:
         state = USER_DICT['current_user_' + str(session['username'])].chessboard.get_state()
-        return jsonify({"success": True, "board": new_board, "state": state})
+        legal_moves = USER_DICT['current_user_' + str(session['username'])].chessboard.generate_all_legal_moves()
+        return jsonify({"success": True, "changes": changes, "state": state, "legal_moves": legal_moves})
     return jsonify({"success": False})
 
 @mod.route('/board/getPrevState/<configuration>')
 @decorators.login_required
 def get_prev_state(configuration):
-    success = USER_DICT['current_user_' + str(session['username'])].chessboard.get_prev_state()
-    if success:
-        new_board = USER_DICT['current_user_' + str(session['username'])].chessboard.draw_chessboard(configuration)
+    changes = USER_DICT['current_user_' + str(session['username'])].chessboard.get_prev_state()
+    if changes is not None:
         state = USER_DICT['current_user_' + str(session['username'])].chessboard.get_state()
-        return jsonify({"success": True, "board": new_board, "state": state})
+        legal_moves = USER_DICT['current_user_' + str(session['username'])].chessboard.generate_all_legal_moves()
+        return jsonify({"success": True, "changes": changes, "state": state, "legal_moves": legal_moves})
     return jsonify({"success": False})
 
 @mod.route('/board/getCurrentState')
@@ -283,15 +298,17 @@ def get_branch_state():
 @mod.route('/board/save')
 @decorators.login_required
 def save_story():
-    story.addStory(db, session['username'], USER_DICT['current_user_' + str(session['username'])].chessboard)
-    return jsonify({'success': True})
+    story_id = story.saveStory(db, session['username'], USER_DICT['current_user_' + str(session['username'])].chessboard)
+    return jsonify({'success': True, 'story': str(story_id)})
 
 @mod.route('/board/load')
 @decorators.login_required
 def load_story():
     story_id = users.find_one({'username': session['username']})['story'][0]
-    stry = story.loadStory(db, story_id)
-    print(stry)
+    USER_DICT['current_user_' + str(session['username'])].chessboard.load_story(
+        story.loadStory(db, story_id),
+        story.branchLoader(db, story_id),
+    )
     return jsonify({'success': True})
 
 # Handle game loading here
@@ -9,9 +9,17 @@
     let strength = 1;
     let isFirstMove = true;
     let activeMoveCell = null;
+    let legalMoves = {};
+    // Socket of the engine analysis, the sid it got and the job analysing the board
+    let analysisSocket = null;
+    let analysisSid = null;
+    let analysisJob = null;
+    let analysisRequest = 0;
 
     $(document).ready(function(){
 
+        loadLegalMoves();
+
         $(window).on('reload load onload', function(){
             $(".main").hide();
             $(".main-page-loader").show();
@@ -81,6 +89,7 @@
             })
             .done(function(data) {
                 $("tbody").replaceWith("<tbody>"+data.board+"</tbody>");
+                legalMoves = data['legal_moves'];
                 if (engineEval) {
                     setEngineEvaluation();
                 }
@@ -108,6 +117,7 @@
                 $(".board-eval").addClass('btn-danger');
                 $(".board-eval").removeClass('btn-dark');
             } else {
+                stopEngineEvaluation();
                 cleanEngineEval();
                 $(".board-eval").addClass('btn-dark');
                 $(".board-eval").removeClass('btn-danger');
@@ -141,14 +151,8 @@
                 } 
                 else {
                     $("#"+initial_pos).addClass("active-cell");
-                    const url = "board/generateLegalMoves/" + initial_pos;
-                    $.ajax({
-                        url: url,
-                    })
-                    .done( (data)=> {
-                        squares = data['moves'];
-                        highlightSquares(squares);
-                    });
+                    squares = legalMoves[initial_pos] || [];
+                    highlightSquares(squares);
                 }
             }
             else {
@@ -172,6 +176,7 @@
                             saveCheckSquare();
                         }
                         make_move(data['changes']);
+                        legalMoves = data['legal_moves'];
                         addMoveToStoryBoard();
                         
                         if (engineEval) {
@@ -205,6 +210,17 @@
 
     });
 
+    // Legal moves of the side to move, every move response carries the next map
+    function loadLegalMoves() {
+        $.ajax({
+            type: "GET",
+            url: "board/getLegalMoves",
+        })
+        .done(function(data){
+            legalMoves = data.legal_moves;
+        });
+    }
+
     function flipBoard() {
         $.ajax({
             type: "GET",
@@ -212,6 +228,7 @@
         })
         .done(function(data){
             $("tbody").replaceWith("<tbody>"+data.board+"</tbody>");
+            legalMoves = data.legal_moves;
             if (!configuration) {
                 $(".board-flip").removeClass("btn-dark");
                 $(".board-flip").addClass("btn-info");
@@ -330,7 +347,13 @@
             if (data.success) {
                 removeMoveCellHighlight();
                 highlightMoveCell(makeId(data.state.branch, data.state.state));
-                $("tbody").replaceWith("<tbody>"+data.board+"</tbody>");
+                if (checkSquare!==null) {
+                    $(checkSquare).removeClass("check");
+                    checkSquare = null;
+                    saveCheckSquare();
+                }
+                make_move(data.changes);
+                legalMoves = data.legal_moves;
                 if (engineEval) {
                     setEngineEvaluation();
                 }
@@ -349,7 +372,13 @@
             if (data.success) {
                 removeMoveCellHighlight();
                 highlightMoveCell(makeId(data.state.branch, data.state.state));
-                $("tbody").replaceWith("<tbody>"+data.board+"</tbody>");
+                if (checkSquare!==null) {
+                    $(checkSquare).removeClass("check");
+                    checkSquare = null;
+                    saveCheckSquare();
+                }
+                make_move(data.changes);
+                legalMoves = data.legal_moves;
                 if (engineEval) {
                     setEngineEvaluation();
                 }
@@ -385,54 +414,121 @@
         $("#black-eval").css("width", `50.5%`);
     }
 
+    function connectAnalysis() {
+        analysisSocket = io.connect(`${window.location.origin}/analysis`);
+        analysisSocket.on('analysis_connect', function(sid) {
+            analysisSid = sid;
+            if (engineEval) {
+                setEngineEvaluation();
+            }
+        });
+        // Lines arrive as the engine deepens its search, the best one is shown
+        analysisSocket.on('analysis_info', function(data) {
+            if (data.job===analysisJob && data.multipv==1) {
+                showEngineEvaluation(data.evaluation);
+            }
+        });
+        analysisSocket.on('analysis_done', function(data) {
+            if (data.job===analysisJob) {
+                analysisJob = null;
+                if (data.evaluation) {
+                    showEngineEvaluation(data.evaluation);
+                }
+            }
+        });
+        analysisSocket.on('analysis_error', function(data) {
+            if (data.job===analysisJob) {
+                analysisJob = null;
+                console.log(data);
+            }
+        });
+        analysisSocket.on('disconnect', function() {
+            analysisSid = null;
+            analysisJob = null;
+        });
+    }
+
+    // The job of a position that was left is of no use anymore
+    function stopEngineEvaluation() {
+        analysisRequest += 1;
+        if (analysisJob!==null) {
+            analysisSocket.emit('stop_analysis', analysisJob);
+            analysisJob = null;
+        }
+    }
+
     function setEngineEvaluation() {
+        stopEngineEvaluation();
+        if (analysisSocket===null) {
+            // Evaluation starts once the socket got its sid
+            connectAnalysis();
+            return;
+        }
+        if (analysisSid===null) {
+            return;
+        }
+        const request = analysisRequest;
         $.ajax({
             type: "GET",
             url: "board/generateFenNotation",
         })
         .done(function(data){
+            if (request!==analysisRequest) {
+                return;
+            }
             $.ajax({
                 type: "GET",
-                url: "api/stockfish",
+                url: "api/analysis",
                 data: {
                     token: "hello",
                     fen_notation: data.notation,
+                    sid: analysisSid,
                     strength: strength,
                 }
             })
             .done(function(data){
-                // Flush old eval
-                cleanEngineEval();
-
-                // Get new eval
-                const maxThreshold = 800;
-                let evaluation = parseEval(data.evaluation);
-                console.log(data);
-                let sign = evaluation > 0 ? 1: -1;
-                evaluation = Math.min(Math.abs(evaluation), maxThreshold);
-                const relativeEval = (evaluation/maxThreshold);
-                let width = 50 * (1 + relativeEval);
-                width = Math.ceil(width);
-                if (evaluation===0) {
-                    $("#white-eval").css("width", `50.5%`);
-                    $("#black-eval").css("width", `50.5%`);
-                    $("#white-eval").text(`0`);
-                    $("#black-eval").text(`0`);
-                } else if (sign > 0) {
-                    // increase width by relativeEval in favor of white
-                    $("#white-eval").css("width", `${width+1}%`);
-                    $("#black-eval").css("width", `${101-width}%`);
-                    $("#white-eval").text(`${addDecimal(data.evaluation)}`);
+                if (!data.job) {
+                    console.log(data);
+                } else if (request!==analysisRequest) {
+                    // The board moved on while the job was being started
+                    analysisSocket.emit('stop_analysis', data.job);
                 } else {
-                    // increase width by relativeEval in favor of black
-                    $("#white-eval").css("width", `${101-width}%`);
-                    $("#black-eval").css("width", `${width+1}%`);
-                    $("#black-eval").text(`${addDecimal(data.evaluation)}`);
+                    analysisJob = data.job;
                 }
             });
         });
     }
 
+    function showEngineEvaluation(engineEvaluation) {
+        // Flush old eval
+        cleanEngineEval();
+
+        // Get new eval
+        const maxThreshold = 800;
+        let evaluation = parseEval(engineEvaluation);
+        let sign = evaluation > 0 ? 1: -1;
+        evaluation = Math.min(Math.abs(evaluation), maxThreshold);
+        const relativeEval = (evaluation/maxThreshold);
+        let width = 50 * (1 + relativeEval);
+        width = Math.ceil(width);
+        if (evaluation===0) {
+            $("#white-eval").css("width", `50.5%`);
+            $("#black-eval").css("width", `50.5%`);
+            $("#white-eval").text(`0`);
+            $("#black-eval").text(`0`);
+        } else if (sign > 0) {
+            // increase width by relativeEval in favor of white
+            $("#white-eval").css("width", `${width+1}%`);
+            $("#black-eval").css("width", `${101-width}%`);
+            $("#white-eval").text(`${addDecimal(engineEvaluation)}`);
+        } else {
+            // increase width by relativeEval in favor of black
+            $("#white-eval").css("width", `${101-width}%`);
+            $("#black-eval").css("width", `${width+1}%`);
+            $("#black-eval").text(`${addDecimal(engineEvaluation)}`);
+        }
+    }
+
     function engageStoryMode() {
         let width = window.innerWidth;
         if (width <= 531) {
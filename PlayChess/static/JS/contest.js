@@ -5,6 +5,7 @@
     let isFirstMove = true;
     let activeMoveCell = null;
     let index = 0;
+    let legalMoves = {};
 
     var endTime;
     var clock;
@@ -33,14 +34,8 @@
                 } 
                 else {
                     $("#"+initial_pos).addClass("active-cell");
-                    const url = "generateLegalMoves/" + initial_pos;
-                    $.ajax({
-                        url: url,
-                    })
-                    .done( (data)=> {
-                        squares = data['moves'];
-                        highlightSquares(squares);
-                    });
+                    squares = legalMoves[initial_pos] || [];
+                    highlightSquares(squares);
                 }
             }
             else {
@@ -77,6 +72,7 @@
                     else {
                         console.log("Correct Move! Keep on going");
                         make_move(data['changes']);
+                        legalMoves = data['legal_moves'];
                         createAlert("Keep on Going!", 4);
                     }
                     removeHighlight(squares);
@@ -109,6 +105,7 @@
             }
             if (data.success) {
                 $("tbody").replaceWith("<tbody>"+data.board+"</tbody>");
+                legalMoves = data.legal_moves;
             }
         });
     }
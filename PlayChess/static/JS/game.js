@@ -11,8 +11,18 @@
         const game_socket = io.connect(window_url.slice(0, game_index));
         let initial_pos, final_pos;
         let squares = null;
+        let legal_moves = {};
         const game_url = window.location.pathname.split('/')[2];
 
+        // Legal moves of this player, empty while the opponent is on move. Every move
+        // event carries the next map
+        $.ajax({
+            url: `${game_url}/getLegalMoves`,
+        })
+        .done( (data) => {
+            legal_moves = data['legal_moves'];
+        });
+
         game_socket.on('connect', () => {
             game_socket.emit('user_connect', "User has connected!");
         });
@@ -20,6 +30,7 @@
         game_socket.on('make_move', move => {
             if (move["success"]) {
                 make_move(move['changes'], game_url);
+                legal_moves = move['legal_moves'] || {};
             }
             else {
                 console.log("Invalid Move!");
@@ -40,14 +51,8 @@
                 } 
                 else {
                     $("#"+initial_pos).addClass("active-cell");
-                    const url = `${game_url}/generateLegalMoves/${initial_pos}`;
-                    $.ajax({
-                        url: url,
-                    })
-                    .done( (data)=> {
-                        squares = data['moves'];
-                        highlightSquares(squares);
-                    });
+                    squares = legal_moves[initial_pos] || [];
+                    highlightSquares(squares);
                 }
             }
             else {
@@ -65,6 +70,7 @@
                 .done( (data) => {
                     if (data["success"]) {
                         make_move(data['changes'], game_url);
+                        legal_moves = data['legal_moves'] || {};
                     }
                     else {
                         console.log("Invalid Move!");
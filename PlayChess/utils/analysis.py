@@ -0,0 +1,109 @@
+# Engine analysis jobs, run by celery workers on the analysis queue.
+#
+# A job analyses a position with an engine of the worker's pool and hands every
+# line the engine finishes (depth, evaluation and principal variation) to an emit
+# callback as it arrives, which sends it to the client over socketio. Jobs without
+# a limit analyse until they're asked to stop, at most ANALYSIS_MAX_SECONDS. A
+# stop is asked for by setting a key in redis, which the web server does when the
+# client asks for it or goes away, and which a watcher thread of the job checks.
+# The jobs of every client are kept in a redis set too, so that any web server
+# process can tell which jobs a client may stop. Jobs leave the set once they end.
+
+import os
+import threading
+import time
+
+import chess
+import chess.engine
+
+from . import engine_pool
+from .. import config
+
+STOP_KEY = "analysis:stop:{}"
+JOBS_KEY = "analysis:jobs:{}"
+
+_redis = None
+
+def _connection():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(os.environ.get('REDIS_URL'))
+    return _redis
+
+def request_stop(job_id):
+    _connection().set(STOP_KEY.format(job_id), 1, ex=config.ANALYSIS_MAX_SECONDS)
+
+def stop_requested(job_id):
+    return bool(_connection().exists(STOP_KEY.format(job_id)))
+
+# Jobs of the socketio client with the given sid
+def add_job(sid, job_id):
+    key = JOBS_KEY.format(sid)
+    pipeline = _connection().pipeline()
+    pipeline.sadd(key, job_id)
+    pipeline.expire(key, config.ANALYSIS_MAX_SECONDS)
+    pipeline.execute()
+
+def has_job(sid, job_id):
+    return bool(_connection().sismember(JOBS_KEY.format(sid), job_id))
+
+def remove_job(sid, job_id):
+    _connection().srem(JOBS_KEY.format(sid), job_id)
+
+# Forgets the jobs of a client and returns them
+def pop_jobs(sid):
+    key = JOBS_KEY.format(sid)
+    pipeline = _connection().pipeline()
+    pipeline.smembers(key)
+    pipeline.delete(key)
+    job_ids, _ = pipeline.execute()
+    return [job_id.decode() for job_id in job_ids]
+
+# Limit of an analysis, None to analyse until stopped
+def analysis_limit(time=None, depth=None):
+    if time is None and depth is None:
+        return None
+    return chess.engine.Limit(time=time, depth=depth)
+
+# Analyses a position and returns the result of the search, see engine_pool.search_result.
+# Lines are emitted as "analysis_info" while the engine searches and the result as
+# "analysis_done" at the end, both tagged with the job id. Limited analyses are
+# answered from the evaluation cache when it can, and stored in it otherwise.
+def run_analysis(pool, fen_notation, limit, lines, emit, stopped, job_id, cache=None):
+    board = chess.Board(fen_notation)
+    if cache is not None and limit is not None:
+        result = cache.get(board, limit, lines)
+        if result is not None:
+            emit("analysis_done", dict(result, job=job_id))
+            return result
+
+    with pool.engine() as engine:
+        analysis = engine.analysis(board, limit, multipv=lines)
+        done = threading.Event()
+        deadline = time.monotonic() + config.ANALYSIS_MAX_SECONDS
+
+        # Stops are checked apart from the engine output, which may be silent for long
+        def watch():
+            while not done.wait(config.ANALYSIS_POLL_INTERVAL):
+                if stopped() or time.monotonic() > deadline:
+                    analysis.stop()
+                    return
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+        try:
+            with analysis:
+                for info in analysis:
+                    # Lines are complete once they have a score and a variation
+                    if "score" in info and "pv" in info:
+                        line = engine_pool.line_result(info)
+                        emit("analysis_info", dict(line, multipv=info.get("multipv", 1), job=job_id))
+            result = engine_pool.search_result(analysis.multipv)
+        finally:
+            done.set()
+
+    if cache is not None and limit is not None:
+        cache.put(board, limit, lines, result)
+    emit("analysis_done", dict(result, job=job_id))
+    return result
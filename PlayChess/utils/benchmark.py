@@ -0,0 +1,113 @@
+import gc
+import json
+import random
+import time
+import tracemalloc
+
+from .chessboard import Chessboard
+from . import fen
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+
+# Average bytes allocated by a freshly loaded Chessboard, including its state manager
+# and bitboards. Module level tables shared by every board are left out by making
+# one board before measuring.
+def bytes_per_board(count=100):
+    Chessboard()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        boards = [Chessboard() for _ in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del boards
+    return (after - before) // count
+
+# Chessboard after a game of random legal moves, the same game on every call
+def play_random_game(plies=100, seed=0):
+    rng = random.Random(seed)
+    chessboard = Chessboard()
+    for _ in range(plies):
+        legal_moves = chessboard.generate_all_legal_moves()
+        if not legal_moves or chessboard.is_draw()[0]:
+            break
+        initial_pos = rng.choice(sorted(legal_moves))
+        final_pos = rng.choice(legal_moves[initial_pos])
+        promotion = None
+        if chessboard.convert_to_index(initial_pos).piece.name == "Pawn" and final_pos[1] in "18":
+            promotion = "Q"
+        chessboard.make_move(initial_pos, final_pos, promotion)
+    return chessboard
+
+# Average bytes kept by the state manager for every move of a game
+def bytes_per_state(plies=100):
+    play_random_game(plies)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        chessboard = play_random_game(plies)
+        gc.collect()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    del chessboard
+    return (after - before) // plies
+
+# Bytes of the json a game is stored as
+def story_size(plies=100):
+    return len(json.dumps(play_random_game(plies).get_states_as_json()))
+
+# Average microseconds taken by a call of func over a number of runs
+def time_call(func, runs=1000):
+    start = time.perf_counter()
+    for _ in range(runs):
+        func()
+    return round((time.perf_counter() - start) / runs * 1e6, 2)
+
+# Every benchmark as (description, value, unit)
+def run_benchmarks():
+    chessboard = Chessboard()
+
+    def load_uncached():
+        fen.clear_cache()
+        Chessboard(KIWIPETE)
+
+    return [
+        ("Memory of a chessboard", bytes_per_board(), "bytes"),
+        ("Rendering a chessboard", time_call(chessboard.draw_chessboard), "us"),
+        ("Loading a fen", time_call(load_uncached), "us"),
+        ("Loading a cached fen", time_call(lambda: Chessboard(KIWIPETE)), "us"),
+        ("Writing a fen", time_call(lambda: chessboard.fen_notation), "us"),
+        ("Memory of a state", bytes_per_state(), "bytes"),
+        ("Size of a stored 100 ply story", story_size(), "bytes"),
+    ]
+
+# Requests per second an engine serves, answering each with the best move and the
+# evaluation either from a single search or from a play followed by an analyse,
+# the way /api/stockfish/ used to
+def engine_requests_per_second(pool, combined=True, runs=20, limit=None):
+    import chess, chess.engine
+
+    limit = limit or chess.engine.Limit(time=0.05, depth=20)
+    boards = [chess.Board(), chess.Board(KIWIPETE)]
+    with pool.engine() as engine:
+        start = time.perf_counter()
+        for run in range(runs):
+            board = boards[run % len(boards)]
+            if combined:
+                engine.search(board, limit)
+            else:
+                engine.play(board, limit)
+                engine.analyse(board, limit)
+        seconds = time.perf_counter() - start
+    return round(runs / seconds, 2)
+
+# Engine benchmarks as (description, value, unit)
+def run_engine_benchmarks(pool, runs=20):
+    return [
+        ("Play and analyse", engine_requests_per_second(pool, False, runs), "requests/sec"),
+        ("Single search", engine_requests_per_second(pool, True, runs), "requests/sec"),
+    ]
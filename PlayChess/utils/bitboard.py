@@ -0,0 +1,781 @@
+# Bitboard primitives used by the Chessboard rule engine.
+#
+# Squares are numbered from 0 (a1) to 63 (h8), file first, so bit n of a
+# bitboard stands for square n. Every position is described by twelve such
+# integers (one per color and piece type) plus an occupancy mask per color.
+
+import random
+
+WHITE = 0
+BLACK = 1
+
+PAWN = 0
+KNIGHT = 1
+BISHOP = 2
+ROOK = 3
+QUEEN = 4
+KING = 5
+
+# Shared (color, piece_type) pairs stored in the mailbox
+PIECES = tuple(tuple((color, piece_type) for piece_type in range(6)) for color in (WHITE, BLACK))
+
+# Mapping between Chessboard names and bitboard indexes
+COLORS = {"white": WHITE, "black": BLACK}
+COLOR_NAMES = ("white", "black")
+PIECE_TYPES = {
+    "Pawn": PAWN,
+    "Knight": KNIGHT,
+    "Bishop": BISHOP,
+    "Rook": ROOK,
+    "Queen": QUEEN,
+    "King": KING,
+}
+PIECE_NAMES = ("Pawn", "Knight", "Bishop", "Rook", "Queen", "King")
+
+SQUARE_NAMES = [file + rank for rank in "12345678" for file in "abcdefgh"]
+SQUARES = {name: index for index, name in enumerate(SQUARE_NAMES)}
+
+BB_ALL = (1 << 64) - 1
+BB_SQUARES = [1 << square for square in range(64)]
+BB_RANK_1 = 0xFF
+BB_RANK_2 = 0xFF << 8
+BB_RANK_7 = 0xFF << 48
+BB_RANK_8 = 0xFF << 56
+BB_BACKRANKS = BB_RANK_1 | BB_RANK_8
+BB_LIGHT_SQUARES = 0x55AA55AA55AA55AA
+BB_DARK_SQUARES = 0xAA55AA55AA55AA55
+
+# Castling rights are kept as a 4 bit mask
+CASTLING_FLAGS = {"K": 1, "Q": 2, "k": 4, "q": 8}
+
+# Castling right -> (king square, king destination, rook square, rook destination, squares b/w king and rook)
+CASTLING_MOVES = {
+    1: (4, 6, 7, 5, BB_SQUARES[5] | BB_SQUARES[6]),
+    2: (4, 2, 0, 3, BB_SQUARES[1] | BB_SQUARES[2] | BB_SQUARES[3]),
+    4: (60, 62, 63, 61, BB_SQUARES[61] | BB_SQUARES[62]),
+    8: (60, 58, 56, 59, BB_SQUARES[57] | BB_SQUARES[58] | BB_SQUARES[59]),
+}
+# King destination -> (rook square, rook destination)
+CASTLING_ROOK_MOVES = {king_to: (rook, rook_to) for _, king_to, rook, rook_to, _ in CASTLING_MOVES.values()}
+
+# Rights that survive a move touching a square, moving a king or a rook
+# or capturing on a rook's corner clears them
+CASTLING_MASKS = [15]*64
+CASTLING_MASKS[4] = 15 ^ 3
+CASTLING_MASKS[7] = 15 ^ 1
+CASTLING_MASKS[0] = 15 ^ 2
+CASTLING_MASKS[60] = 15 ^ 12
+CASTLING_MASKS[63] = 15 ^ 4
+CASTLING_MASKS[56] = 15 ^ 8
+
+# Zobrist keys, drawn from a fixed seed so that a position hashes the same in every
+# process. They are 63 bits wide to fit in a signed 64 bit integer field of mongodb. The key of a position is the xor of its pieces, its castling rights,
+# the file of its enpassant square and the side to move if it's black.
+_zobrist_random = random.Random(0x5EED)
+ZOBRIST_PIECES = [[[_zobrist_random.getrandbits(63) for _ in range(64)] for _ in range(6)] for _ in (WHITE, BLACK)]
+_zobrist_flags = [_zobrist_random.getrandbits(63) for _ in CASTLING_FLAGS]
+ZOBRIST_CASTLING = [0]*16
+for _mask in range(16):
+    for _index, _value in enumerate(_zobrist_flags):
+        if _mask & (1 << _index):
+            ZOBRIST_CASTLING[_mask] ^= _value
+ZOBRIST_EP_FILES = [_zobrist_random.getrandbits(63) for _ in range(8)]
+ZOBRIST_TURN = _zobrist_random.getrandbits(63)
+
+def zobrist_state(turn, castling, ep_square):
+    key = ZOBRIST_CASTLING[castling]
+    if ep_square is not None:
+        key ^= ZOBRIST_EP_FILES[ep_square & 7]
+    if turn == BLACK:
+        key ^= ZOBRIST_TURN
+    return key
+
+def castling_mask(castling_rights):
+    mask = 0
+    for right in castling_rights:
+        mask |= CASTLING_FLAGS.get(right, 0)
+    return mask
+
+# Moves are encoded as small integers: from square in bits 0-5, to square in
+# bits 6-11 and the promotion piece type (0 if none) in bits 12-14
+def encode_move(from_square, to_square, promotion=0):
+    return from_square | (to_square << 6) | (promotion << 12)
+
+def move_from_square(move):
+    return move & 63
+
+def move_to_square(move):
+    return (move >> 6) & 63
+
+def move_promotion(move):
+    return move >> 12
+
+# Moves written the way routes take them, eg-> "e2-e4" or "e7-e8-Q" for promotions
+PROMOTION_LETTERS = {KNIGHT: "N", BISHOP: "B", ROOK: "R", QUEEN: "Q"}
+PROMOTION_TYPES = {letter: piece_type for piece_type, letter in PROMOTION_LETTERS.items()}
+
+def move_notation(move):
+    notation = SQUARE_NAMES[move & 63] + "-" + SQUARE_NAMES[(move >> 6) & 63]
+    if move >> 12:
+        notation += "-" + PROMOTION_LETTERS[move >> 12]
+    return notation
+
+def parse_move_notation(notation):
+    squares = notation.split("-")
+    promotion = PROMOTION_TYPES[squares[2]] if len(squares) == 3 else 0
+    return encode_move(SQUARES[squares[0]], SQUARES[squares[1]], promotion)
+
+# What a move destroys packed in an int, small enough to be kept for every move of
+# a game: captured piece type (NO_CAPTURE if none) in bits 0-2, castling rights in
+# bits 3-6, enpassant square (64 if none) in bits 7-13 and the half move clock above
+NO_CAPTURE = 7
+
+def pack_undo(captured_type, castling, ep_square, halfmove_clock):
+    return captured_type | (castling << 3) | ((64 if ep_square is None else ep_square) << 7) | (halfmove_clock << 14)
+
+def unpack_undo(undo):
+    ep_square = (undo >> 7) & 127
+    return undo & 7, (undo >> 3) & 15, None if ep_square == 64 else ep_square, undo >> 14
+
+def square_rank(square):
+    return square >> 3
+
+def square_file(square):
+    return square & 7
+
+# Yields the index of every set bit, lowest first
+def scan_forward(bb):
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+def _step_attacks(deltas):
+    table = []
+    for square in range(64):
+        rank, file = divmod(square, 8)
+        attacks = 0
+        for rank_delta, file_delta in deltas:
+            r, f = rank + rank_delta, file + file_delta
+            if 0 <= r <= 7 and 0 <= f <= 7:
+                attacks |= 1 << (r*8 + f)
+        table.append(attacks)
+    return table
+
+KNIGHT_ATTACKS = _step_attacks([(2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (1, -2), (-1, 2), (-1, -2)])
+KING_ATTACKS = _step_attacks([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)])
+# Squares attacked by a pawn of the given color standing on a square
+PAWN_ATTACKS = [
+    _step_attacks([(1, 1), (1, -1)]),
+    _step_attacks([(-1, 1), (-1, -1)]),
+]
+
+# Rays run from a square (exclusive) up to the edge of the board. The first four
+# directions walk towards higher square indexes, the last four towards lower ones.
+NORTH, EAST, NORTH_EAST, NORTH_WEST, SOUTH, WEST, SOUTH_WEST, SOUTH_EAST = range(8)
+DIRECTIONS = [(1, 0), (0, 1), (1, 1), (1, -1), (-1, 0), (0, -1), (-1, -1), (-1, 1)]
+
+def _rays(rank_delta, file_delta):
+    table = []
+    for square in range(64):
+        rank, file = divmod(square, 8)
+        ray = 0
+        r, f = rank + rank_delta, file + file_delta
+        while 0 <= r <= 7 and 0 <= f <= 7:
+            ray |= 1 << (r*8 + f)
+            r, f = r + rank_delta, f + file_delta
+        table.append(ray)
+    return table
+
+RAYS = [_rays(*direction) for direction in DIRECTIONS]
+
+def _positive_ray_attacks(ray, square, occupied):
+    attacks = ray[square]
+    blockers = attacks & occupied
+    if blockers:
+        attacks ^= ray[(blockers & -blockers).bit_length() - 1]
+    return attacks
+
+def _negative_ray_attacks(ray, square, occupied):
+    attacks = ray[square]
+    blockers = attacks & occupied
+    if blockers:
+        attacks ^= ray[blockers.bit_length() - 1]
+    return attacks
+
+def bishop_attacks(square, occupied):
+    return (
+        _positive_ray_attacks(RAYS[NORTH_EAST], square, occupied) |
+        _positive_ray_attacks(RAYS[NORTH_WEST], square, occupied) |
+        _negative_ray_attacks(RAYS[SOUTH_WEST], square, occupied) |
+        _negative_ray_attacks(RAYS[SOUTH_EAST], square, occupied)
+    )
+
+def rook_attacks(square, occupied):
+    return (
+        _positive_ray_attacks(RAYS[NORTH], square, occupied) |
+        _positive_ray_attacks(RAYS[EAST], square, occupied) |
+        _negative_ray_attacks(RAYS[SOUTH], square, occupied) |
+        _negative_ray_attacks(RAYS[WEST], square, occupied)
+    )
+
+def queen_attacks(square, occupied):
+    return bishop_attacks(square, occupied) | rook_attacks(square, occupied)
+
+# Squares seen by sliders on an empty board
+BISHOP_RAYS = [bishop_attacks(square, 0) for square in range(64)]
+ROOK_RAYS = [rook_attacks(square, 0) for square in range(64)]
+
+# BETWEEN[a][b] holds the squares strictly b/w two aligned squares and LINE[a][b]
+# the whole line running through them. Both are empty for unaligned squares.
+BETWEEN = [[0]*64 for _ in range(64)]
+LINE = [[0]*64 for _ in range(64)]
+for _square in range(64):
+    for _direction in range(4):
+        _ray, _opposite = RAYS[_direction], RAYS[_direction + 4]
+        _line = _ray[_square] | _opposite[_square] | BB_SQUARES[_square]
+        for _target in scan_forward(_ray[_square]):
+            BETWEEN[_square][_target] = BETWEEN[_target][_square] = _ray[_square] ^ _ray[_target] ^ BB_SQUARES[_target]
+            LINE[_square][_target] = LINE[_target][_square] = _line
+
+# Holds a chess position as bitboards. Moves can be applied with push and taken
+# back with pop, which restores the position from an undo record.
+class Position:
+    def __init__(self):
+        self.pieces = [[0]*6, [0]*6]
+        self.occupied_co = [0, 0]
+        self.occupied = 0
+        # Mailbox mirror of the bitboards, holds (color, piece_type) or None
+        self.board = [None]*64
+
+        self.turn = WHITE
+        self.castling = 0
+        self.ep_square = None
+        self.halfmove_clock = 0
+
+        # Zobrist key, updated along with every change of the position
+        self.key = 0
+
+        # Undo records of pushed moves
+        self._stack = []
+
+    # Copy of the position without its move stack
+    def copy(self):
+        position = Position.__new__(Position)
+        position.pieces = [self.pieces[WHITE][:], self.pieces[BLACK][:]]
+        position.occupied_co = self.occupied_co[:]
+        position.occupied = self.occupied
+        position.board = self.board[:]
+        position.turn = self.turn
+        position.castling = self.castling
+        position.ep_square = self.ep_square
+        position.halfmove_clock = self.halfmove_clock
+        position.key = self.key
+        position._stack = []
+        return position
+
+    def set_state(self, turn, castling, ep_square, halfmove_clock):
+        self.key ^= zobrist_state(self.turn, self.castling, self.ep_square) ^ zobrist_state(turn, castling, ep_square)
+        self.turn = turn
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove_clock
+        del self._stack[:]
+
+    def put_piece(self, square, color, piece_type):
+        mask = BB_SQUARES[square]
+        self.pieces[color][piece_type] |= mask
+        self.occupied_co[color] |= mask
+        self.occupied |= mask
+        self.board[square] = PIECES[color][piece_type]
+        self.key ^= ZOBRIST_PIECES[color][piece_type][square]
+
+    def remove_piece(self, square):
+        piece = self.board[square]
+        if piece is not None:
+            mask = BB_SQUARES[square]
+            color, piece_type = piece
+            self.pieces[color][piece_type] ^= mask
+            self.occupied_co[color] ^= mask
+            self.occupied ^= mask
+            self.board[square] = None
+            self.key ^= ZOBRIST_PIECES[color][piece_type][square]
+        return piece
+
+    # Zobrist key computed from scratch, self.key should always be equal to it
+    def compute_key(self):
+        key = zobrist_state(self.turn, self.castling, self.ep_square)
+        for square in scan_forward(self.occupied):
+            color, piece_type = self.board[square]
+            key ^= ZOBRIST_PIECES[color][piece_type][square]
+        return key
+
+    def piece_at(self, square):
+        return self.board[square]
+
+    def king_square(self, color):
+        king = self.pieces[color][KING]
+        return king.bit_length() - 1 if king else None
+
+    # No pawns, rooks or queens and at most a single minor piece, or bishops
+    # that all stand on squares of the same color
+    def is_insufficient_material(self):
+        white, black = self.pieces
+        if white[PAWN] | black[PAWN] | white[ROOK] | black[ROOK] | white[QUEEN] | black[QUEEN]:
+            return False
+        minors = white[KNIGHT] | black[KNIGHT] | white[BISHOP] | black[BISHOP]
+        if not minors & (minors - 1):
+            return True
+        if white[KNIGHT] | black[KNIGHT]:
+            return False
+        return not minors & BB_LIGHT_SQUARES or not minors & BB_DARK_SQUARES
+
+    # Bitboard of pieces of the given color attacking a square
+    def attackers(self, square, color, occupied=None):
+        if occupied is None:
+            occupied = self.occupied
+        pieces = self.pieces[color]
+        queens = pieces[QUEEN]
+        attackers = (
+            (KNIGHT_ATTACKS[square] & pieces[KNIGHT]) |
+            (KING_ATTACKS[square] & pieces[KING]) |
+            (PAWN_ATTACKS[color ^ 1][square] & pieces[PAWN])
+        )
+        diagonal = pieces[BISHOP] | queens
+        if diagonal:
+            attackers |= bishop_attacks(square, occupied) & diagonal
+        orthogonal = pieces[ROOK] | queens
+        if orthogonal:
+            attackers |= rook_attacks(square, occupied) & orthogonal
+        return attackers & occupied
+
+    def is_attacked(self, square, color, occupied=None):
+        return bool(self.attackers(square, color, occupied))
+
+    # Squares attacked by the piece standing on a square, own pieces included
+    def attacks(self, square):
+        piece = self.board[square]
+        if piece is None:
+            return 0
+        color, piece_type = piece
+        if piece_type == PAWN:
+            return PAWN_ATTACKS[color][square]
+        elif piece_type == KNIGHT:
+            return KNIGHT_ATTACKS[square]
+        elif piece_type == BISHOP:
+            return bishop_attacks(square, self.occupied)
+        elif piece_type == ROOK:
+            return rook_attacks(square, self.occupied)
+        elif piece_type == QUEEN:
+            return queen_attacks(square, self.occupied)
+        return KING_ATTACKS[square]
+
+    # Pseudo legal destinations of the piece standing on a square, castling excluded
+    def pseudo_legal_targets(self, square):
+        color, piece_type = self.board[square]
+        own = self.occupied_co[color]
+        if piece_type == KNIGHT:
+            return KNIGHT_ATTACKS[square] & ~own
+        elif piece_type == BISHOP:
+            return bishop_attacks(square, self.occupied) & ~own
+        elif piece_type == ROOK:
+            return rook_attacks(square, self.occupied) & ~own
+        elif piece_type == QUEEN:
+            return queen_attacks(square, self.occupied) & ~own
+        elif piece_type == KING:
+            return KING_ATTACKS[square] & ~own
+
+        # Pawns push onto empty squares and capture diagonally
+        targets = PAWN_ATTACKS[color][square] & self.occupied_co[color ^ 1]
+        if self.ep_square is not None:
+            targets |= PAWN_ATTACKS[color][square] & BB_SQUARES[self.ep_square]
+        empty = ~self.occupied & BB_ALL
+        mask = BB_SQUARES[square]
+        if color == WHITE:
+            single = (mask << 8) & empty
+            targets |= single
+            if mask & BB_RANK_2:
+                targets |= (single << 8) & empty
+        else:
+            single = (mask >> 8) & empty
+            targets |= single
+            if mask & BB_RANK_7:
+                targets |= (single >> 8) & empty
+        return targets
+
+    def generate_pseudo_legal_moves(self, from_mask=BB_ALL):
+        color = self.turn
+        pawns = self.pieces[color][PAWN]
+        moves = []
+        for from_square in scan_forward(self.occupied_co[color] & from_mask):
+            targets = self.pseudo_legal_targets(from_square)
+            if BB_SQUARES[from_square] & pawns and targets & BB_BACKRANKS:
+                for to_square in scan_forward(targets):
+                    for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                        moves.append(from_square | (to_square << 6) | (promotion << 12))
+            else:
+                for to_square in scan_forward(targets):
+                    moves.append(from_square | (to_square << 6))
+        moves += self.generate_castling_moves(from_mask)
+        return moves
+
+    # King should be on its square, the rook on its corner, squares b/w them empty and
+    # the king shouldn't be in check, pass through or land on an attacked square.
+    def generate_castling_moves(self, from_mask=BB_ALL):
+        moves = []
+        color = self.turn
+        rights = self.castling & (3 if color == WHITE else 12)
+        king = self.pieces[color][KING]
+        if not rights or not king & from_mask:
+            return moves
+        for right, (king_square, king_to, rook_square, rook_to, between) in CASTLING_MOVES.items():
+            if not rights & right:
+                continue
+            if not king & BB_SQUARES[king_square] or not self.pieces[color][ROOK] & BB_SQUARES[rook_square]:
+                continue
+            if self.occupied & between:
+                continue
+            if self.is_attacked(king_square, color ^ 1) or self.is_attacked(rook_to, color ^ 1):
+                continue
+            if self.is_attacked(king_to, color ^ 1):
+                continue
+            moves.append(king_square | (king_to << 6))
+        return moves
+
+    # Pieces of the side to move that are pinned to their king, along with the
+    # line each of them is allowed to move on
+    def pins(self, king):
+        color = self.turn
+        enemy = self.pieces[color ^ 1]
+        snipers = (
+            (ROOK_RAYS[king] & (enemy[ROOK] | enemy[QUEEN])) |
+            (BISHOP_RAYS[king] & (enemy[BISHOP] | enemy[QUEEN]))
+        )
+        pinned = 0
+        pin_lines = {}
+        for sniper in scan_forward(snipers):
+            blockers = BETWEEN[king][sniper] & self.occupied
+            # Exactly one piece of our own in the way
+            if blockers and not blockers & (blockers - 1) and blockers & self.occupied_co[color]:
+                pinned |= blockers
+                pin_lines[blockers.bit_length() - 1] = LINE[king][sniper]
+        return pinned, pin_lines
+
+    # Legal moves are derived from the pieces checking the king and the pieces pinned
+    # to it, so only king moves and enpassant captures need an attack test.
+    def generate_legal_moves(self, from_mask=BB_ALL):
+        color = self.turn
+        king_bb = self.pieces[color][KING]
+        if not king_bb:
+            return self.generate_pseudo_legal_moves(from_mask)
+
+        king = king_bb.bit_length() - 1
+        own = self.occupied_co[color]
+        checkers = self.attackers(king, color ^ 1)
+        moves = []
+
+        # King can't step onto an attacked square, nor stay on the line of a checking slider
+        if king_bb & from_mask:
+            occupied = self.occupied ^ king_bb
+            for to_square in scan_forward(KING_ATTACKS[king] & ~own):
+                if not self.attackers(to_square, color ^ 1, occupied):
+                    moves.append(king | (to_square << 6))
+
+        # Only the king can get out of a double check
+        if checkers & (checkers - 1):
+            return moves
+
+        if checkers:
+            checker = checkers.bit_length() - 1
+            target_mask = checkers | BETWEEN[king][checker]
+        else:
+            target_mask = BB_ALL
+            moves += self.generate_castling_moves(from_mask)
+
+        pinned, pin_lines = self.pins(king)
+        pawns = self.pieces[color][PAWN]
+        ep_mask = BB_SQUARES[self.ep_square] if self.ep_square is not None else 0
+
+        for from_square in scan_forward(own & ~king_bb & from_mask):
+            from_bb = BB_SQUARES[from_square]
+            targets = self.pseudo_legal_targets(from_square)
+            if from_bb & pawns:
+                # Enpassant can uncover a check along the rank of the king, play it to be sure
+                if targets & ep_mask and PAWN_ATTACKS[color][from_square] & ep_mask:
+                    targets ^= ep_mask
+                    move = from_square | (self.ep_square << 6)
+                    if self.is_legal(move):
+                        moves.append(move)
+                targets &= target_mask
+                if from_bb & pinned:
+                    targets &= pin_lines[from_square]
+                if targets & BB_BACKRANKS:
+                    for to_square in scan_forward(targets):
+                        for promotion in (QUEEN, ROOK, BISHOP, KNIGHT):
+                            moves.append(from_square | (to_square << 6) | (promotion << 12))
+                    continue
+            else:
+                targets &= target_mask
+                if from_bb & pinned:
+                    targets &= pin_lines[from_square]
+            for to_square in scan_forward(targets):
+                moves.append(from_square | (to_square << 6))
+        return moves
+
+    # Tests a pseudo legal move by playing it and checking the mover's king
+    def is_legal(self, move):
+        color = self.turn
+        self.push(move)
+        king = self.pieces[color][KING]
+        legal = not king or not self.is_attacked(king.bit_length() - 1, color ^ 1)
+        self.pop()
+        return legal
+
+    # Plays a move, bitboards are updated in place without going through put/remove
+    def push(self, move):
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        promotion = move >> 12
+        board = self.board
+        piece = board[from_square]
+        color, piece_type = piece
+        pieces = self.pieces[color]
+
+        captured_square = to_square
+        if piece_type == PAWN and to_square == self.ep_square:
+            captured_square = to_square - 8 if color == WHITE else to_square + 8
+        captured = board[captured_square]
+
+        self._stack.append((move, captured, captured_square, self.castling, self.ep_square, self.halfmove_clock, self.key))
+        key = self.key ^ zobrist_state(color, self.castling, self.ep_square)
+        zobrist = ZOBRIST_PIECES[color]
+
+        if captured is not None:
+            key ^= ZOBRIST_PIECES[color ^ 1][captured[1]][captured_square]
+            captured_mask = BB_SQUARES[captured_square]
+            self.pieces[color ^ 1][captured[1]] ^= captured_mask
+            self.occupied_co[color ^ 1] ^= captured_mask
+            self.occupied ^= captured_mask
+            board[captured_square] = None
+
+        from_mask = BB_SQUARES[from_square]
+        to_mask = BB_SQUARES[to_square]
+        move_mask = from_mask | to_mask
+        if promotion:
+            pieces[PAWN] ^= from_mask
+            pieces[promotion] |= to_mask
+            piece = PIECES[color][promotion]
+            key ^= zobrist[PAWN][from_square] ^ zobrist[promotion][to_square]
+        else:
+            pieces[piece_type] ^= move_mask
+            key ^= zobrist[piece_type][from_square] ^ zobrist[piece_type][to_square]
+        self.occupied_co[color] ^= move_mask
+        self.occupied ^= move_mask
+        board[from_square] = None
+        board[to_square] = piece
+
+        if piece_type == KING and abs(to_square - from_square) == 2:
+            rook_square, rook_to = CASTLING_ROOK_MOVES[to_square]
+            rook_mask = BB_SQUARES[rook_square] | BB_SQUARES[rook_to]
+            pieces[ROOK] ^= rook_mask
+            self.occupied_co[color] ^= rook_mask
+            self.occupied ^= rook_mask
+            board[rook_to] = board[rook_square]
+            board[rook_square] = None
+            key ^= zobrist[ROOK][rook_square] ^ zobrist[ROOK][rook_to]
+
+        self.castling &= CASTLING_MASKS[from_square] & CASTLING_MASKS[to_square]
+
+        # Enpassant target is only set when an enemy pawn can actually capture
+        self.ep_square = None
+        if piece_type == PAWN and abs(to_square - from_square) == 16:
+            ep_square = (from_square + to_square) >> 1
+            if PAWN_ATTACKS[color][ep_square] & self.pieces[color ^ 1][PAWN]:
+                self.ep_square = ep_square
+
+        if piece_type == PAWN or captured is not None:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        self.turn ^= 1
+        self.key = key ^ zobrist_state(self.turn, self.castling, self.ep_square)
+
+    # Takes back the last pushed move and returns it
+    def pop(self):
+        move, captured, captured_square, castling, ep_square, halfmove_clock, key = self._stack.pop()
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        promotion = move >> 12
+        board = self.board
+        piece = board[to_square]
+        color, piece_type = piece
+        pieces = self.pieces[color]
+
+        from_mask = BB_SQUARES[from_square]
+        to_mask = BB_SQUARES[to_square]
+        move_mask = from_mask | to_mask
+        if promotion:
+            pieces[promotion] ^= to_mask
+            pieces[PAWN] |= from_mask
+            piece = PIECES[color][PAWN]
+        else:
+            pieces[piece_type] ^= move_mask
+        self.occupied_co[color] ^= move_mask
+        self.occupied ^= move_mask
+        board[to_square] = None
+        board[from_square] = piece
+
+        if piece_type == KING and abs(to_square - from_square) == 2:
+            rook_square, rook_to = CASTLING_ROOK_MOVES[to_square]
+            rook_mask = BB_SQUARES[rook_square] | BB_SQUARES[rook_to]
+            pieces[ROOK] ^= rook_mask
+            self.occupied_co[color] ^= rook_mask
+            self.occupied ^= rook_mask
+            board[rook_square] = board[rook_to]
+            board[rook_to] = None
+
+        if captured is not None:
+            captured_mask = BB_SQUARES[captured_square]
+            self.pieces[color ^ 1][captured[1]] |= captured_mask
+            self.occupied_co[color ^ 1] |= captured_mask
+            self.occupied |= captured_mask
+            board[captured_square] = captured
+
+        self.castling = castling
+        self.ep_square = ep_square
+        self.halfmove_clock = halfmove_clock
+        self.key = key
+        self.turn ^= 1
+        return move
+
+    # Square a move captures on, the square behind it for enpassant captures
+    def _captured_square(self, from_square, to_square, ep_square):
+        if to_square == ep_square and self.board[from_square][1] == PAWN:
+            return to_square - 8 if self.turn == WHITE else to_square + 8
+        return to_square
+
+    # Packed undo record of a move that is about to be pushed
+    def undo_info(self, move):
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        captured = self.board[self._captured_square(from_square, to_square, self.ep_square)]
+        return pack_undo(NO_CAPTURE if captured is None else captured[1], self.castling, self.ep_square, self.halfmove_clock)
+
+    # Takes back a move that was pushed when the position had the given undo record.
+    # The key is recomputed if the key before the move isn't known.
+    def unpush(self, move, undo, key=None):
+        captured_type, castling, ep_square, halfmove_clock = unpack_undo(undo)
+        to_square = (move >> 6) & 63
+        captured = None if captured_type == NO_CAPTURE else PIECES[self.turn][captured_type]
+        captured_square = to_square
+        if to_square == ep_square and not move >> 12 and self.board[to_square][1] == PAWN:
+            captured_square = to_square + 8 if self.turn == WHITE else to_square - 8
+        self._stack.append((move, captured, captured_square, castling, ep_square, halfmove_clock, key))
+        self.pop()
+        if key is None:
+            self.key = self.compute_key()
+
+    # Squares whose contents a move changes, asked before the move is pushed
+    def touched_squares(self, move):
+        from_square = move & 63
+        to_square = (move >> 6) & 63
+        squares = [from_square, to_square]
+        piece_type = self.board[from_square][1]
+        if piece_type == KING and abs(to_square - from_square) == 2:
+            squares.extend(CASTLING_ROOK_MOVES[to_square])
+        else:
+            captured_square = self._captured_square(from_square, to_square, self.ep_square)
+            if captured_square != to_square:
+                squares.append(captured_square)
+        return squares
+
+
+# Color of the attacks of an empty square
+NO_COLOR = 2
+
+# Number of pieces of each color attacking every square, kept up to date square by
+# square as the position changes so that attack questions become a lookup.
+class AttackMap:
+    def __init__(self, position=None):
+        # No square can be attacked by more than 16 pieces of a color, so bytes are enough
+        self.counts = [bytearray(64), bytearray(64)]
+        # Attack set each square contributed to the counts and the color it counted for
+        self._attacks = [0]*64
+        self._colors = bytearray([NO_COLOR])*64
+        if position is not None:
+            for square in scan_forward(position.occupied):
+                self._refresh(position, square)
+
+    def copy(self):
+        attack_map = AttackMap.__new__(AttackMap)
+        attack_map.counts = [self.counts[WHITE][:], self.counts[BLACK][:]]
+        attack_map._attacks = self._attacks[:]
+        attack_map._colors = self._colors[:]
+        return attack_map
+
+    def is_attacked(self, square, color):
+        return self.counts[color][square] > 0
+
+    def count(self, square, color):
+        return self.counts[color][square]
+
+    # Must be called for every square whose occupant changed, after the change was
+    # made on the position. Besides the piece on the square itself only the sliders
+    # looking at the square can have their attacks extended or cut short, and
+    # whether they look at it doesn't depend on what stands there.
+    def update(self, position, square):
+        self._refresh(position, square)
+        white, black = position.pieces
+        diagonal = white[BISHOP] | white[QUEEN] | black[BISHOP] | black[QUEEN]
+        orthogonal = white[ROOK] | white[QUEEN] | black[ROOK] | black[QUEEN]
+        sliders = (
+            (bishop_attacks(square, position.occupied) & diagonal) |
+            (rook_attacks(square, position.occupied) & orthogonal)
+        )
+        for slider in scan_forward(sliders):
+            self._refresh(position, slider)
+
+    # Same as updating every square in turn, but sliders seeing several of the squares
+    # are refreshed only once
+    def update_squares(self, position, squares):
+        white, black = position.pieces
+        diagonal = white[BISHOP] | white[QUEEN] | black[BISHOP] | black[QUEEN]
+        orthogonal = white[ROOK] | white[QUEEN] | black[ROOK] | black[QUEEN]
+        sliders = 0
+        changed = 0
+        for square in squares:
+            self._refresh(position, square)
+            changed |= BB_SQUARES[square]
+            sliders |= (
+                (bishop_attacks(square, position.occupied) & diagonal) |
+                (rook_attacks(square, position.occupied) & orthogonal)
+            )
+        for slider in scan_forward(sliders & ~changed):
+            self._refresh(position, slider)
+
+    def _refresh(self, position, square):
+        old = self._attacks[square]
+        old_color = self._colors[square]
+        new = position.attacks(square)
+        piece = position.board[square]
+        new_color = piece[0] if piece is not None else NO_COLOR
+
+        if old_color == new_color:
+            if new_color != NO_COLOR and old != new:
+                counts = self.counts[new_color]
+                for target in scan_forward(old & ~new):
+                    counts[target] -= 1
+                for target in scan_forward(new & ~old):
+                    counts[target] += 1
+        else:
+            if old_color != NO_COLOR:
+                counts = self.counts[old_color]
+                for target in scan_forward(old):
+                    counts[target] -= 1
+            if new_color != NO_COLOR:
+                counts = self.counts[new_color]
+                for target in scan_forward(new):
+                    counts[target] += 1
+
+        self._attacks[square] = new
+        self._colors[square] = new_color
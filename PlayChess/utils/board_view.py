@@ -0,0 +1,67 @@
+# Html view of a chessboard. Every square can only look one of 13 ways (12 pieces
+# or empty), so all 64x13 square fragments are built once at import and a board
+# is rendered by picking one fragment per square and joining them.
+
+from . import bitboard
+
+PIECE_SYMBOLS = ("p", "N", "B", "R", "Q", "K")
+
+# Index of the contents of a mailbox square in the tables below
+BLANK_INDEX = 12
+PIECE_INDEXES = {None: BLANK_INDEX}
+for _color in (bitboard.WHITE, bitboard.BLACK):
+    for _piece_type in range(6):
+        PIECE_INDEXES[bitboard.PIECES[_color][_piece_type]] = _color*6 + _piece_type
+
+PIECE_LABELS = [
+    bitboard.COLOR_NAMES[index // 6] + "-" + PIECE_SYMBOLS[index % 6] for index in range(12)
+] + ["none-_"]
+
+def is_light_square(square):
+    return (bitboard.square_rank(square) + bitboard.square_file(square)) % 2 == 1
+
+# SQUARE_CLASSES[square][piece_index] -> "square light white-p"
+SQUARE_CLASSES = [
+    [("square light " if is_light_square(square) else "square dark ") + label for label in PIECE_LABELS]
+    for square in range(64)
+]
+
+# FRAGMENTS[square][piece_index] -> '<td><div class="square light white-p" id="e4"></div></td>'
+FRAGMENTS = [
+    ['<td><div class="' + html_class + '" id="' + bitboard.SQUARE_NAMES[square] + '"></div></td>' for html_class in SQUARE_CLASSES[square]]
+    for square in range(64)
+]
+
+# Squares row by row as seen by white and by black
+WHITE_ROWS = [[rank*8 + file for file in range(8)] for rank in range(7, -1, -1)]
+BLACK_ROWS = [[rank*8 + file for file in range(7, -1, -1)] for rank in range(8)]
+
+def render_board(position, flipped=False):
+    board = position.board
+    parts = []
+    for row in (BLACK_ROWS if flipped else WHITE_ROWS):
+        parts.append("<tr>")
+        for square in row:
+            parts.append(FRAGMENTS[square][PIECE_INDEXES[board[square]]])
+        parts.append("</tr>")
+    return "".join(parts)
+
+def square_class(position, square):
+    return SQUARE_CLASSES[square][PIECE_INDEXES[position.board[square]]]
+
+def square_fragment(position, square):
+    return FRAGMENTS[square][PIECE_INDEXES[position.board[square]]]
+
+# Classes the client needs to apply for the squares touched by a move, eg->
+# [{'pos': 'e2', 'class': 'square light none-_'}, ...]. Kings in check get
+# an extra check class.
+def square_changes(position, squares, checked_kings=()):
+    changes = []
+    seen = set()
+    for square in squares:
+        if square not in seen:
+            seen.add(square)
+            changes.append({'pos': bitboard.SQUARE_NAMES[square], 'class': square_class(position, square)})
+    for square in checked_kings:
+        changes.append({'pos': bitboard.SQUARE_NAMES[square], 'class': square_class(position, square) + ' check'})
+    return changes
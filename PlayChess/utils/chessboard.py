@@ -1,135 +1,137 @@
-# Defines a blank class to identify blank sqaures on chessboard
+# Pieces are shared flyweights, one per color and kind plus a blank one, and the
+# squares of a board are thin views over its bitboards. A board only owns its
+# bitboards, so memory doesn't grow with the html it renders.
+
+from .exceptions import (InvalidMoveError, SideNotAuthorizedToMakeMove, DefenderColorNotSpecified ,Checkmate, Draw, InvalidFenNotation, BranchingLimitReached, InvalidPackedPosition)
+from . import bitboard
+from . import board_view
+from . import fen
+from . import packed
+from .. import config
 
-# Define a class for chessboard pieces with necessary members and methods.
-# This would serve as the parent class for other pieces.
+class Piece:
+    __slots__ = ("name", "points", "color", "label")
 
-import sys
-import re as regex
+    # Pieces are flyweights shared by every board, so they can't be changed once made
+    def __init__(self, name, points, color, symbol):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "points", points)
+        object.__setattr__(self, "color", color)
+        object.__setattr__(self, "label", color + "-" + symbol)
 
-from .exceptions import (InvalidMoveError, SideNotAuthorizedToMakeMove, DefenderColorNotSpecified ,Checkmate, Draw)
-from .. import config
+    def __setattr__(self, name, value):
+        raise AttributeError("Pieces are shared between boards and can't be modified")
 
-class Piece:
-    # Initialises the basic component of every piece
-    def __init__(self):
-        self.points = 0
-        self.current_position = ""
-        self.color = ""
-        self.label = ""
-        self.name = ""
-        
     def __str__(self):
-        return self.label + self.current_position
+        return self.label
 
     __repr__=__str__
-    
-class Pawn(Piece):
-    def __init__(self, current_position, color):
-        super().__init__()
-        self.name = "Pawn"
-        self.points = 1
-        self.current_position = current_position
-        self.color = color
-        self.label = color + "-" + "p"
-
-class Knight(Piece):
-    def __init__(self, current_position, color):
-        super().__init__()
-        self.name = "Knight"
-        self.points = 3
-        self.current_position = current_position
-        self.color = color
-        self.label = color + "-" + "N"
-
-class Bishop(Piece):
-    def __init__(self, current_position, color):
-        super().__init__()
-        self.name = "Bishop"
-        self.points = 3
-        self.current_position = current_position
-        self.color = color
-        self.label = color + "-" + "B"
-
-class Rook(Piece):
-    def __init__(self, current_position, color):
-        super().__init__()
-        self.name = "Rook"
-        self.points = 5
-        self.current_position = current_position
-        self.color = color
-        self.label = color + "-" + "R"
-
-class Queen(Piece):
-    def __init__(self, current_position, color):
-        super().__init__()
-        self.name = "Queen"
-        self.points = 9
-        self.current_position = current_position
-        self.color = color
-        self.label = color + "-" + "Q"
-
-class King(Piece):
-    def __init__(self, current_position, color):
-        super().__init__()
-        self.name = "King"
-        self.points = 0
-        self.current_position = current_position
-        self.color = color
-        self.label = color + "-" + "K"
-
-class Blank(Piece):
-    def __init__(self, current_position):
-        super().__init__()
-        self.name = "Blank"
-        self.current_position = current_position
-        self.color = "none"
-        self.label = self.color + "-" + "_"
 
+# name -> (points, symbol used in the html class)
+PIECE_KINDS = {
+    "Pawn": (1, "p"),
+    "Knight": (3, "N"),
+    "Bishop": (3, "B"),
+    "Rook": (5, "R"),
+    "Queen": (9, "Q"),
+    "King": (0, "K"),
+}
+
+# The only piece objects ever made, PIECES[color][name]
+PIECES = {
+    color: {name: Piece(name, points, color, symbol) for name, (points, symbol) in PIECE_KINDS.items()}
+    for color in ("white", "black")
+}
+BLANK = Piece("Blank", 0, "none", "_")
+
+# Same pieces indexed by the (color, piece_type) pairs of the bitboard mailbox
+BITBOARD_PIECES = {
+    bitboard.PIECES[bitboard.COLORS[color]][bitboard.PIECE_TYPES[name]]: piece
+    for color in PIECES for name, piece in PIECES[color].items()
+}
+
+# A square of a particular board. Squares aren't stored, they are made on demand
+# by Chessboard.convert_to_index and read everything from the board's bitboards.
 class Square:
-    def __init__(self):
-        self.html_class = "square"
-        self.html_id = "notation"
-        self.label = "square"
-        self.piece = Piece()
-        self.css = ""
+    __slots__ = ("_position", "index")
 
-    def __str__(self):
-        return self.html_id + "-" + self.piece.label
+    def __init__(self, position, index):
+        self._position = position
+        self.index = index
 
-    __repr__ = __str__
-    
-class DarkSquare(Square):
-    def __init__(self):
-        super().__init__()
-        self.label = "dark-square"
-        self.html_class += " dark "
+    @property
+    def piece(self):
+        return BITBOARD_PIECES.get(self._position.board[self.index], BLANK)
+
+    @property
+    def html_id(self):
+        return bitboard.SQUARE_NAMES[self.index]
 
-    def set_html_id(self, html_id):
-        self.html_id = html_id
+    @property
+    def label(self):
+        return "light-square" if board_view.is_light_square(self.index) else "dark-square"
 
-class LightSquare(Square):
-    def __init__(self):
-        super().__init__()
-        self.label = "light-square"
-        self.html_class += " light "
+    @property
+    def html_class(self):
+        return board_view.square_class(self._position, self.index)
 
-    def set_html_id(self, html_id):
-        self.html_id = html_id 
+    @property
+    def css(self):
+        return board_view.square_fragment(self._position, self.index)
 
-# States of a chessboard are managed via branch objects
+    def __str__(self):
+        return self.html_id + "-" + self.piece.label
+
+    __repr__ = __str__
+
+# States of a chessboard are managed via branch objects. Every branch object is a
+# node of the move tree, identified by its branch id and its state (ply). Only
+# keyframe nodes keep their fen, the others replay their moves from the closest one.
 class Branch:
-    def __init__(self, branch_id, branch_name, fen, state, move, annotation="", parent=0):
+    __slots__ = (
+        "_id", "_branch_name", "_fen", "_state", "_move", "_annotation", "_parent", "_key",
+        "_parent_node", "_children", "_played", "_undo",
+    )
+
+    def __init__(self, branch_id, branch_name, fen, state, move, annotation="", parent=0, key=None, played=None, undo=None):
         self._id = branch_id
         self._branch_name = branch_name
+        # None if the fen has to be replayed from a keyframe
         self._fen = fen
         self._state = state
         self._move = move
         self._annotation = annotation
         self._parent = parent
         # 0 indicates main branch. If _id == _parent, continue down the same branch
+        # Zobrist key of the position, None if it isn't known
+        self._key = key
+        # Tree links, the parent node and the nodes of the moves played from here
+        self._parent_node = None
+        self._children = []
+        # Encoded bitboard move from the parent node and its packed undo record,
+        # see bitboard.pack_undo. undo is None until the move is played once.
+        self._played = played
+        self._undo = undo
 
     def get_fen(self):
-        return self._fen
+        if self._fen is not None:
+            return self._fen
+        nodes = []
+        node = self
+        while node._fen is None:
+            nodes.append(node)
+            node = node._parent_node
+        nodes.reverse()
+        undos = []
+        fen_notation = fen.replay_fen(node._fen, [node._played for node in nodes], undos)
+        # Nodes read from a story have no undo records, the replay gives them for free
+        for node, undo in zip(nodes, undos):
+            if node._undo is None:
+                node._undo = undo
+        return fen_notation
+
+    def get_key(self):
+        return self._key
 
     def get_id(self):
         return self._id
@@ -146,6 +148,35 @@ class Branch:
     def get_move(self):
         return self._move
 
+    def get_played(self):
+        return self._played
+
+    def get_undo(self):
+        return self._undo
+
+    def set_undo(self, undo):
+        self._undo = undo
+
+    def get_annotation(self):
+        return self._annotation
+
+    def set_annotation(self, annotation):
+        self._annotation = annotation
+
+    def add_child(self, node):
+        node._parent_node = self
+        self._children.append(node)
+
+    def get_children(self):
+        return self._children
+
+    # The move that continues this branch, or the first variation if the branch ends here
+    def get_continuation(self):
+        for child in self._children:
+            if child._id == self._id:
+                return child
+        return self._children[0] if self._children else None
+
     def __str__(self):
         return str({
             "id": self._id, 
@@ -155,213 +186,442 @@ class Branch:
             "state": self._state,
         })
 
-# This class manages states of Chessboard class
+# Verdicts of the rules on a single position. Chessboard computes one per
+# position and drops it as soon as the position changes.
+class PositionStatus:
+    def __init__(self, legal_moves, in_check, turn, fifty_move, insufficient_material):
+        # Maps initial square to the final squares reachable from it
+        self.legal_moves = legal_moves
+        self.in_check = in_check
+        self.fifty_move = fifty_move
+        self.insufficient_material = insufficient_material
+        self.stalemate = len(legal_moves)==0 and not in_check[turn]
+        self.checkmate = len(legal_moves)==0 and in_check[turn]
+        # Result list handed out by Chessboard.fetch_game_status
+        self.game_status = None
+
+# This class manages states of Chessboard class. States form a tree of branch
+# nodes, indexed by (branch id, state) and by position so that navigating,
+# branching and transposing never scan the whole history.
 class StateManager:
     def __init__(self):
-        self._states = [{
-            0: Branch(0, "main", config.START_POSITION_NOTATION, 0, None)
-        }]
-        self._current_state = 0
-        self._branch_count = 1
-        self._active_branch = 0
+        self.flush_states()
         self._title = ""
-    
+
+    def _add_node(self, node, parent_node=None):
+        if parent_node is not None:
+            parent_node.add_child(node)
+        self._nodes[(node._id, node._state)] = node
+        self._changed[self._node_key(node)] = node
+        self._deleted.discard(self._node_key(node))
+        self._branches.setdefault(node._id, node)
+        self._positions.setdefault(self._position_index(node._state, node._fen, node._key), node)
+        self._depth = max(self._depth, node._state + 1)
+        self._line = None
+
+    # Path of a node under the branches of a stored story, eg-> "3.12" for branch 3 at state 12
+    def _node_key(self, node):
+        return str(node._id) + "." + str(node._state)
+
+    # Positions are indexed by key, fen is only used for branches with no key
+    def _position_index(self, state, fen, position_key):
+        return (state, fen if position_key is None else position_key)
+
     def is_state_present(self, state):
-        return state>=0 and state<len(self._states)
+        return state>=0 and state<self._depth
 
     def search_for_branch(self, branch_id):
-        index = -1
-        for i, val in enumerate(self._states):
-            if val.get(branch_id, False):
-                index = i
-                break
-        return index
-
-    def search_states(self, fen):
-        branch_id = -1
-        for key in self._states[self._current_state]:
-            state = self._states[self._current_state][key]
-            if state.get_fen() == fen:
-                branch_id = state.get_id()
-                break
-        return branch_id
+        self._hydrate([branch_id])
+        node = self._branches.get(branch_id)
+        return -1 if node is None else node._state
+
+    # Branch id of the node holding the position at the given state, -1 if there's none
+    def search_states(self, fen, position_key=None, state=None):
+        if state is None:
+            state = self._current._state
+        node = self._positions.get(self._position_index(state, fen, position_key))
+        if node is None and position_key is not None and fen is not None:
+            node = self._positions.get(self._position_index(state, fen, None))
+        return -1 if node is None else node._id
 
     # Smaller states are parent of Larger states
     def get_smallest_branch(self):
-        min_value = min(self._states[self._current_state])
-        return min_value
+        self._hydrate_forks(self._current)
+        children = self._current._children
+        return min(child._id for child in children) if children else self._current._id
+
+    def _branch_name(self, branch_id):
+        return "main" if branch_id == 0 else "Branch" + str(branch_id)
+
+    # Nodes reached by a known move only keep their fen if they are keyframes
+    def _is_keyframe(self, state, played):
+        return played is None or state % config.STATE_KEYFRAME_INTERVAL == 0
+
+    # fen may be a function returning the fen, it's then only called for keyframes
+    def create_branch(self, fen, move, key=None, played=None, undo=None):
+        current_state = self._current
+        state = current_state._state + 1
+        self._hydrate_forks(current_state)
 
-    def create_branch(self, fen, move):
-        current_state = self.get_active_branch()
-        self._current_state += 1
+        # Only keyframes keep their fen, the others aren't worth writing
+        if not self._is_keyframe(state, played):
+            fen = None
+        elif callable(fen):
+            fen = fen()
+
+        # Switch active branch to found branch
+        branch_id = self.search_states(fen, key, state)
+        if branch_id != -1:
+            self._current = self._nodes[(branch_id, state)]
+            return
 
         # Just create a new Node in the active branch
-        if self._current_state == len(self._states):
-            self._states.append({self._active_branch: Branch(
-                self._active_branch,
-                current_state._branch_name,
-                fen,
-                self._current_state,
-                move,
-                parent=current_state.get_id(),
-            )})
-        # Make sure the branch isnt already present
-        elif self.search_states(fen) == -1:
-            branch_id = self._branch_count
-            branch_name = "Branch" + str(branch_id)
+        if not current_state._children and (current_state._id, state) not in self._nodes:
+            branch_id = current_state._id
+            branch_name = current_state._branch_name
+        else:
             if self._branch_count >= config.BRANCHING_LIMIT:
-                raise exceptions.BranchingLimitReached()
+                raise BranchingLimitReached()
+            branch_id = self._branch_count
+            branch_name = self._branch_name(branch_id)
             self._branch_count += 1
-            self._active_branch = branch_id
-            self._states[self._current_state][branch_id] = Branch(
-                branch_id,
-                branch_name,
-                fen,
-                self._current_state,
-                move,
-                parent=current_state.get_id(),
-            )
-        # Switch active branch to found branch
-        else:
-            self._active_branch = self.search_states(fen)
+
+        node = Branch(branch_id, branch_name, fen, state, move, parent=current_state.get_id(), key=key, played=played, undo=undo)
+        self._add_node(node, current_state)
+        self._current = node
 
     def get_active_branch(self):
-        return self._states[self._current_state][self._active_branch]
+        return self._current
+
+    # First node of the tree, every branch is fetched so that the tree can be walked
+    def get_root(self):
+        self._hydrate_all()
+        return self._root
+
+    def get_title(self):
+        return self._title
+
+    def set_title(self, title):
+        self._title = title
+
+    def set_annotation(self, annotation):
+        self._current.set_annotation(annotation)
+        self._changed[self._node_key(self._current)] = self._current
 
     def set_branch(self, branch_id, state):
-        self._active_branch = branch_id
-        self._current_state = state
+        self._hydrate([branch_id])
+        self._current = self._nodes[(branch_id, state)]
 
+    # Follows the given branch if it's played from here, else continues the active branch
     def get_next_state(self, branch_id=0):
         success = False
-        if (self._current_state < len(self._states)-1):
-            self._current_state += 1
+        self._hydrate_forks(self._current)
+        children = self._current._children
+        if children:
+            node = None
+            for child in children:
+                if child._id == branch_id:
+                    node = child
+                    break
+            self._current = node or self._current.get_continuation()
             success = True
-        current_state = self.get_active_branch()
-        if branch_id is not current_state.get_id():
-            self._active_branch = self.get_smallest_branch()
-        return (self.get_active_branch().get_fen(), success)
+        return success
 
     def get_prev_state(self):
         success = False
-        state = self.get_active_branch()
-        prev_id = state.get_parent()
-        if (self._current_state > 0):
-            self._current_state -= 1
+        if self._current._parent_node is not None:
+            self._current = self._current._parent_node
             success = True
-        self._active_branch = prev_id
-        return (self.get_active_branch().get_fen(), success)
+        return success
 
     def parse_state_data(self, states_json):
-        self._current_state = states_json.get("current_state", 0),
-        self._active_branch = states_json.get("active_branch", 0)
-        self._branch_count = states_json.get("branch_count", 1)
         self._title = states_json.get("title", "")
         states = states_json.get("states", [{
             0: {
                 "id": 0,
                 "branch_name": "main",
                 "move": None,
-                "fen": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                "fen": config.START_POSITION_NOTATION,
                 "state": 0,
                 "annotation": "",
                 "parent": 0,
             }
         }])
-        for state in states:
-            branches = {}
-            for key in state:
-                branches[int(key)] = Branch(
-                    state[int(key)].get_id(),
-                    state[int(key)]._branch_name,
-                    state[int(key)].get_fen(),
-                    state[int(key)]._state,
-                    state[int(key)].move,
-                    parent=state[int(key)].parent,
-                    annotation=state[int(key)].annotation,
-                )
-            self._states.append(branches)
-
-    def get_states_as_json(self):
-        states = []
-        for state in self._states:
-            branches = {}
-            for key in state:
-                branches[str(key)] = {
-                    "id": state[key].get_id(),
-                    "branch_name": state[key]._branch_name,
-                    "fen": state[key].get_fen(),
-                    "state": state[key]._state,
-                    "move": state[key].get_move(),
-                    "annotation": state[key]._annotation,
-                    "parent": state[key].get_parent(),
-                }
-            states.append(branches)
-
+        self._clear_nodes()
+        for state_index, state in enumerate(states):
+            for branch in state.values():
+                self._parse_node(branch, state_index)
+        self._root = self._nodes[(0, 0)]
+        self._branch_count = states_json.get("branch_count", max(self._branches) + 1)
+        self._current = self._nodes.get(
+            (states_json.get("active_branch", 0), states_json.get("current_state", 0)),
+            self._root,
+        )
+        self._story_id = states_json.get("_id")
+        self.mark_story_saved()
+
+    def _parse_node(self, branch, state_index):
+        played = branch.get("played")
+        if played is not None:
+            played = bitboard.parse_move_notation(played)
+        node_state = branch.get("state", state_index)
+        node = Branch(
+            branch["id"],
+            branch.get("branch_name", self._branch_name(branch["id"])),
+            branch.get("fen") if self._is_keyframe(node_state, played) else None,
+            node_state,
+            branch["move"],
+            annotation=branch.get("annotation", ""),
+            parent=branch.get("parent", 0),
+            key=branch.get("key"),
+            played=played,
+        )
+        parent_node = self._nodes.get((node._parent, node._state - 1)) if node._state else None
+        self._add_node(node, parent_node)
+        return node
+
+    # Loads a stored story of which only some branches were fetched, the main line and
+    # the line of the active node at least. The others are listed in forks, eg->
+    # {"3": [1, 12]} for branch 3 played after state 12 of branch 1, and are fetched
+    # through branch_loader once navigation reaches them. branch_loader takes a list
+    # of branch ids and returns their nodes as stored, {"3": {"13": {...}, ...}, ...}.
+    def load_story(self, story, branch_loader=None):
+        self._title = story.get("title", "")
+        self._clear_nodes()
+        self._branch_loader = branch_loader
+        for branch_id, fork in story.get("forks", {}).items():
+            self._pending[int(branch_id)] = tuple(fork)
+            self._pending_forks.setdefault(tuple(fork), []).append(int(branch_id))
+        self._load_branches(story["branches"])
+        self._root = self._nodes[(0, 0)]
+        self._depth = max(self._depth, story.get("depth", 0))
+        self._branch_count = story.get("branch_count", max(self._branches) + 1)
+        active_branch = story.get("active_branch", 0)
+        self._hydrate([active_branch])
+        self._current = self._nodes.get((active_branch, story.get("current_state", 0)), self._root)
+        self._story_id = story.get("_id")
+        self.mark_story_saved()
+
+    # Adds stored branches to the tree, parents are always loaded before their forks
+    def _load_branches(self, branches):
+        nodes = [node for states in branches.values() for node in states.values()]
+        nodes.sort(key=lambda node: (node["state"], node["id"]))
+        for branch in nodes:
+            branch_id = branch["id"]
+            if branch_id in self._pending:
+                fork = self._pending.pop(branch_id)
+                self._pending_forks[fork].remove(branch_id)
+                if not self._pending_forks[fork]:
+                    del self._pending_forks[fork]
+            node = self._parse_node(branch, branch["state"])
+            # Nodes read from the story are already saved
+            del self._changed[self._node_key(node)]
+
+    # Fetches the given branches along with the forks they are played from
+    def _hydrate(self, branch_ids):
+        needed = set()
+        for branch_id in branch_ids:
+            while branch_id in self._pending and branch_id not in needed:
+                needed.add(branch_id)
+                branch_id = self._pending[branch_id][0]
+        if needed:
+            self._load_branches(self._branch_loader(sorted(needed)))
+
+    # Fetches the branches played from a node, children stay in the order they were played
+    def _hydrate_forks(self, node):
+        forks = self._pending_forks.get((node._id, node._state))
+        if forks:
+            self._hydrate(list(forks))
+            node._children.sort(key=lambda child: child._id)
+
+    def _hydrate_all(self):
+        self._hydrate(list(self._pending))
+
+    # State is left out, it's the index of the node in the states list
+    def _node_as_json(self, node):
+        branch = {
+            "id": node.get_id(),
+            "move": node.get_move(),
+            "parent": node.get_parent(),
+            "key": node.get_key(),
+        }
+        # Default names and empty annotations are left out
+        if node._branch_name != self._branch_name(node.get_id()):
+            branch["branch_name"] = node._branch_name
+        if node._annotation:
+            branch["annotation"] = node._annotation
+        # Only keyframes have a fen, other states are replayed from them
+        if node._fen is not None:
+            branch["fen"] = node._fen
+        if node.get_played() is not None:
+            branch["played"] = bitboard.move_notation(node.get_played())
+        return branch
+
+    def _node_document(self, node):
+        branch = self._node_as_json(node)
+        branch["state"] = node._state
+        return branch
+
+    def _story_header(self):
         return {
-            "current_state": self._current_state,
-            "active_branch": self._active_branch,
+            "current_state": self._current._state,
+            "active_branch": self._current.get_id(),
             "branch_count": self._branch_count,
             "title": self._title,
-            "states": states,
         }
 
+    def get_states_as_json(self):
+        self._hydrate_all()
+        states = []
+        level = [self._root]
+        while level:
+            states.append({str(node.get_id()): self._node_as_json(node) for node in level})
+            level = [child for node in level for child in node._children]
+
+        states_json = self._story_header()
+        states_json["states"] = states
+        return states_json
+
+    # Stories are stored with their nodes grouped by branch, eg->
+    # {"title": ..., "forks": {"1": [0, 4]}, "branches": {"0": {"0": {...}, "1": {...}}, "1": {"5": {...}}}}
+    # so that a save only has to set the nodes added since the last one and unset the
+    # deleted ones, and a load can fetch the branches it needs one by one
+    def get_story_id(self):
+        return self._story_id
+
+    def set_story_id(self, story_id):
+        self._story_id = story_id
+
+    # Header of a stored story, with the fork of every branch and the depth of the tree
+    def _story_document_header(self):
+        header = self._story_header()
+        forks = {str(branch_id): list(fork) for branch_id, fork in self._pending.items()}
+        for branch_id, node in self._branches.items():
+            if node._parent_node is not None:
+                forks[str(branch_id)] = [node._parent_node._id, node._parent_node._state]
+        header["forks"] = forks
+        header["depth"] = self._depth
+        return header
+
+    def get_story_document(self):
+        self._hydrate_all()
+        document = self._story_document_header()
+        branches = document["branches"] = {}
+        for node in self._nodes.values():
+            branches.setdefault(str(node._id), {})[str(node._state)] = self._node_document(node)
+        return document
+
+    # Header along with the nodes added and the node paths deleted since the last save
+    def get_story_changes(self):
+        changed = {key: self._node_document(node) for key, node in self._changed.items()}
+        return self._story_document_header(), changed, sorted(self._deleted)
+
+    def mark_story_saved(self):
+        self._changed = {}
+        self._deleted = set()
+
+    # Moves of the line of the active node, from the first move to the end of its continuation.
+    # It stays cached while navigation moves along the part that is the same.
+    def _active_line(self):
+        current = self._current
+        if self._line is not None:
+            nodes, indexes, continued_from, moves = self._line
+            if indexes.get(current, -1) >= continued_from:
+                return moves
+
+        nodes = []
+        node = current
+        while node is not None:
+            nodes.append(node)
+            node = node._parent_node
+        nodes.reverse()
+        self._hydrate_forks(current)
+        node = current.get_continuation()
+        while node is not None:
+            nodes.append(node)
+            self._hydrate_forks(node)
+            node = node.get_continuation()
+
+        # The line is the same for every node from which the rest of it is the continuation
+        continued_from = len(nodes) - 1
+        while continued_from > 0 and nodes[continued_from-1].get_continuation() is nodes[continued_from]:
+            continued_from -= 1
+        moves = [(node._id, node._state, node._move) for node in nodes[1:]]
+        self._line = (nodes, {node: index for index, node in enumerate(nodes)}, continued_from, moves)
+        return moves
+
     def get_branch_state(self):
-        is_first = True
-        branch_state = []
-        parent = None
-        for move_num, state in reversed(list(enumerate(self._states))):
-            branch = state.get(self._active_branch, False)
-            if move_num>=1 and branch:
-                branch_state.append((branch._id, branch._state, branch._move))
-                parent = branch._parent
-            elif move_num>=1 and parent is not None:
-                new_branch = state.get(parent, 0)
-                branch_state.append((new_branch._id, new_branch._state, new_branch._move))
-        branch_state = list(reversed(branch_state))
-        return branch_state
+        return list(self._active_line())
 
     def print_state(self):
-        print(self._current_state)
-        for branch in self._states:
-            for key in branch:
-                print(branch[key])
+        self._hydrate_all()
+        print(self._current._state)
+        for node in self._nodes.values():
+            print(node)
+
+    # Removes a node along with every move played after it
+    def _delete_node(self, node):
+        if node._parent_node is None:
+            return
+        self._hydrate_all()
+        node._parent_node._children.remove(node)
+        removed = [node]
+        for removed_node in removed:
+            removed.extend(removed_node._children)
+            del self._nodes[(removed_node._id, removed_node._state)]
+            self._changed.pop(self._node_key(removed_node), None)
+            self._deleted.add(self._node_key(removed_node))
+            if self._branches.get(removed_node._id) is removed_node:
+                del self._branches[removed_node._id]
+            index = self._position_index(removed_node._state, removed_node._fen, removed_node._key)
+            if self._positions.get(index) is removed_node:
+                del self._positions[index]
+            if removed_node is self._current:
+                self._current = node._parent_node
+        self._line = None
 
     def delete_branch(self, branch_id):
-        branch_start_index = self.search_for_branch(branch_id)
-        if branch_start_index is not -1:
-            for i in range(branch_start_index, len(self._states)):
-                if self._states[i].get(branch_id, None) is not None:
-                    del self._states[i][branch_id]
-                else:
-                    break
+        node = self._branches.get(branch_id)
+        if node is not None:
+            self._delete_node(node)
 
     def delete_state(self, branch_id, state_id):
-        if self.is_state_present(state_id):
-            for i in range(state_id, len(self._states)):
-                if self._states[i].get(branch_id, None) is not None:
-                    del self._states[i][branch_id]
-                else:
-                    break
-
-    def flush_states(self, state=config.START_POSITION_NOTATION):
-        del self._states[:]
-        self._current_state = 0
-        self._active_branch = 0
+        node = self._nodes.get((branch_id, state_id))
+        if node is not None:
+            self._delete_node(node)
+
+    def _clear_nodes(self):
+        self._changed = {}
+        self._deleted = set()
+        self._nodes = {}
+        self._branches = {}
+        self._positions = {}
+        self._depth = 0
+        # Branches of a stored story that aren't fetched yet, by id and by the node they fork from
+        self._pending = {}
+        self._pending_forks = {}
+        self._branch_loader = None
+
+    # A flushed tree is a new story
+    def flush_states(self, state=config.START_POSITION_NOTATION, key=None):
+        self._story_id = None
+        self._clear_nodes()
         self._branch_count = 1
-        self._states.append({
-            0: Branch(0, "main", state, 0, None)
-        })
+        self._root = Branch(0, "main", state, 0, None, key=key)
+        self._add_node(self._root)
+        self._current = self._root
+
 
 # Defines the final layout of the chessboard!
 class Chessboard:
     def __init__(self, fen_notation=config.START_POSITION_NOTATION):
 
-        # An array holding recent changes in board position
+        # Squares touched by the move being played, turned into html classes by
+        # the view only once the move is over
         self._changes = []
 
-        self._in_check = {0: False, 1: False}
-        self._game_status = None
+        # Cached PositionStatus of the current position
+        self._status = None
 
         # Objects holding current and all states of the chessboard
         self._states = StateManager()
@@ -388,230 +648,252 @@ class Chessboard:
         self._moves = 0
         self._half_moves = 0
 
-        # Stores position of black and white pieces for quick checkmate lookup
-        self._pieces = {
-            'white': {},
-            'black': {},
-        }
-        
-        self._chessboard = self.create_chessboard()
+        # Placement of the pieces, used for move generation and rendering.
+        # Set by load_position
+        self._position = None
 
-        valid_fen = bool(regex.match(config.FEN_NOTATION_REGEX, fen_notation))
-        if not valid_fen:
-            fen_notation = config.START_POSITION_NOTATION
-        self.load_position(fen_notation)
+        # Per color attack counts of every square, updated along with the position
+        self._attack_map = None
+
+        # Number of times each position key occurred since the last irreversible move
+        self._repetitions = {}
+
+        try:
+            if isinstance(fen_notation, bytes):
+                self.load_packed(fen_notation)
+            else:
+                self.load_position(fen_notation)
+        except (InvalidFenNotation, InvalidPackedPosition):
+            self.load_position(config.START_POSITION_NOTATION)
 
     @property
     def can_white_castle(self):
-        castling_flag = (self._castling_rights_white["white_side_castled"]^self._castling_rights_white["has_white_king_moved"])^(self._castling_rights_white["has_a1_rook_moved"]&self._castling_rights_white["has_h1_rook_moved"])
-        return not castling_flag
+        castling_rights = self.castling_rights
+        return "K" in castling_rights or "Q" in castling_rights
 
     @property
     def can_black_castle(self):
-        castling_flag = (self._castling_rights_black["black_side_castled"]^self._castling_rights_black["has_black_king_moved"])^(self._castling_rights_black["has_a8_rook_moved"]&self._castling_rights_black["has_h8_rook_moved"])
-        return not castling_flag
+        castling_rights = self.castling_rights
+        return "k" in castling_rights or "q" in castling_rights
+
+    # Zobrist hash of the position, equal for positions that only differ in move counters
+    @property
+    def position_key(self):
+        return self._position.key
+
+    # Castling rights in the order used by fen notation, eg-> "KQkq"
+    @property
+    def castling_rights(self):
+        castling_params = ""
+        if not self._castling_rights_white['white_side_castled'] and not self._castling_rights_white['has_white_king_moved']:
+            if not self._castling_rights_white['has_h1_rook_moved']:
+                castling_params += "K"
+            if not self._castling_rights_white['has_a1_rook_moved']:
+                castling_params += "Q"
+        if not self._castling_rights_black['black_side_castled'] and not self._castling_rights_black['has_black_king_moved']:
+            if not self._castling_rights_black['has_h8_rook_moved']:
+                castling_params += "k"
+            if not self._castling_rights_black['has_a8_rook_moved']:
+                castling_params += "q"
+        return castling_params
+
+    # Sets the castling flags from castling rights in fen notation, eg-> "KQk"
+    def _set_castling_rights(self, castling_info):
+        white, black = self._castling_rights_white, self._castling_rights_black
+        white['white_side_castled'] = False
+        white['has_white_king_moved'] = not ("K" in castling_info or "Q" in castling_info)
+        white['has_h1_rook_moved'] = not "K" in castling_info
+        white['has_a1_rook_moved'] = not "Q" in castling_info
+        black['black_side_castled'] = False
+        black['has_black_king_moved'] = not ("k" in castling_info or "q" in castling_info)
+        black['has_h8_rook_moved'] = not "k" in castling_info
+        black['has_a8_rook_moved'] = not "q" in castling_info
+
+    # Returns the status of current position, computing it only if the position
+    # has changed since it was last asked for
+    def _position_status(self):
+        if self._status is None:
+            self._status = self._compute_position_status()
+        return self._status
+
+    def _invalidate_status(self):
+        self._status = None
+
+    def _compute_position_status(self):
+        legal_moves = {}
+        for move in self._position.generate_legal_moves():
+            initial_pos = bitboard.SQUARE_NAMES[bitboard.move_from_square(move)]
+            final_pos = bitboard.SQUARE_NAMES[bitboard.move_to_square(move)]
+            # Promotions share their destination square
+            moves = legal_moves.setdefault(initial_pos, [])
+            if final_pos not in moves:
+                moves.append(final_pos)
+
+        in_check = {}
+        for index in (bitboard.WHITE, bitboard.BLACK):
+            king = self._position.king_square(index)
+            in_check[index] = king is not None and self._attack_map.is_attacked(king, index ^ 1)
+
+        return PositionStatus(
+            legal_moves,
+            in_check,
+            self._moves % 2,
+            self._half_moves >= 100,
+            self._position.is_insufficient_material(),
+        )
 
     @property
     def is_checkmate(self):
-        color = "white" if self._moves%2==0 else "black"
-        moves = []
-        for piece in self._pieces[color]:
-            for square in self._pieces[color][piece]:
-                moves += self.generate_legal_moves(square)
-        return len(moves)==0  and self.is_square_under_attack(self._pieces[color]["King"][0])
+        return self._position_status().checkmate
 
     # Drawing conditions
     @property
     def stalemate(self):
-        color = "white" if self._moves%2==0 else "black"
-        moves = []
-        for piece in self._pieces[color]:
-            for square in self._pieces[color][piece]:
-                moves += self.generate_legal_moves(square)
-        return len(moves)==0
+        return self._position_status().stalemate
 
     # Fifty move rule
     @property
     def fifty_move(self):
-        return self._half_moves >= 100
+        return self._position_status().fifty_move
 
     # Insufficient Material
     @property
     def insufficent_material(self):
-        color = "white" if self._moves%2==0 else "black"
-        # Single Bishop or Single Knight
-        if len(self._pieces[color])==2:
-            return self._pieces[color].get('Knight', False) or self._pieces[color].get('Bishop', False)
-        return False
+        return self._position_status().insufficient_material
+
+    # Threefold repetition
+    @property
+    def threefold_repetition(self):
+        return self._repetitions.get(self.position_key, 0) >= 3
+
+    # Fivefold repetition and the seventy five move rule draw without a claim
+    @property
+    def fivefold_repetition(self):
+        return self._repetitions.get(self.position_key, 0) >= 5
+
+    @property
+    def seventy_five_move(self):
+        return self._half_moves >= 150
 
     def is_draw(self):
         if self.fifty_move:
             return [True, "fifty move", "0.5"]
+        elif self.threefold_repetition:
+            return [True, "threefold repetition", "0.5"]
         elif self.stalemate:
             return [True, "stalemate", "0.5"]
         elif self.insufficent_material:
             return [True, "insufficient material", "0.5"]
         return [False]
 
-    def _fetch_game_status(self):
-        status = [self.is_checkmate]
-        if not status[0]:
-            status = self.is_draw()
-        else:
-            status += ["checkmate", "0" if self._moves%2==0 else "1"]
-        self._game_status = status
+    # Draws that end the game even if nobody claims them
+    def is_automatic_draw(self):
+        if self.seventy_five_move:
+            return [True, "seventy five move", "0.5"]
+        elif self.fivefold_repetition:
+            return [True, "fivefold repetition", "0.5"]
+        elif self.stalemate:
+            return [True, "stalemate", "0.5"]
+        elif self.insufficent_material:
+            return [True, "insufficient material", "0.5"]
+        return [False]
 
     def fetch_game_status(self):
-        return self._game_status
+        status = self._position_status()
+        if status.game_status is None:
+            if status.checkmate:
+                status.game_status = [True, "checkmate", "0" if self._moves%2==0 else "1"]
+            else:
+                status.game_status = self.is_draw()
+        return status.game_status
 
     def in_check(self, color):
-        return self._in_check[color]
+        return self._position_status().in_check[color]
 
     def check_color(self):
         return self._moves % 2 == 0
 
     @property
     def fen_notation(self):
-        fen_notation = ""
-        # Set board position
-        for rank in self._chessboard:
-            rank_notation = ""
-            skips = 0
-            for square in rank:
-                piece = config.CHESS_PIECES.get(square.piece.label, None)
-                if piece is None:
-                    skips += 1
-                else:
-                    if skips is not 0:
-                        rank_notation += str(skips)
-                        rank_notation += piece
-                        skips = 0
-                    else:
-                        rank_notation += piece
-            if skips is not 0:
-                rank_notation += str(skips)
-            fen_notation += rank_notation + "/"
-
-        # remove trailing slash
-        fen_notation = fen_notation[:-1]
-
-        # Color to make the move
-        color = 'w' if self._moves % 2 == 0 else 'b' 
-        fen_notation = fen_notation + " " + color + " "
-
-        # Castling Parameters
-        castling_params = ""
-        if not self._castling_rights_white['white_side_castled'] and not self._castling_rights_white['has_white_king_moved']:
-            if not self._castling_rights_white['has_h1_rook_moved']:
-                castling_params += "K"
-            if not self._castling_rights_white['has_a1_rook_moved']:
-                castling_params += "Q"
-        if not self._castling_rights_black['black_side_castled'] and not self._castling_rights_black['has_black_king_moved']:
-            if not self._castling_rights_black['has_h8_rook_moved']:
-                castling_params += "k"
-            if not self._castling_rights_black['has_a8_rook_moved']:
-                castling_params += "q"
-        
-        if castling_params == "":
-            castling_params = "-"
-
-        fen_notation += castling_params
-
-        # Enpassant Target Square
-        if self._enpassant_target_square is not None:
-            fen_notation += " " + str(self._enpassant_target_square)
-        else:
-            fen_notation += " - "
+        return fen.make_fen(
+            self._position,
+            self._moves % 2,
+            self.castling_rights,
+            self._enpassant_target_square,
+            self._half_moves,
+            (self._moves // 2) + 1,
+        )
 
-        # Half Move 
-        fen_notation += str(self._half_moves) + " "
+    # Position in the compact binary form of packed.py
+    @property
+    def packed_position(self):
+        return packed.pack_position(self._position, (self._moves // 2) + 1)
 
-        # Full Move params
-        fen_notation += str((self._moves // 2) + 1)
+    def load_position(self, fen_notation, hard=True):
+        self._load_parsed(fen.parse_fen(fen_notation), fen_notation, hard)
 
-        return fen_notation
+    # Loads a position packed by packed_position, the states keep its fen
+    def load_packed(self, data, hard=True):
+        parsed = packed.parse_packed(data)
+        self._reset_config_vars()
+        self._load_parsed(parsed, packed.unpack_fen(data), hard)
 
-    def load_position(self, fen_notation, hard=True):
-        # Extract required parameters for the Chessboard class from fen_notation
-        fen_components = fen_notation.split(' ')
-        game_component = fen_components[0] + "/"
-        move = 0 if fen_components[1]=='w' else 1
-        castling_info = fen_components[2]
-        enpassant_target_square = fen_components[3]
-        half_move = int(fen_components[4])
-        full_move = int(fen_components[5])
-
-        def get_position(file, rank):
-            return str(chr(ord('a') + file -1)) + str(rank)
-
-        # Iterate over the board_component and place pieces as you find them
-        rank = 8
-        file = 1
-        temp_board = []
-        board_row = []
-
-        for character in game_component:
-            if character == '/':
-                rank -= 1
-                file = 1
-                temp_board.append(board_row)
-                board_row = []
-            else:
-                piece = config.CHESS_PIECE_CLASS.get(character, None)
-                if piece is None:
-                    squares = int(character)
-                    while squares >= 1:
-                        board_row.append(self.create_piece(get_position(file, rank), 'Blank'))
-                        file += 1
-                        squares -= 1
-                else:
-                    board_row.append(self.create_piece(get_position(file, rank), piece[0], piece[1]))
-                    file += 1
-
-        # Create the chessboard
-        for i in range(8):
-            for j in range(8):
-                self._chessboard[i][j].piece = temp_board[i][j]
-                self._chessboard[i][j].html_class += temp_board[i][j].label
-                self._chessboard[i][j].css = """<td><div class="{html_class}" id="{html_id}"></div></td>""".format(
-                    html_class = self._chessboard[i][j].html_class,
-                    html_id = self._chessboard[i][j].html_id
-                )
-
-        # Parse Castling info
-        if not "K" in castling_info:
-            self._castling_rights_white['has_h1_rook_moved'] = True
-        if not "Q" in castling_info:
-            self._castling_rights_white['has_a1_rook_moved'] = True
-        if not "k" in castling_info:
-            self._castling_rights_black['has_h8_rook_moved'] = True
-        if not "q" in castling_info:
-            self._castling_rights_black['has_a8_rook_moved'] = True
-        if "-" in castling_info:
-            self._castling_rights_black['has_black_king_moved'] = True
-            self._castling_rights_white['has_white_king_moved'] = True
+    def _load_parsed(self, parsed, fen_notation, hard):
+        # Parsed positions are cached, the board gets its own copy of the bitboards
+        self._position = parsed.position.copy()
+        self._attack_map = parsed.attack_map.copy()
+        self._invalidate_status()
+        self._set_castling_rights(parsed.castling)
 
         # Enpassant Setting
-        if enpassant_target_square != "-":
-            self._enpassant_target_square = enpassant_target_square
+        if parsed.enpassant is not None:
+            self._enpassant_target_square = parsed.enpassant
             self._enpassant_flag_life = 1
+        else:
+            self._enpassant_target_square = None
+            self._enpassant_flag_life = 0
 
         # Half move
-        self._half_moves = half_move
+        self._half_moves = parsed.half_moves
 
         # Full move
-        self._moves = (full_move-1)*2 + move
+        self._moves = (parsed.full_moves-1)*2 + parsed.turn
+        self._sync_position()
+        self._repetitions = {self.position_key: 1}
         if hard:
-            self._states.flush_states(fen_notation)
+            self._states.flush_states(fen_notation, self.position_key)
 
     def load_states(self, state_json):
         self._states.parse_state_data(state_json)
         current_state = self._states.get_active_branch()
-        self.load_position(current_state.get_fen())
+        self.reset_chessboard(fen_notation=current_state.get_fen())
+        self._load_repetitions(current_state)
+
+    # Loads a stored story, see StateManager.load_story
+    def load_story(self, story, branch_loader=None):
+        self._states.load_story(story, branch_loader)
+        current_state = self._states.get_active_branch()
+        self.reset_chessboard(fen_notation=current_state.get_fen())
+        self._load_repetitions(current_state)
 
     def get_states_as_json(self):
         return self._states.get_states_as_json()
 
+    def get_story_id(self):
+        return self._states.get_story_id()
+
+    def set_story_id(self, story_id):
+        self._states.set_story_id(story_id)
+
+    def get_story_document(self):
+        return self._states.get_story_document()
+
+    def get_story_changes(self):
+        return self._states.get_story_changes()
+
+    def mark_story_saved(self):
+        self._states.mark_story_saved()
+
     def get_branch_state(self):
         return self._states.get_branch_state()
 
@@ -622,40 +904,11 @@ class Chessboard:
         curr_state = self._states.get_active_branch()
         return (curr_state._id == curr_state._parent)
 
-    def create_chessboard(self):
-        chessboard = []
-        for i in range(8):
-            chess_row = []
-            first = "a"
-            for j in range(8):
-                if (i+j)%2==0:
-                    # Square is white
-                    square = LightSquare()
-                else:
-                    # Square is black
-                    square = DarkSquare()
-                square.set_html_id(first+str(8-i))
-                chess_row.append(square)
-                first = chr(ord(first)+1)
-            chessboard.append(chess_row)
-        return chessboard
-
     def draw_chessboard_for_white(self):
-        board_html_view = "<tr>"
-        for i in range(8):
-            for j in range(8):
-                board_html_view += self._chessboard[i][j].css
-            board_html_view = board_html_view + "</tr>"
-        return board_html_view
+        return board_view.render_board(self._position)
 
     def draw_chessboard_for_black(self):
-        board_html_view = "<tr>"
-        for i in range(7,-1,-1):
-            for j in range(7, -1, -1):
-                board_html_view += self._chessboard[i][j].css
-            board_html_view = board_html_view + "</tr>"
-        return board_html_view
-
+        return board_view.render_board(self._position, flipped=True)
 
     def draw_chessboard(self, configuration='1'):
         if configuration=='1':
@@ -666,32 +919,24 @@ class Chessboard:
     # Need to be used for pawn promotion, en-passant and board editor
     def delete_piece(self, piece_position):
         obj = self.convert_to_index(piece_position)
-        self._pieces[obj.piece.color][obj.piece.name].remove(piece_position)
-        obj.piece = Blank(piece_position)
-        obj.html_class = obj.html_class.strip("white-Kwhite-Qwhite-Rwhite-Bwhite-Nwhite-pblack-Kblack-Qblack-Rblack-Bblack-Nblack-p")
-        obj.html_class += " " + obj.piece.label
-        obj.css = """<td><div class="{html_class}" id="{html_id}"></div></td>""".format(
-            html_class = obj.html_class,
-            html_id = obj.html_id
-        )
-        self._changes.append({'pos': piece_position, 'class': obj.html_class})
+        self._position.remove_piece(obj.index)
+        self._attack_map.update(self._position, obj.index)
+        self._invalidate_status()
+        self._changes.append(obj.index)
 
     # Can be used for simple Board Editor
-    def create_piece(self, piece_position, piece_name, piece_color=None):
-        if piece_color is None:
-            return getattr(sys.modules[__name__], piece_name)(piece_position)
-        if self._pieces[piece_color].get(piece_name, None) is None:
-            self._pieces[piece_color][piece_name] = [piece_position]
-        else:
-            self._pieces[piece_color][piece_name].append(piece_position)
-        return getattr(sys.modules[__name__], piece_name)(piece_position, piece_color)
+    def create_piece(self, piece_position, piece_name, piece_color):
+        self._position.put_piece(
+            bitboard.SQUARES[piece_position],
+            bitboard.COLORS[piece_color],
+            bitboard.PIECE_TYPES[piece_name],
+        )
+        self._attack_map.update(self._position, bitboard.SQUARES[piece_position])
+        self._invalidate_status()
+        return PIECES[piece_color][piece_name]
 
     def _reset_config_vars(self):
         del self._changes[:]
-        self._pieces = {
-            "white": {},
-            "black": {},
-        }
         self._castling_rights_white = {
             "white_side_castled": False,
             "has_white_king_moved": False,
@@ -706,238 +951,48 @@ class Chessboard:
         }
 
     def reset_chessboard(self, fen_notation=config.START_POSITION_NOTATION, hard=False):
+        # Raises InvalidFenNotation before anything is reset
+        fen.parse_fen(fen_notation)
         if hard:
             self._states.flush_states()
 
         self._reset_config_vars()
-        self._chessboard = self.create_chessboard()
         self.load_position(fen_notation, hard=hard)
 
     def convert_to_index(self, notation):
-        return self._chessboard[ord('8')-ord(notation[1])][ord(notation[0])-ord('a')]
+        return Square(self._position, bitboard.SQUARES[notation])
+
+    def piece_at(self, square):
+        return BITBOARD_PIECES.get(self._position.board[square], BLANK)
 
     def return_index_as_tuple(self, notation):
         return (ord('8')-ord(notation[1]), ord(notation[0])-ord('a'))
 
     # Will always be applied to check if a square is attacked or not
     def is_square_under_attack(self, square, piece_color=None):
-        indexes = self.return_index_as_tuple(square)
-
         if piece_color is None:
             piece_color = self.convert_to_index(square).piece.color
 
-        if piece_color is "none":
+        if piece_color == "none":
             raise DefenderColorNotSpecified("Please Specify defending piece color")
 
-        def are_colors_opposite(destination_square):
-            return destination_square.piece.color != piece_color and destination_square.piece.color != "none"
-
-        def are_colors_same(destination_square):
-            return destination_square.piece.color == piece_color
-
-        X, Y = indexes[0], indexes[1]
-        
-        # Check along horizontal
-        for y in range(Y+1, 8):
-            destination_square = self._chessboard[X][y]
-
-            if y==Y+1 and destination_square.piece.name == "King" and are_colors_opposite(destination_square):
-                return True
-
-            if (destination_square.piece.name == "Rook" or destination_square.piece.name == "Queen") and are_colors_opposite(destination_square):
-                return True
-
-            if are_colors_same(destination_square):
-                break
-
-            if destination_square.piece.name in ["Bishop", "Knight", "Pawn", "King"]:
-                break
-
-        for y in range(Y-1, -1, -1):
-            destination_square = self._chessboard[X][y]
-
-            if y==Y-1 and destination_square.piece.name == "King" and are_colors_opposite(destination_square):
-                return True
-
-            if (destination_square.piece.name == "Rook" or destination_square.piece.name == "Queen") and are_colors_opposite(destination_square):
-                return True
-
-            if are_colors_same(destination_square):
-                break
-
-            if destination_square.piece.name in ["Bishop", "Knight", "Pawn", "King"]:
-                break
-
-        # Check along vertcial 
-        for x in range(X+1, 8):
-            destination_square = self._chessboard[x][Y]
-
-            if x==X+1 and destination_square.piece.name == "King" and are_colors_opposite(destination_square):
-                return True
-
-            if (destination_square.piece.name == "Rook" or destination_square.piece.name == "Queen") and are_colors_opposite(destination_square):
-                return True
-
-            if are_colors_same(destination_square):
-                break
-
-            if destination_square.piece.name in ["Bishop", "Knight", "Pawn", "King"]:
-                break
-
-        for x in range(X-1, -1, -1):
-            destination_square = self._chessboard[x][Y]
-
-            if x==X-1 and destination_square.piece.name == "King" and are_colors_opposite(destination_square):
-                return True
-
-            if (destination_square.piece.name == "Rook" or destination_square.piece.name == "Queen") and are_colors_opposite(destination_square):
-                return True
-
-            if are_colors_same(destination_square):
-                break
-
-            if destination_square.piece.name in ["Bishop", "Knight", "Pawn", "King"]:
-                break
-
-        # Check on a1-h8 diagonal
-        x = X-1
-        y = Y+1
-        while x>=0 and y<=7:
-            destination_square = self._chessboard[x][y]
-
-            if x==X-1 and y==Y+1:
-                if destination_square.piece.name == "King" and are_colors_opposite(destination_square):
-                    return True
-
-                if piece_color == "white" and destination_square.piece.name == "Pawn" and are_colors_opposite(destination_square):
-                    return True
-
-            if (destination_square.piece.name == "Bishop" or destination_square.piece.name == "Queen") and are_colors_opposite(destination_square):
-                return True
-
-            if are_colors_same(destination_square):
-                break
-
-            if destination_square.piece.name in ["Rook", "Knight", "Pawn", "King"]:
-                break
-            
-            x -= 1
-            y += 1
-
-        x = X+1
-        y = Y-1
-        while x<=7 and y>=0:
-            destination_square = self._chessboard[x][y]
-
-            if x==X+1 and y==Y-1:
-                if destination_square.piece.name == "King" and are_colors_opposite(destination_square):
-                    return True
-
-                if piece_color == "black" and destination_square.piece.name == "Pawn" and are_colors_opposite(destination_square):
-                    return True
-
-            if (destination_square.piece.name == "Bishop" or destination_square.piece.name == "Queen") and are_colors_opposite(destination_square):
-                return True
-
-            if are_colors_same(destination_square):
-                break
-
-            if destination_square.piece.name in ["Rook", "Knight", "Pawn", "King"]:
-                break
-            
-            x += 1
-            y -= 1
-
-        # Check on a8-h1 diagonal
-        x = X-1
-        y = Y-1
-        while x>=0 and y>=0:
-            destination_square = self._chessboard[x][y]
-
-            if x==X-1 and y==Y-1:
-                if destination_square.piece.name == "King" and are_colors_opposite(destination_square):
-                    return True
-
-                if piece_color == "white" and destination_square.piece.name == "Pawn" and are_colors_opposite(destination_square):
-                    return True
-
-            if (destination_square.piece.name == "Bishop" or destination_square.piece.name == "Queen") and are_colors_opposite(destination_square):
-                return True
-
-            if are_colors_same(destination_square):
-                break
-
-            if destination_square.piece.name in ["Rook", "Knight", "Pawn", "King"]:
-                break
-            
-            x -= 1
-            y -= 1
-
-        x = X+1
-        y = Y+1
-        while x<=7 and y<=7:
-            destination_square = self._chessboard[x][y]
-
-            if x==X+1 and y==Y+1:
-                if destination_square.piece.name == "King" and are_colors_opposite(destination_square):
-                    return True
-
-                if piece_color == "black" and destination_square.piece.name == "Pawn" and are_colors_opposite(destination_square):
-                    return True
-
-            if (destination_square.piece.name == "Bishop" or destination_square.piece.name == "Queen") and are_colors_opposite(destination_square):
-                return True
-
-            if are_colors_same(destination_square):
-                break
-
-            if destination_square.piece.name in ["Rook", "Knight", "Pawn", "King"]:
-                break
-            
-            x += 1
-            y += 1
-
-        # Check skew positions
-        possible_skew_moves = [(2, 1), (-2, 1), (2, -1), (-2, -1), (1, 2), (-1, 2), (1, -2), (-1, -2)]
-        for move in possible_skew_moves:
-            if X+move[0] <=7 and X+move[0]>=0 and Y+move[1] <= 7 and Y+move[1]>=0:
-                destination_square = self._chessboard[X+move[0]][Y+move[1]]
-
-                if destination_square.piece.name == "Knight" and are_colors_opposite(destination_square):
-                    return True
-
-        return False
+        attacker_color = bitboard.COLORS[piece_color] ^ 1
+        return self._attack_map.is_attacked(bitboard.SQUARES[square], attacker_color)
 
     # This method changes the current state of board, i.e modifies id's and classes of 
     # class members of Sqaure class and also change the values of chessboard array.
     def change_chessboard_state(self, initial_pos, final_pos):
-        obj = self.convert_to_index(initial_pos)
-        #temporarily delete piece from pieces object
-        if obj.piece.name!="Blank":
-            self._pieces[obj.piece.color][obj.piece.name].remove(initial_pos)
-        temp_piece = obj.piece
-        obj.piece = Blank(initial_pos)
-        obj.html_class = obj.html_class.strip("white-Kwhite-Qwhite-Rwhite-Bwhite-Nwhite-pblack-Kblack-Qblack-Rblack-Bblack-Nblack-p")
-        obj.html_class += " " + obj.piece.label
-        obj.css = """<td><div class="{html_class}" id="{html_id}"></div></td>""".format(
-            html_class = obj.html_class,
-            html_id = obj.html_id
-        )
-        self._changes.append({'pos': initial_pos, 'class': obj.html_class})
-        obj = self.convert_to_index(final_pos)
-        if obj.piece.name != "Blank":
-            self._pieces[obj.piece.color][obj.piece.name].remove(final_pos)
-        obj.html_class = obj.html_class.strip("white-Kwhite-Qwhite-Rwhite-Bwhite-Nwhite-pblack-Kblack-Qblack-Rblack-Bblack-Nblack-pnone_-")
-        obj.piece = temp_piece
-        obj.html_class += " " + obj.piece.label
-        obj.css = """<td><div class="{html_class}" id="{html_id}"></div></td>""".format(
-            html_class = obj.html_class,
-            html_id = obj.html_id
-        )
-        # Add the deleted piece back to pieces object
-        if obj.piece.name!="Blank":
-            self._pieces[obj.piece.color][obj.piece.name].append(final_pos)
-        self._changes.append({'pos': final_pos, 'class': obj.html_class})
+        initial_square = bitboard.SQUARES[initial_pos]
+        final_square = bitboard.SQUARES[final_pos]
+        piece = self._position.remove_piece(initial_square)
+        self._position.remove_piece(final_square)
+        if piece is not None:
+            self._position.put_piece(final_square, *piece)
+        self._attack_map.update(self._position, initial_square)
+        self._attack_map.update(self._position, final_square)
+        self._invalidate_status()
+        self._changes.append(initial_square)
+        self._changes.append(final_square)
 
     def get_state(self):
         state = self._states.get_active_branch()
@@ -951,19 +1006,84 @@ class Chessboard:
     def set_state(self, branch_id, current_state):
         self._states.set_branch(branch_id, current_state)
 
+    # Navigating plays or takes back the move of a single state on the bitboards and
+    # returns the changed squares like make_move, or None if there's no such state
     def get_next_state(self, branch_id=0):
-        state = self._states.get_next_state(branch_id)
-        # self._states.print_state()
-        if state[1]:
-            self.reset_chessboard(fen_notation=state[0])
-        return state[1]
+        if not self._states.get_next_state(branch_id):
+            return None
+        node = self._states.get_active_branch()
+        move = node.get_played()
+        if move is None:
+            return self._load_state(node)
+        squares = self._position.touched_squares(move)
+        if node.get_undo() is None:
+            node.set_undo(self._position.undo_info(move))
+        self._position.push(move)
+        self._moves += 1
+        return self._step_to_state(node, squares)
 
     def get_prev_state(self):
-        state = self._states.get_prev_state()
-        # self._states.print_state()
-        if state[1]:
-            self.reset_chessboard(fen_notation=state[0])
-        return state[1]
+        child = self._states.get_active_branch()
+        if not self._states.get_prev_state():
+            return None
+        node = self._states.get_active_branch()
+        move, undo = child.get_played(), child.get_undo()
+        if move is None:
+            return self._load_state(node)
+        if undo is None:
+            # The undo record of a move read from a story comes from the fen it was played from
+            undo = fen.parse_fen(node.get_fen()).position.undo_info(move)
+            child.set_undo(undo)
+        self._position.unpush(move, undo, node.get_key())
+        self._moves -= 1
+        return self._step_to_state(node, self._position.touched_squares(move))
+
+    # Brings the rest of the board in line with the bitboards after a move was played
+    # or taken back on them
+    def _step_to_state(self, node, squares):
+        position = self._position
+        self._attack_map.update_squares(position, squares)
+        self._set_castling_rights(fen.castling_fen(position.castling))
+        if position.ep_square is not None:
+            self._enpassant_target_square = bitboard.SQUARE_NAMES[position.ep_square]
+            self._enpassant_flag_life = 1
+        else:
+            self._enpassant_target_square = None
+            self._enpassant_flag_life = 0
+        self._half_moves = position.halfmove_clock
+        self._sync_position()
+        self._load_repetitions(node)
+        return self._square_changes(squares)
+
+    # States whose move isn't known are loaded from their fen
+    def _load_state(self, node):
+        board = list(self._position.board)
+        self.reset_chessboard(fen_notation=node.get_fen())
+        self._load_repetitions(node)
+        return self._square_changes([square for square in range(64) if board[square] != self._position.board[square]])
+
+    # Counts positions along the path to the node since the last capture or pawn move
+    def _load_repetitions(self, node):
+        self._repetitions = {}
+        for _ in range(self._half_moves + 1):
+            if node is None:
+                break
+            key = node.get_key()
+            if key is not None:
+                self._repetitions[key] = self._repetitions.get(key, 0) + 1
+            node = node._parent_node
+        if not self._repetitions:
+            self._repetitions[self.position_key] = 1
+
+    # Html classes of the given squares, marking kings in check. Checks are read off
+    # the attack map so that navigating doesn't generate the moves of every state.
+    def _square_changes(self, squares):
+        checked_kings = []
+        for color in (bitboard.WHITE, bitboard.BLACK):
+            king = self._position.king_square(color)
+            if king is not None and self._attack_map.is_attacked(king, color ^ 1):
+                checked_kings.append(king)
+        return board_view.square_changes(self._position, squares, checked_kings)
 
     def get_move_english_notation(self, piece_name, dest_piece, initial_pos, final_pos, queening=None):
         move = ''
@@ -986,47 +1106,62 @@ class Chessboard:
             move += "=" + queening
 
         # Add # if it's checkmate
-        if self._game_status[0] and self._game_status[1]=="checkmate":
+        game_status = self.fetch_game_status()
+        if game_status[0] and game_status[1]=="checkmate":
             move += "#"
-        elif self._in_check[self._moves%2]:
+        elif self.in_check(self._moves%2):
             move += "+"
 
         return move
 
-    def make_move(self, initial_pos, final_pos, dest_piece=None):
+    # Fifty move and threefold repetition draws are claimed as soon as they come up,
+    # unless claim_draws is False
+    def make_move(self, initial_pos, final_pos, dest_piece=None, claim_draws=True):
 
         if self.is_checkmate:
             raise Checkmate(self._moves%2)
 
-        draw = self.is_draw()
+        draw = self.is_draw() if claim_draws else self.is_automatic_draw()
         if draw[0]:
             raise Draw(draw[1])
 
         piece_name = self.convert_to_index(initial_pos).piece.name
         cap_piece = self.convert_to_index(final_pos).piece.name
+        # Enpassant captures a pawn that isn't on the final square
+        if piece_name == "Pawn" and final_pos == self._enpassant_target_square:
+            cap_piece = "Pawn"
 
         color = "white" if self._moves%2==0 else "black"
         if self.convert_to_index(initial_pos).piece.color!=color:
             raise SideNotAuthorizedToMakeMove()
 
         del self._changes[:]
+        undo = self._position.undo_info(bitboard.encode_move(bitboard.SQUARES[initial_pos], bitboard.SQUARES[final_pos]))
+        enpassant_target_square = self._enpassant_target_square
         self.make_move_private(initial_pos, final_pos, dest_piece)
         self._moves += 1
-        if self._enpassant_flag_life >= 1:
+        # An enpassant target only lives for a single move
+        if self._enpassant_target_square == enpassant_target_square:
             self._enpassant_flag_life = 0
             self._enpassant_target_square = None
-        elif self._enpassant_target_square:
-            self._enpassant_flag_life += 1
-
-        self._fetch_game_status()
+        else:
+            self._enpassant_flag_life = 1
+        self._sync_position()
+        self._record_repetition()
 
         # Parse move data and store it
         move = self.get_move_english_notation(piece_name, cap_piece, initial_pos, final_pos, dest_piece)
         
-        self._states.create_branch(self.fen_notation, move)
-        # self._states.print_state()
+        # Store the move itself so states can be navigated and replayed without their fen
+        from_square, to_square = bitboard.SQUARES[initial_pos], bitboard.SQUARES[final_pos]
+        promotion = self._position.board[to_square][1] if piece_name == "Pawn" else 0
+        played = bitboard.encode_move(from_square, to_square, promotion if promotion != bitboard.PAWN else 0)
+        self._states.create_branch(lambda: self.fen_notation, move, self.position_key, played, undo)
+
+        squares = list(dict.fromkeys(self._changes))
 
-        return self._changes
+        # Status of the new position is computed only once
+        return self._square_changes(squares)
 
     def make_move_private(self, initial_pos, final_pos, dest_piece):
         if initial_pos==final_pos:
@@ -1072,7 +1207,7 @@ class Chessboard:
                 fin_index = self.return_index_as_tuple(final_pos)
                 diagonal_flag = abs(ini_index[0]-fin_index[0]) & abs(ini_index[1]-fin_index[1])
                 # enpassant
-                if self._enpassant_target_square is not None and diagonal_flag:
+                if self._enpassant_target_square == final_pos and diagonal_flag:
                     # Black attacked pawn -> 6, white attacked pawn -> 3
                     if self._enpassant_target_square[1]=="6":
                         direction = -1
@@ -1088,7 +1223,7 @@ class Chessboard:
                     piece = config.CHESS_PIECE_CLASS.get(dest_piece, None)[0]
                     if dest_piece in "QRNB":
                         self.delete_piece(initial_pos)
-                        self.convert_to_index(initial_pos).piece = self.create_piece(initial_pos, piece, color)
+                        self.create_piece(initial_pos, piece, color)
                     else:
                         raise InvalidMoveError("Invalid Promotion")
                 self.change_chessboard_state(initial_pos, final_pos)
@@ -1097,193 +1232,29 @@ class Chessboard:
         else:
             raise InvalidMoveError("Invalid Move played", initial_pos, final_pos)
 
-        white_king = self._pieces["white"]["King"][0]
-        if (self.is_square_under_attack(white_king)):
-            self._changes.append({'pos': white_king, 'class': self.convert_to_index(white_king).html_class + ' check'})
-            self._in_check[0] = True
-        else:
-            self._in_check[0] = False
-
-        black_king = self._pieces["black"]["King"][0]
-        if (self.is_square_under_attack(black_king)):
-            self._changes.append({'pos': black_king, 'class': self.convert_to_index(black_king).html_class + ' check'})
-            self._in_check[1] = True
-        else:
-            self._in_check[1] = False
-
-    def move_top(self, initial_pos, limit=10):
-        def cond(X, Y, limit):
-            return X<=7 and X>0 and limit>0
-        return self.move(initial_pos, -1, 0, cond, limit)
-
-    def move_bottom(self, initial_pos, limit=10):
-        def cond(X, Y, limit):
-            return X<7 and X>=0 and limit>0
-        return self.move(initial_pos, 1, 0, cond, limit)
-
-    def move_left(self, initial_pos, limit=10):
-        def cond(X, Y, limit):
-            return Y<=7 and Y>0 and limit>0
-        return self.move(initial_pos, 0, -1, cond, limit)
-
-    def move_right(self, initial_pos, limit=10):
-        def cond(X, Y, limit):
-            return Y<7 and Y>=0 and limit>0
-        return self.move(initial_pos, 0, 1, cond, limit)
-
-    def move_top_right(self, initial_pos, limit=10):
-        def cond(X, Y, limit):
-            return X<=7 and X>0 and Y<7 and Y>=0 and limit>0
-        return self.move(initial_pos, -1, 1, cond, limit)
-
-    def move_bottom_right(self, initial_pos, limit=10):
-        def cond(X, Y, limit):
-            return X<7 and X>=0 and Y<7 and Y>=0 and limit>0
-        return self.move(initial_pos, 1, 1, cond, limit)
-
-    def move_top_left(self, initial_pos, limit=10):
-        def cond(X, Y, limit):
-            return Y<=7 and Y>0 and X<=7 and X>0 and limit>0
-        return self.move(initial_pos, -1, -1, cond, limit)
-
-    def move_bottom_left(self, initial_pos, limit=10):
-        def cond(X, Y, limit):
-            return Y<=7 and Y>0 and X<7 and X>=0 and limit>0
-        return self.move(initial_pos, 1, -1, cond, limit)
-
-    def move(self, initial_pos, diffX, diffY, cond, limit=10):
-        indexes = self.return_index_as_tuple(initial_pos)
-        X, Y = indexes[0], indexes[1]
-        init_piece_color = self._chessboard[X][Y].piece.color
-        move_list = []
-        while cond(X, Y, limit):
-            Y += diffY
-            X += diffX
-            if self._chessboard[X][Y].piece.color == init_piece_color and init_piece_color != "none":
-                break
-            if self._chessboard[X][Y].piece.color != "none":
-                move_list.append(self._chessboard[X][Y].html_id)
-                break
-            move_list.append(self._chessboard[X][Y].html_id)
-            limit -= 1
-        return move_list
-
-    def make_diagonal_moves(self, initial_pos, limit=10):
-        move_list = []
-        move_list += self.move_bottom_left(initial_pos, limit=limit) + self.move_bottom_right(initial_pos, limit=limit) + self.move_top_left(initial_pos, limit=limit) + self.move_top_right(initial_pos, limit=limit)
-        return move_list 
-
-    def make_orthogonal_moves(self, initial_pos, limit=10):
-        move_list = []
-        move_list += self.move_left(initial_pos, limit=limit) + self.move_right(initial_pos, limit=limit) + self.move_top(initial_pos, limit=limit) + self.move_bottom(initial_pos, limit=limit)
-        return move_list
-
-    # This could be optimised by excluding the need to check colors!
-    def generate_pawn_moves(self, initial_pos):
-        move_list = []
-        indexes = self.return_index_as_tuple(initial_pos)
-        X, Y = indexes[0], indexes[1]
-        tempX, tempY = X, Y
-        piece_color = self.convert_to_index(initial_pos).piece.color
-        if piece_color == "white":
-            if int(self.convert_to_index(initial_pos).html_id[1])==2:
-                limit=2
-            else:
-                limit=1
-            while tempX<=7 and tempX>0 and limit>0:
-                tempX -= 1
-                if self._chessboard[tempX][tempY].piece.color !="none":
-                    break
-                move_list.append(self._chessboard[tempX][tempY].html_id)
-                limit -= 1
-            # check for captures at top-right and top-left
-            if X-1>=0 and Y+1<=7:
-                if self._enpassant_target_square==self._chessboard[X-1][Y+1].html_id:
-                    move_list.append(self._enpassant_target_square)
-                elif self._chessboard[X-1][Y+1].piece.color == "black":
-                    move_list.append(self._chessboard[X-1][Y+1].html_id)
-            if X-1>=0 and Y-1>=0:
-                if self._enpassant_target_square==self._chessboard[X-1][Y-1].html_id:
-                    move_list.append(self._enpassant_target_square)
-                elif self._chessboard[X-1][Y-1].piece.color == "black":
-                    move_list.append(self._chessboard[X-1][Y-1].html_id)
-        else:
-            if int(self.convert_to_index(initial_pos).html_id[1])==7:
-                limit=2
-            else:
-                limit=1
-            while tempX<7 and tempX>=0 and limit>0:
-                tempX += 1
-                if self._chessboard[tempX][tempY].piece.color !="none":
-                    break
-                move_list.append(self._chessboard[tempX][tempY].html_id)
-                limit -= 1
-            # check for captures at bottom-right and bottom-left
-            if X+1<=7 and Y-1>=0:
-                if self._enpassant_target_square==self._chessboard[X+1][Y-1].html_id:
-                    move_list.append(self._enpassant_target_square)
-                elif self._chessboard[X+1][Y-1].piece.color == "white":
-                    move_list.append(self._chessboard[X+1][Y-1].html_id)
-            if X+1<=7 and Y+1<=7:
-                if self._enpassant_target_square==self._chessboard[X+1][Y+1].html_id:
-                    move_list.append(self._enpassant_target_square)
-                elif self._chessboard[X+1][Y+1].piece.color == "white":
-                    move_list.append(self._chessboard[X+1][Y+1].html_id)
-        return move_list
-
-    def generate_knight_moves(self, initial_pos):
-        move_list = []
-        possible_skew_moves = [(2, 1), (-2, 1), (2, -1), (-2, -1), (1, 2), (-1, 2), (1, -2), (-1, -2)]
-        indexes = self.return_index_as_tuple(initial_pos)
-        X, Y = indexes[0], indexes[1]
-        for move in possible_skew_moves:
-            if X+move[0] <=7 and X+move[0]>=0 and Y+move[1] <= 7 and Y+move[1]>=0:
-                if self._chessboard[X+move[0]][Y+move[1]].piece.color != self.convert_to_index(initial_pos).piece.color:
-                    move_list.append(self._chessboard[X+move[0]][Y+move[1]].html_id)
-        return move_list
-
     def special_king_moves(self, initial_pos):
-        move_list = []
-        indexes = self.return_index_as_tuple(initial_pos)
-        X, Y = indexes[0], indexes[1]
-        # Check for special king moves!
-        if self.convert_to_index(initial_pos).piece.label.split('-')[1]=="K":
-            if self.can_white_castle and self.convert_to_index(initial_pos).piece.color=="white":
-                # King side castle
-                if initial_pos=="e1" and self._castling_rights_white["has_h1_rook_moved"] is not True:
-                    if self._chessboard[X][Y+1].piece.color=="none" and self._chessboard[X][Y+2].piece.color=="none" and not self.is_square_under_attack("f1", "white"):
-                        move_list.append("g1")
-                # Queen side castle
-                if initial_pos=="e1" and self._castling_rights_white["has_a1_rook_moved"] is not True:
-                    if self._chessboard[X][Y-1].piece.color=="none" and self._chessboard[X][Y-2].piece.color=="none" and not self.is_square_under_attack("d1", "white"):
-                        move_list.append("c1")
-            if self.can_black_castle and self.convert_to_index(initial_pos).piece.color=="black":
-                # King side castle
-                if initial_pos=="e8" and self._castling_rights_black["has_h8_rook_moved"] is not True:
-                    if self._chessboard[X][Y+1].piece.color=="none" and self._chessboard[X][Y+2].piece.color=="none" and not self.is_square_under_attack("f8", "black"):
-                        move_list.append("g8")
-                # Queen side castle
-                if initial_pos=="e8" and self._castling_rights_black["has_a8_rook_moved"] is not True:
-                    if self._chessboard[X][Y-1].piece.color=="none" and self._chessboard[X][Y-2].piece.color=="none" and not self.is_square_under_attack("d8", "black"):
-                        move_list.append("c8")
-        return move_list
+        square = bitboard.SQUARES[initial_pos]
+        moves = self._position.generate_castling_moves(bitboard.BB_SQUARES[square])
+        return [bitboard.SQUARE_NAMES[bitboard.move_to_square(move)] for move in moves if self._position.is_legal(move)]
 
     # Sets flags such as of castling rights, enpassant
     def set_flags(self, initial_pos, final_pos):
         # Set Enpassant Flags
-        indexes = self.return_index_as_tuple(final_pos)
-        old_indexes = self.return_index_as_tuple(initial_pos)
-        X, Y = indexes[0], indexes[1]
-        oX, oY = old_indexes[0], old_indexes[1]
+        Y = self.return_index_as_tuple(final_pos)[1]
         if self.convert_to_index(initial_pos).piece.label.split('-')[1]=="p":
             if abs(int(final_pos[1])-int(initial_pos[1]))==2:
                 direction = (int(final_pos[1])-int(initial_pos[1]))//2
+                square = bitboard.SQUARES[final_pos]
+                moving_color = self.convert_to_index(initial_pos).piece.color
+                target_square = bitboard.SQUARE_NAMES[square - direction*8]
                 if Y+1<=7:
-                    if self._chessboard[X][Y+1].piece.label.split('-')[1]=='p' and self._chessboard[oX][oY].piece.color!=self._chessboard[X][Y+1].piece.color:
-                        self._enpassant_target_square = self._chessboard[X+direction][Y].html_id
+                    neighbour = self.piece_at(square + 1)
+                    if neighbour.name=='Pawn' and moving_color!=neighbour.color:
+                        self._enpassant_target_square = target_square
                 if Y-1>=0:
-                    if self._chessboard[X][Y-1].piece.label.split('-')[1]=='p' and self._chessboard[oX][oY].piece.color!=self._chessboard[X][Y-1].piece.color:
-                        self._enpassant_target_square = self._chessboard[X+direction][Y].html_id
+                    neighbour = self.piece_at(square - 1)
+                    if neighbour.name=='Pawn' and moving_color!=neighbour.color:
+                        self._enpassant_target_square = target_square
 
         # Set Castling Flags
         if self.can_white_castle and self.convert_to_index(initial_pos).piece.color=="white":
@@ -1307,7 +1278,17 @@ class Chessboard:
                     self._castling_rights_black["has_a8_rook_moved"] = True
                 elif initial_pos=="h8":
                     self._castling_rights_black["has_h8_rook_moved"] = True
-            
+
+        # A rook captured on its starting square can no longer castle
+        if final_pos=="a1":
+            self._castling_rights_white["has_a1_rook_moved"] = True
+        elif final_pos=="h1":
+            self._castling_rights_white["has_h1_rook_moved"] = True
+        elif final_pos=="a8":
+            self._castling_rights_black["has_a8_rook_moved"] = True
+        elif final_pos=="h8":
+            self._castling_rights_black["has_h8_rook_moved"] = True
+
     def is_move_legal(self, initial_pos, final_pos):
         # Will make use of generate legal move only.
         if final_pos in self.generate_legal_moves(initial_pos):
@@ -1315,37 +1296,32 @@ class Chessboard:
             return True
         return False
 
-    def make_temp_move(self, initial_pos, final_pos):    
-        color = "white" if self._moves%2==0 else "black"
-
-        initial_piece = self.convert_to_index(initial_pos).piece
-        final_piece = self.convert_to_index(final_pos).piece
-
-        self.convert_to_index(initial_pos).piece = self.create_piece(initial_pos, "Blank")
-        self.convert_to_index(final_pos).piece = initial_piece
-
-        initial_index = self._pieces[initial_piece.color][initial_piece.name].index(initial_pos)
-
-        self._pieces[initial_piece.color][initial_piece.name].remove(initial_pos)
-        self._pieces[initial_piece.color][initial_piece.name].append(final_pos)
-        if final_piece.name != "Blank":
-            self._pieces[final_piece.color][final_piece.name].remove(final_pos)
-
-        def reset_pos():
-            self.convert_to_index(initial_pos).piece = initial_piece
-            self.convert_to_index(final_pos).piece = final_piece
-            self._pieces[initial_piece.color][initial_piece.name].remove(final_pos)
-            self._pieces[initial_piece.color][initial_piece.name].insert(initial_index, initial_pos)
-            if final_piece.name != "Blank":
-                self._pieces[final_piece.color][final_piece.name].append(final_pos)
-
-        if self.is_square_under_attack(self._pieces[color]["King"][0]):
-            reset_pos()
-            return True
-        else:
-            reset_pos()
-            return False
-
+    # Returns True if the move leaves own king in check
+    def make_temp_move(self, initial_pos, final_pos):
+        move = bitboard.encode_move(bitboard.SQUARES[initial_pos], bitboard.SQUARES[final_pos])
+        return not self._position.is_legal(move)
+
+    def _enpassant_square_index(self):
+        if self._enpassant_target_square is None:
+            return None
+        return bitboard.SQUARES[self._enpassant_target_square]
+
+    # Positions before a capture or a pawn move can never occur again
+    def _record_repetition(self):
+        if self._half_moves == 0:
+            self._repetitions.clear()
+        key = self.position_key
+        self._repetitions[key] = self._repetitions.get(key, 0) + 1
+
+    # Copies side to move, castling rights, enpassant square and half move clock to the bitboards
+    def _sync_position(self):
+        self._position.set_state(
+            self._moves % 2,
+            bitboard.castling_mask(self.castling_rights),
+            self._enpassant_square_index(),
+            self._half_moves,
+        )
+        self._invalidate_status()
 
     def generate_legal_moves(self, initial_pos):
 
@@ -1354,26 +1330,10 @@ class Chessboard:
         if self.convert_to_index(initial_pos).piece.color!=color:
             raise SideNotAuthorizedToMakeMove()
 
-        piece_label = self.convert_to_index(initial_pos).piece.label.split('-')[1]
-        moveList = []
-        if piece_label=="K":
-            moveList = self.make_orthogonal_moves(initial_pos, limit=1) + self.make_diagonal_moves(initial_pos, limit=1)
-        elif piece_label=="Q":
-            moveList = self.make_diagonal_moves(initial_pos) + self.make_orthogonal_moves(initial_pos)
-        elif piece_label=="R":
-            moveList = self.make_orthogonal_moves(initial_pos)
-        elif piece_label=="B":
-            moveList = self.make_diagonal_moves(initial_pos)
-        elif piece_label=="N":
-            moveList = self.generate_knight_moves(initial_pos)
-        elif piece_label=="p":
-            moveList = self.generate_pawn_moves(initial_pos)
-        else:
-            moveList += []
-
-        if not self.is_square_under_attack(self._pieces[color]["King"][0]) and piece_label=="K":
-            moveList += self.special_king_moves(initial_pos)
-
-        moveList[:] = [move for move in moveList if not self.make_temp_move(initial_pos, move)]
+        return list(self._position_status().legal_moves.get(initial_pos, []))
 
-        return moveList
\ No newline at end of file
+    # Legal moves of the side to move as {initial_pos: [final_pos, ...]}, eg->
+    # {'e2': ['e3', 'e4'], 'g1': ['f3', 'h3'], ...}. It's computed once per position
+    # and sent along with every move so clients can highlight squares without asking.
+    def generate_all_legal_moves(self):
+        return {square: list(moves) for square, moves in self._position_status().legal_moves.items()}
@@ -0,0 +1,169 @@
+# Differential testing of the Chessboard against python-chess.
+#
+# Random games, drawn from a seed so that any failure can be replayed, are played
+# through both a Chessboard and a chess.Board. After every ply the legal moves,
+# the fen, the check, mate and draw verdicts and the notation of the move played
+# are compared, and the first difference of a game is reported. The same games
+# are then replayed through each engine alone to compare their speed.
+#
+# Notation is compared after bringing python-chess's SAN to the style of
+# Chessboard.get_move_english_notation, which writes castling as 0-0 and doesn't
+# disambiguate pieces, eg-> "Nbd7" is compared as "Nd7". Fens are compared with
+# python-chess's xfen enpassant field, which like the Chessboard only names the
+# enpassant square when a pawn stands next to the one that moved.
+
+import random
+import re as regex
+import time
+
+import chess
+
+from .chessboard import Chessboard
+from .perft import PERFT_POSITIONS
+from .exceptions import Checkmate, Draw
+
+START_POSITIONS = [chess.STARTING_FEN] + [position["fen"] for position in PERFT_POSITIONS]
+
+DISAMBIGUATION_REGEX = regex.compile(r"^([NBRQK])[a-h]?[1-8]?(x?[a-h][1-8])")
+
+def english_notation(san):
+    san = san.replace("O", "0")
+    return DISAMBIGUATION_REGEX.sub(r"\1\2", san)
+
+# Moves of a chess.Board in the {from: [to]} format of Chessboard.generate_all_legal_moves
+def legal_move_map(board):
+    moves = {}
+    for move in board.legal_moves:
+        targets = moves.setdefault(chess.square_name(move.from_square), [])
+        to_square = chess.square_name(move.to_square)
+        if to_square not in targets:
+            targets.append(to_square)
+    return moves
+
+def _sorted_map(moves):
+    return {square: sorted(targets) for square, targets in moves.items()}
+
+# Verdicts on a position, as (check, checkmate, stalemate, insufficient material,
+# fifty move, threefold repetition)
+def chessboard_status(chessboard):
+    return (
+        chessboard.in_check(chessboard._moves % 2),
+        chessboard.is_checkmate,
+        chessboard.stalemate,
+        chessboard.insufficent_material,
+        chessboard.fifty_move,
+        chessboard.threefold_repetition,
+    )
+
+def board_status(board):
+    return (
+        board.is_check(),
+        board.is_checkmate(),
+        board.is_stalemate(),
+        board.is_insufficient_material(),
+        board.halfmove_clock >= 100,
+        board.is_repetition(3),
+    )
+
+# Differences between the two engines on the current position, as (kind, ours, theirs)
+def compare_position(chessboard, board):
+    differences = []
+    ours, theirs = _sorted_map(chessboard.generate_all_legal_moves()), _sorted_map(legal_move_map(board))
+    if ours != theirs:
+        differences.append(("legal moves", ours, theirs))
+    if chessboard.fen_notation != board.fen(en_passant="xfen"):
+        differences.append(("fen", chessboard.fen_notation, board.fen(en_passant="xfen")))
+    if chessboard_status(chessboard) != board_status(board):
+        differences.append(("status", chessboard_status(chessboard), board_status(board)))
+    return differences
+
+def _game_over(board):
+    return board.is_game_over() or board.halfmove_clock >= 100 or board.is_repetition(3)
+
+# Random game from a seed, as the start fen and the list of chess.Move played
+def random_game(seed, plies=200):
+    rng = random.Random(seed)
+    start = rng.choice(START_POSITIONS)
+    board = chess.Board(start)
+    moves = []
+    while len(moves) < plies and not _game_over(board):
+        move = rng.choice(sorted(board.legal_moves, key=lambda move: move.uci()))
+        moves.append(move)
+        board.push(move)
+    return start, moves
+
+def _play(chessboard, move):
+    promotion = chess.piece_symbol(move.promotion).upper() if move.promotion else None
+    chessboard.make_move(chess.square_name(move.from_square), chess.square_name(move.to_square), promotion)
+
+# First difference of a seeded game as a dict, None if both engines agree all along
+def compare_game(seed, plies=200):
+    start, moves = random_game(seed, plies)
+    chessboard = Chessboard(start)
+    board = chess.Board(start)
+
+    def difference(ply, kind, ours, theirs):
+        return {"seed": seed, "ply": ply, "fen": board.fen(), "kind": kind, "ours": ours, "theirs": theirs}
+
+    for kind, ours, theirs in compare_position(chessboard, board):
+        return difference(0, kind, ours, theirs)
+    for ply, move in enumerate(moves, 1):
+        san = english_notation(board.san(move))
+        fen_before = board.fen()
+        try:
+            _play(chessboard, move)
+        except (Checkmate, Draw) as error:
+            return difference(ply, "game over", type(error).__name__, None)
+        except Exception as error:
+            return difference(ply, "error", repr(error), move.uci())
+        board.push(move)
+        if chessboard.get_state()["move"] != san:
+            result = difference(ply, "notation", chessboard.get_state()["move"], san)
+            result["fen"] = fen_before
+            return result
+        for kind, ours, theirs in compare_position(chessboard, board):
+            return difference(ply, kind, ours, theirs)
+    return None
+
+# Plies per second of each engine replaying games and asking what a game needs after
+# every move: the legal moves, the fen and the status
+def measure_throughput(games):
+    plies = sum(len(moves) for _, moves in games)
+
+    start_time = time.perf_counter()
+    for start, moves in games:
+        chessboard = Chessboard(start)
+        for move in moves:
+            _play(chessboard, move)
+            chessboard.generate_all_legal_moves()
+            chessboard.fen_notation
+            chessboard.fetch_game_status()
+    ours = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for start, moves in games:
+        board = chess.Board(start)
+        for move in moves:
+            board.san(move)
+            board.push(move)
+            legal_move_map(board)
+            board.fen(en_passant="xfen")
+            board_status(board)
+    theirs = time.perf_counter() - start_time
+
+    return {
+        "plies": plies,
+        "chessboard": int(plies / ours) if ours else 0,
+        "python-chess": int(plies / theirs) if theirs else 0,
+    }
+
+# Plays games from consecutive seeds through both engines, returns the differences
+# found and the throughput of each engine
+def run_fuzz(games=100, seed=0, plies=200):
+    differences = []
+    for game_seed in range(seed, seed + games):
+        result = compare_game(game_seed, plies)
+        if result is not None:
+            differences.append(result)
+    throughput = measure_throughput([random_game(game_seed, plies) for game_seed in range(seed, seed + games)])
+    return differences, throughput
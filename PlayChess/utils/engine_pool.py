@@ -0,0 +1,197 @@
+# Pool of long lived Stockfish processes for engine evaluations.
+#
+# Starting Stockfish and waiting for it to be ready takes longer than a quick
+# search, so the processes are kept running and handed out to one request at a
+# time. A request checks an engine out, runs its searches and checks it back in;
+# when every engine is busy it waits in line for one instead of starting another.
+# Every checkout starts a new game for the engine (ucinewgame), so nothing learnt
+# from a previous request leaks into the next one. An engine that crashes, errors
+# or doesn't answer in time is killed and replaced by a fresh one on next use.
+
+import asyncio
+import atexit
+import concurrent.futures
+import contextlib
+import os
+import queue
+import threading
+
+import chess.engine
+
+from .exceptions import EngineUnavailable
+from .. import config
+
+# Failures after which an engine can't be trusted anymore
+ENGINE_ERRORS = (
+    chess.engine.EngineError,
+    chess.engine.EngineTerminatedError,
+    asyncio.TimeoutError,
+    concurrent.futures.TimeoutError,
+    TimeoutError,
+)
+
+# Path of the Stockfish binary shipped with the api
+def engine_path():
+    filename = 'stockfish-prod' if os.environ.get("Production", False) else 'stockfish-dev'
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'api', filename)
+
+# A line of an engine search as json, eg->
+# {"move": "e2e4", "evaluation": "+31", "depth": 20, "pv": ["e2e4", "e7e5"], "nodes": 412000}
+def line_result(info):
+    pv = info.get("pv", [])
+    return {
+        "move": pv[0].uci() if pv else None,
+        "evaluation": str(info["score"].white()) if "score" in info else None,
+        "depth": info.get("depth"),
+        "pv": [move.uci() for move in pv],
+        "nodes": info.get("nodes"),
+    }
+
+# Result of a search from the infos of its lines, the best line first. The best move
+# and the move expected in reply are those of the best line, which are what play
+# would have answered.
+def search_result(infos):
+    lines = [line_result(info) for info in infos]
+    best = lines[0] if lines else line_result({})
+    return {
+        "best_move": best["move"],
+        "ponder": best["pv"][1] if len(best["pv"]) > 1 else None,
+        "evaluation": best["evaluation"],
+        "depth": best["depth"],
+        "pv": best["pv"],
+        "nodes": best["nodes"],
+        "lines": lines,
+    }
+
+# An engine checked out of the pool. Searches go through play and analyse, which
+# tell the engine about a new game on the first search of every checkout.
+class PooledEngine:
+    __slots__ = ("engine", "game", "broken")
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.game = object()
+        self.broken = False
+
+    def play(self, board, limit, **options):
+        return self.engine.play(board, limit, game=self.game, **options)
+
+    def analyse(self, board, limit, **options):
+        return self.engine.analyse(board, limit, game=self.game, **options)
+
+    # Best move, ponder move, evaluation, depth, principal variation and nodes of a
+    # single search, see search_result. More lines come from the same search.
+    def search(self, board, limit, lines=1):
+        return search_result(self.analyse(board, limit, multipv=lines))
+
+    def analysis(self, board, limit=None, **options):
+        return self.engine.analysis(board, limit, game=self.game, **options)
+
+    def close(self):
+        try:
+            self.engine.close()
+        except Exception:
+            pass
+
+class EnginePool:
+    def __init__(self, path=None, size=config.ENGINE_POOL_SIZE, threads=config.ENGINE_THREADS,
+                 hash_size=config.ENGINE_HASH, timeout=config.ENGINE_TIMEOUT, queue_timeout=config.ENGINE_QUEUE_TIMEOUT):
+        self.path = path or engine_path()
+        self.size = size
+        self.threads = threads
+        self.hash_size = hash_size
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+
+        # Slots of the pool, None until an engine is started in it
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(None)
+        self._engines = set()
+        self._lock = threading.Lock()
+        self.restarts = 0
+
+    def _start(self):
+        engine = chess.engine.SimpleEngine.popen_uci(self.path, timeout=self.timeout)
+        try:
+            engine.configure({"Threads": self.threads, "Hash": self.hash_size})
+        except Exception:
+            engine.close()
+            raise
+        pooled = PooledEngine(engine)
+        with self._lock:
+            self._engines.add(pooled)
+        return pooled
+
+    def _discard(self, pooled):
+        with self._lock:
+            self._engines.discard(pooled)
+        pooled.close()
+
+    def checkout(self):
+        try:
+            pooled = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            raise EngineUnavailable("No engine freed up in {} seconds".format(self.queue_timeout))
+        try:
+            if pooled is None:
+                pooled = self._start()
+            else:
+                # Idle engines may have died in the meantime
+                try:
+                    pooled.engine.ping()
+                except ENGINE_ERRORS:
+                    self._discard(pooled)
+                    self.restarts += 1
+                    pooled = self._start()
+        except BaseException:
+            self._idle.put(None)
+            raise
+        return pooled
+
+    def checkin(self, pooled):
+        if pooled.broken:
+            self._discard(pooled)
+            self.restarts += 1
+            self._idle.put(None)
+        else:
+            pooled.game = object()
+            self._idle.put(pooled)
+
+    # Engine for the duration of a with block, eg->
+    #     with pool.engine() as engine:
+    #         engine.play(board, chess.engine.Limit(time=0.1))
+    @contextlib.contextmanager
+    def engine(self):
+        pooled = self.checkout()
+        try:
+            yield pooled
+        except ENGINE_ERRORS:
+            pooled.broken = True
+            raise
+        finally:
+            self.checkin(pooled)
+
+    # Engines running, slots free for a request and engines restarted so far
+    def stats(self):
+        with self._lock:
+            running = len(self._engines)
+        return {"size": self.size, "running": running, "free": self._idle.qsize(), "restarts": self.restarts}
+
+    def close(self):
+        with self._lock:
+            engines, self._engines = self._engines, set()
+        for pooled in engines:
+            pooled.close()
+
+# Pool of the process, created on first use
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = EnginePool()
+            atexit.register(_pool.close)
+    return _pool
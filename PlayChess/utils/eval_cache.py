@@ -0,0 +1,148 @@
+# Two tier cache of engine evaluations.
+#
+# Results of searches are kept in an LRU of the process and in a mongodb
+# collection shared by every process, whose documents expire through a TTL index.
+# Both are keyed by the position without its move counters, so the same opening
+# reached at different move numbers or by different move orders is evaluated once.
+#
+# A cached result answers a request when it has at least as many lines and was
+# searched at least as hard: it reached the depth asked for, or its own limits
+# are no smaller than the requested ones. The latest search of a position replaces
+# whatever was cached for it.
+
+import collections
+import datetime
+import threading
+
+import pymongo.errors
+
+from .. import config
+
+# Position of a chess.Board without its move counters, eg->
+# "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq -"
+def position_key(board):
+    return " ".join(board.fen().split()[:4])
+
+# Searched limits of a chess.engine.Limit, only time and depth are cached
+def limit_document(limit):
+    return {"time": limit.time, "depth": limit.depth}
+
+def _at_least(cached, requested):
+    if cached is None:
+        return True
+    return requested is not None and cached >= requested
+
+def satisfies(entry, limit, lines):
+    if entry["lines"] < lines:
+        return False
+    reached = entry["result"]["depth"]
+    if limit.depth is not None and reached is not None and reached >= limit.depth:
+        return True
+    return _at_least(entry["limit"]["time"], limit.time) and _at_least(entry["limit"]["depth"], limit.depth)
+
+# Result of an entry with only the lines asked for
+def _trimmed(entry, lines):
+    result = dict(entry["result"])
+    result["lines"] = result["lines"][:lines]
+    return result
+
+class EvalCache:
+    def __init__(self, collection=None, size=config.EVAL_CACHE_SIZE, ttl=config.EVAL_CACHE_TTL):
+        self._collection = collection
+        self._size = size
+        self._ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._indexed = False
+        self.hits = {"memory": 0, "database": 0}
+        self.misses = 0
+        self.errors = 0
+
+    def _ensure_index(self):
+        if not self._indexed:
+            self._collection.create_index("created", expireAfterSeconds=self._ttl)
+            self._indexed = True
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._size:
+                self._entries.popitem(last=False)
+
+    # Cached result good enough for a search of a board with a limit, None if the
+    # position has to be searched
+    def get(self, board, limit, lines=1):
+        key = position_key(board)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if satisfies(entry, limit, lines):
+                    self.hits["memory"] += 1
+                    return _trimmed(entry, lines)
+                # The database holds the same entry as the one read from it
+                if entry.get("from_database"):
+                    self.misses += 1
+                    return None
+
+        document = None
+        if self._collection is not None:
+            # The database only adds speed, a search is still possible without it
+            try:
+                document = self._collection.find_one({"_id": key})
+            except pymongo.errors.PyMongoError:
+                with self._lock:
+                    self.errors += 1
+        if document is not None and satisfies(document, limit, lines):
+            document["from_database"] = True
+            self._remember(key, document)
+            with self._lock:
+                self.hits["database"] += 1
+            return _trimmed(document, lines)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, board, limit, lines, result):
+        key = position_key(board)
+        entry = {"result": result, "limit": limit_document(limit), "lines": lines}
+        self._remember(key, entry)
+        if self._collection is not None:
+            document = dict(entry, created=datetime.datetime.utcnow())
+            try:
+                self._ensure_index()
+                self._collection.replace_one({"_id": key}, document, upsert=True)
+            except pymongo.errors.PyMongoError:
+                with self._lock:
+                    self.errors += 1
+
+    def stats(self):
+        with self._lock:
+            entries, hits, misses, errors = len(self._entries), dict(self.hits), self.misses, self.errors
+        lookups = hits["memory"] + hits["database"] + misses
+        return {
+            "entries": entries,
+            "memory_hits": hits["memory"],
+            "database_hits": hits["database"],
+            "misses": misses,
+            "hit_rate": round((lookups - misses) / lookups, 4) if lookups else 0,
+            "database_errors": errors,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+# Cache of the process, created on first use with the evaluations collection
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            from .. import database
+            _cache = EvalCache(database.db.evaluations)
+    return _cache
@@ -39,5 +39,14 @@ class DefenderColorNotSpecified(Exception):
 class BranchingLimitReached(Exception):
     """Is raised when branching limit of chessboard class is reached"""
 
+class InvalidPGN(Exception):
+    """Is raised when a game of a pgn file cannot be read"""
+
 class ContestEnded(Exception):
-    """Is raised when an operation is performed on a contest that has ended"""
\ No newline at end of file
+    """Is raised when an operation is performed on a contest that has ended"""
+
+class InvalidPackedPosition(Exception):
+    """Is raised when a packed position cannot be read"""
+
+class EngineUnavailable(Exception):
+    """Is raised when no engine of the pool frees up in time"""
@@ -0,0 +1,158 @@
+# Fen notation reader and writer for the bitboard Position.
+#
+# A fen is read in a single pass over its characters, which validates it and places
+# the pieces at the same time. Parsed positions are kept in a bounded LRU keyed by
+# the fen string, so loading a position seen before (navigating states, puzzles,
+# the start position) only copies the cached bitboards.
+
+import functools
+
+from . import bitboard
+from .exceptions import InvalidFenNotation
+from .. import config
+
+# Fen character -> (color, piece_type) and back
+FEN_PIECES = {
+    symbol: bitboard.PIECES[color][piece_type]
+    for color, symbols in ((bitboard.WHITE, "PNBRQK"), (bitboard.BLACK, "pnbrqk"))
+    for piece_type, symbol in enumerate(symbols)
+}
+PIECE_SYMBOLS = {piece: symbol for symbol, piece in FEN_PIECES.items()}
+
+CASTLING_ORDER = "KQkq"
+
+# Parsed fields of a fen. position and attack_map are templates that must be copied
+# before being changed, they are shared by every load of the same fen.
+class ParsedFen:
+    __slots__ = ("position", "attack_map", "turn", "castling", "enpassant", "half_moves", "full_moves")
+
+    def __init__(self, position, attack_map, turn, castling, enpassant, half_moves, full_moves):
+        self.position = position
+        self.attack_map = attack_map
+        self.turn = turn
+        self.castling = castling
+        self.enpassant = enpassant
+        self.half_moves = half_moves
+        self.full_moves = full_moves
+
+def parse_fen(fen_notation):
+    if not isinstance(fen_notation, str):
+        raise InvalidFenNotation(fen_notation)
+    return _parse_fen(fen_notation)
+
+@functools.lru_cache(maxsize=config.FEN_CACHE_SIZE)
+def _parse_fen(fen_notation):
+    fields = fen_notation.split()
+    if len(fields) != 6:
+        raise InvalidFenNotation(fen_notation)
+    placement, turn, castling, enpassant, half_moves, full_moves = fields
+
+    position = bitboard.Position()
+    # Ranks are listed from the 8th, files from a
+    square = 56
+    file = 0
+    for character in placement:
+        if character == "/":
+            if file != 8 or square <= 8:
+                raise InvalidFenNotation(fen_notation)
+            square -= 16
+            file = 0
+        elif "1" <= character <= "8":
+            file += ord(character) - ord("0")
+            square += ord(character) - ord("0")
+            if file > 8:
+                raise InvalidFenNotation(fen_notation)
+        else:
+            piece = FEN_PIECES.get(character)
+            if piece is None or file >= 8:
+                raise InvalidFenNotation(fen_notation)
+            position.put_piece(square, *piece)
+            file += 1
+            square += 1
+    if file != 8 or square != 8:
+        raise InvalidFenNotation(fen_notation)
+
+    if turn not in ("w", "b"):
+        raise InvalidFenNotation(fen_notation)
+    if castling != "-" and (not set(castling) <= set(CASTLING_ORDER) or len(set(castling)) != len(castling)):
+        raise InvalidFenNotation(fen_notation)
+    if enpassant == "-":
+        enpassant = None
+    elif enpassant not in bitboard.SQUARES or enpassant[1] not in "36":
+        raise InvalidFenNotation(fen_notation)
+    if not half_moves.isdigit() or not full_moves.isdigit():
+        raise InvalidFenNotation(fen_notation)
+
+    turn = bitboard.WHITE if turn == "w" else bitboard.BLACK
+    castling = "".join(right for right in CASTLING_ORDER if right in castling)
+    half_moves = int(half_moves)
+    full_moves = max(int(full_moves), 1)
+    position.set_state(
+        turn,
+        bitboard.castling_mask(castling),
+        bitboard.SQUARES[enpassant] if enpassant is not None else None,
+        half_moves,
+    )
+    return ParsedFen(position, bitboard.AttackMap(position), turn, castling, enpassant, half_moves, full_moves)
+
+def clear_cache():
+    _parse_fen.cache_clear()
+
+def cache_info():
+    return _parse_fen.cache_info()
+
+# Placement field of the fen of a position, eg-> "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR"
+def board_fen(position):
+    board = position.board
+    parts = []
+    for rank_start in range(56, -8, -8):
+        empty = 0
+        for square in range(rank_start, rank_start + 8):
+            piece = board[square]
+            if piece is None:
+                empty += 1
+            else:
+                if empty:
+                    parts.append(str(empty))
+                    empty = 0
+                parts.append(PIECE_SYMBOLS[piece])
+        if empty:
+            parts.append(str(empty))
+        parts.append("/")
+    parts.pop()
+    return "".join(parts)
+
+# Castling rights of a castling mask in fen notation, eg-> 13 -> "Kkq"
+def castling_fen(castling):
+    return "".join(right for right in CASTLING_ORDER if castling & bitboard.CASTLING_FLAGS[right])
+
+def make_fen(position, turn, castling, enpassant, half_moves, full_moves):
+    return " ".join((
+        board_fen(position),
+        "w" if turn == bitboard.WHITE else "b",
+        castling or "-",
+        enpassant or "-",
+        str(half_moves),
+        str(full_moves),
+    ))
+
+# Fen of the position reached by playing encoded moves from a fen. The undo record
+# of every move is appended to undos if it's given.
+def replay_fen(fen_notation, moves, undos=None):
+    parsed = parse_fen(fen_notation)
+    position = parsed.position.copy()
+    plies = 0
+    for move in moves:
+        if undos is not None:
+            undos.append(position.undo_info(move))
+        position.push(move)
+        plies += 1
+    enpassant = bitboard.SQUARE_NAMES[position.ep_square] if position.ep_square is not None else None
+    return make_fen(
+        position,
+        position.turn,
+        castling_fen(position.castling),
+        enpassant,
+        position.halfmove_clock,
+        parsed.full_moves + (parsed.turn + plies) // 2,
+    )
@@ -36,6 +36,17 @@ class Game:
         moves = self.chessboard.generate_legal_moves(init_pos);
         return jsonify({'moves': moves})
 
+    def generate_all_legal_moves(self, sender):
+        return jsonify({'legal_moves': self.legal_moves_for(sender)})
+
+    # Legal move map of a player, empty while the other player is on move so that
+    # clients only highlight the pieces their player can move
+    def legal_moves_for(self, player):
+        on_move = self.player1 if self.moves%2 == 0 else self.player2
+        if player != on_move:
+            return {}
+        return self.chessboard.generate_all_legal_moves()
+
     def make_move(self, init_pos, final_pos, sender):
         try:
             self.verify_move_origin(init_pos, sender)
@@ -52,9 +63,9 @@ class Game:
             self.prev_move = move
             return move
         self.moves += 1
-        move = {'success': True, 'changes': changes}
-        self.prev_move = move
-        return move
+        # The move is relayed to the opponent, who gets the legal moves on relay
+        self.prev_move = {'success': True, 'changes': changes}
+        return dict(self.prev_move, legal_moves=self.legal_moves_for(sender))
 
     def fetch_game_status(self):
         return self.chessboard.fetch_game_status()
@@ -0,0 +1,120 @@
+# Compact binary encoding of positions and moves, for storage and the wire.
+#
+# A position packs into POSITION_SIZE bytes: 32 bytes of piece placement, a nibble
+# per square from a1 to h8 (low nibble first, 0 for an empty square, else
+# 1 + color*6 + piece_type), a byte holding the side to move in bit 0 and the
+# castling mask in bits 1-4, a byte holding the file of the enpassant square plus
+# one (0 if none), then the half move and full move counters as big endian shorts.
+# Moves are the 16 bit integers of bitboard.encode_move, and lists of moves pack
+# into two bytes per move.
+#
+# Packed positions are parsed into the same ParsedFen templates as fens, and
+# cached the same way.
+
+import base64
+import functools
+import struct
+
+from . import bitboard, fen
+from .exceptions import InvalidPackedPosition
+from .. import config
+
+POSITION_FORMAT = struct.Struct(">32sBBHH")
+POSITION_SIZE = POSITION_FORMAT.size
+
+# Largest half move and full move counters a packed position holds
+MAX_COUNTER = 0xFFFF
+
+MOVE_FORMAT = ">H"
+
+# Nibble of a square -> (color, piece_type), index 0 stands for an empty square
+NIBBLE_PIECES = [None] + [bitboard.PIECES[color][piece_type] for color in (bitboard.WHITE, bitboard.BLACK) for piece_type in range(6)]
+PIECE_NIBBLES = {piece: nibble for nibble, piece in enumerate(NIBBLE_PIECES) if piece is not None}
+
+def pack_position(position, full_moves):
+    board = position.board
+    placement = bytes(
+        PIECE_NIBBLES.get(board[square], 0) | (PIECE_NIBBLES.get(board[square + 1], 0) << 4)
+        for square in range(0, 64, 2)
+    )
+    enpassant = (position.ep_square & 7) + 1 if position.ep_square is not None else 0
+    # Counters past what a short holds are clamped, such positions are never reached in play
+    return POSITION_FORMAT.pack(
+        placement,
+        position.turn | (position.castling << 1),
+        enpassant,
+        min(position.halfmove_clock, MAX_COUNTER),
+        min(full_moves, MAX_COUNTER),
+    )
+
+def parse_packed(data):
+    if not isinstance(data, (bytes, bytearray)) or len(data) != POSITION_SIZE:
+        raise InvalidPackedPosition(data)
+    return _parse_packed(bytes(data))
+
+@functools.lru_cache(maxsize=config.FEN_CACHE_SIZE)
+def _parse_packed(data):
+    placement, flags, enpassant, half_moves, full_moves = POSITION_FORMAT.unpack(data)
+    if flags >> 5 or enpassant > 8:
+        raise InvalidPackedPosition(data)
+
+    position = bitboard.Position()
+    for index, byte in enumerate(placement):
+        for square, nibble in ((2 * index, byte & 15), (2 * index + 1, byte >> 4)):
+            if nibble >= len(NIBBLE_PIECES):
+                raise InvalidPackedPosition(data)
+            if nibble:
+                position.put_piece(square, *NIBBLE_PIECES[nibble])
+
+    turn = flags & 1
+    castling = flags >> 1
+    # The enpassant square is behind the pawn that just moved, on the 6th rank if
+    # white is to move and the 3rd otherwise
+    ep_square = None
+    if enpassant:
+        ep_square = (40 if turn == bitboard.WHITE else 16) + enpassant - 1
+    full_moves = max(full_moves, 1)
+    position.set_state(turn, castling, ep_square, half_moves)
+    return fen.ParsedFen(
+        position,
+        bitboard.AttackMap(position),
+        turn,
+        fen.castling_fen(castling),
+        bitboard.SQUARE_NAMES[ep_square] if ep_square is not None else None,
+        half_moves,
+        full_moves,
+    )
+
+def clear_cache():
+    _parse_packed.cache_clear()
+
+# Conversions between fen notation and packed positions
+def pack_fen(fen_notation):
+    parsed = fen.parse_fen(fen_notation)
+    return pack_position(parsed.position, parsed.full_moves)
+
+def unpack_fen(data):
+    parsed = parse_packed(data)
+    return fen.make_fen(
+        parsed.position, parsed.turn, parsed.castling, parsed.enpassant, parsed.half_moves, parsed.full_moves,
+    )
+
+# Conversions between moves the way routes take them and packed moves, eg-> "e7-e8-Q" <-> 4020
+def pack_move(notation):
+    return bitboard.parse_move_notation(notation)
+
+def unpack_move(move):
+    return bitboard.move_notation(move)
+
+def pack_moves(notations):
+    return b"".join(struct.pack(MOVE_FORMAT, pack_move(notation)) for notation in notations)
+
+def unpack_moves(data):
+    return [unpack_move(move) for move, in struct.iter_unpack(MOVE_FORMAT, data)]
+
+# Packed data as text for json and socket payloads, and back
+def to_text(data):
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+def from_text(text):
+    return base64.urlsafe_b64decode(text.encode("ascii"))
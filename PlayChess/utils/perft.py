@@ -0,0 +1,85 @@
+import time
+
+from .chessboard import Chessboard
+
+# Reference positions with their known leaf node counts, counts[i] is perft(i+1).
+# Together they cover castling through attacked squares, enpassant captures that
+# uncover a check and underpromotions.
+PERFT_POSITIONS = [
+    {
+        "name": "start position",
+        "fen": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        "counts": [20, 400, 8902, 197281, 4865609],
+    },
+    {
+        "name": "kiwipete",
+        "fen": "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        "counts": [48, 2039, 97862, 4085603],
+    },
+    {
+        "name": "enpassant and pins",
+        "fen": "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        "counts": [14, 191, 2812, 43238, 674624],
+    },
+    {
+        "name": "promotions",
+        "fen": "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        "counts": [6, 264, 9467, 422333],
+    },
+    {
+        "name": "promotions and checks",
+        "fen": "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        "counts": [44, 1486, 62379, 2103487],
+    },
+    {
+        "name": "symmetrical middlegame",
+        "fen": "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+        "counts": [46, 2079, 89890, 3894594],
+    },
+]
+
+# Number of leaf nodes of the move tree of a bitboard position at the given depth
+def perft(position, depth):
+    moves = position.generate_legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        position.push(move)
+        nodes += perft(position, depth - 1)
+        position.pop()
+    return nodes
+
+# Leaf node count below every legal move of the root, handy to find the move
+# where two generators disagree
+def divide(position, depth):
+    counts = {}
+    for move in position.generate_legal_moves():
+        position.push(move)
+        counts[move] = perft(position, depth - 1)
+        position.pop()
+    return counts
+
+# Runs perft on the position Chessboard builds from a fen. Returns the node count
+# along with the seconds it took.
+def run_perft(fen_notation, depth):
+    position = Chessboard(fen_notation)._position
+    start = time.perf_counter()
+    nodes = perft(position, depth)
+    return nodes, time.perf_counter() - start
+
+# Runs every reference position up to max_depth and yields a result per position
+def run_suite(max_depth):
+    for reference in PERFT_POSITIONS:
+        depth = min(max_depth, len(reference["counts"]))
+        nodes, seconds = run_perft(reference["fen"], depth)
+        expected = reference["counts"][depth - 1]
+        yield {
+            "name": reference["name"],
+            "depth": depth,
+            "nodes": nodes,
+            "expected": expected,
+            "passed": nodes == expected,
+            "seconds": seconds,
+            "nps": int(nodes / seconds) if seconds else 0,
+        }
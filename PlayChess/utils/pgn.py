@@ -0,0 +1,310 @@
+# Pgn reader and writer for the trees of the StateManager.
+#
+# Games are read one at a time from any iterable of lines, an open file for
+# instance, so a file of any size is imported with only the game being read in
+# memory. Variations become branches of the tree, comments become the annotation
+# of the node they follow. The writer walks a tree back into the pgn of a game,
+# and a file is written out game by game as well.
+
+import re as regex
+import textwrap
+
+from . import bitboard, fen
+from .chessboard import StateManager
+from .exceptions import InvalidPGN, BranchingLimitReached, InvalidFenNotation
+from .. import config
+
+HEADER_REGEX = regex.compile(r'^\[(\w+)\s+"(.*)"\]\s*$')
+
+TOKEN_REGEX = regex.compile(r"""
+    (\{[^}]*\}?)            # comment, it may go on in the next lines
+  | (;[^\n]*)               # comment up to the end of the line
+  | (\$\d+)                 # numeric annotation glyph
+  | (\()|(\))               # start and end of a variation
+  | (1-0|0-1|1/2-1/2|\*)    # result
+  | (\d+\.+)                # move number
+  | ([^\s(){};$]+)          # move
+""", regex.X)
+
+SAN_REGEX = regex.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+SAN_PIECES = {"N": bitboard.KNIGHT, "B": bitboard.BISHOP, "R": bitboard.ROOK, "Q": bitboard.QUEEN, "K": bitboard.KING}
+PIECE_LETTERS = {piece_type: letter for letter, piece_type in SAN_PIECES.items()}
+
+# Files and ranks as bitboards
+BB_FILES = [0x0101010101010101 << file for file in range(8)]
+BB_RANKS = [0xFF << (8 * rank) for rank in range(8)]
+
+# Tags every exported game carries, in the order they are written
+SEVEN_TAG_ROSTER = (
+    ("Event", "?"),
+    ("Site", "?"),
+    ("Date", "????.??.??"),
+    ("Round", "?"),
+    ("White", "?"),
+    ("Black", "?"),
+    ("Result", "*"),
+)
+
+LINE_LENGTH = 79
+
+# Encoded legal move of a position written in standard algebraic notation, eg-> "Nbd7"
+def parse_san(position, san):
+    san = san.rstrip("+#!?")
+    if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        king = position.king_square(position.turn)
+        target = king + (2 if len(san) == 3 else -2)
+        for move in position.generate_castling_moves():
+            if move == king | (target << 6):
+                return move
+        raise InvalidPGN(san)
+
+    match = SAN_REGEX.match(san)
+    if match is None:
+        raise InvalidPGN(san)
+    piece, from_file, from_rank, target, promotion = match.groups()
+    from_mask = position.pieces[position.turn][SAN_PIECES[piece] if piece else bitboard.PAWN]
+    if from_file:
+        from_mask &= BB_FILES[ord(from_file) - ord("a")]
+    if from_rank:
+        from_mask &= BB_RANKS[int(from_rank) - 1]
+    to_square = bitboard.SQUARES[target]
+    promotion = bitboard.PROMOTION_TYPES[promotion] if promotion else 0
+
+    found = None
+    for move in position.generate_legal_moves(from_mask):
+        if (move >> 6) & 63 == to_square and move >> 12 == promotion:
+            if found is not None:
+                raise InvalidPGN(san)
+            found = move
+    if found is None:
+        raise InvalidPGN(san)
+    return found
+
+# Standard algebraic notation of a legal move of a position, eg-> "exd5" or "Qh4#"
+def make_san(position, move):
+    from_square = move & 63
+    to_square = (move >> 6) & 63
+    piece_type = position.board[from_square][1]
+    capture = position.board[to_square] is not None
+
+    if piece_type == bitboard.KING and abs(to_square - from_square) == 2:
+        san = "O-O" if to_square > from_square else "O-O-O"
+    elif piece_type == bitboard.PAWN:
+        capture = capture or to_square == position.ep_square
+        san = (bitboard.SQUARE_NAMES[from_square][0] + "x" if capture else "") + bitboard.SQUARE_NAMES[to_square]
+        if move >> 12:
+            san += "=" + bitboard.PROMOTION_LETTERS[move >> 12]
+    else:
+        # Name the file, else the rank, else both when other pieces of the same kind can go there too
+        others = [
+            other & 63 for other in position.generate_legal_moves(position.pieces[position.turn][piece_type])
+            if (other >> 6) & 63 == to_square and other & 63 != from_square
+        ]
+        disambiguation = ""
+        if others:
+            from_name = bitboard.SQUARE_NAMES[from_square]
+            if all(bitboard.square_file(other) != bitboard.square_file(from_square) for other in others):
+                disambiguation = from_name[0]
+            elif all(bitboard.square_rank(other) != bitboard.square_rank(from_square) for other in others):
+                disambiguation = from_name[1]
+            else:
+                disambiguation = from_name
+        san = PIECE_LETTERS[piece_type] + disambiguation + ("x" if capture else "") + bitboard.SQUARE_NAMES[to_square]
+
+    position.push(move)
+    king = position.pieces[position.turn][bitboard.KING]
+    if king and position.is_attacked(king.bit_length() - 1, position.turn ^ 1):
+        san += "#" if not position.generate_legal_moves() else "+"
+    position.pop()
+    return san
+
+def _position_fen(position, full_moves):
+    enpassant = bitboard.SQUARE_NAMES[position.ep_square] if position.ep_square is not None else None
+    return fen.make_fen(
+        position, position.turn, fen.castling_fen(position.castling), enpassant, position.halfmove_clock, full_moves,
+    )
+
+# Title of a story made of a game, eg-> "Carlsen vs Caruana"
+def game_title(headers):
+    if headers.get("White", "?") != "?" or headers.get("Black", "?") != "?":
+        return headers.get("White", "?") + " vs " + headers.get("Black", "?")
+    return headers.get("Event", "")
+
+# Tree of a single game from its headers and movetext
+def read_game(headers, movetext):
+    start = headers.get("FEN", config.START_POSITION_NOTATION)
+    try:
+        parsed = fen.parse_fen(start)
+    except InvalidFenNotation:
+        raise InvalidPGN(start)
+    position = parsed.position.copy()
+    first_turn, first_full_moves = parsed.turn, parsed.full_moves
+
+    states = StateManager()
+    states.flush_states(start, position.key)
+    states.set_title(game_title(headers))
+    node = states.get_active_branch()
+    # Node and position before the last move, a variation is played from there instead
+    previous = None
+    variations = []
+
+    for comment, line_comment, _, start_variation, end_variation, result, _, san in TOKEN_REGEX.findall(movetext):
+        if san:
+            move = parse_san(position, san)
+            previous = (node, position.copy())
+            undo = position.undo_info(move)
+            position.push(move)
+            full_moves = first_full_moves + (first_turn + node._state + 1) // 2
+            try:
+                states.create_branch(lambda: _position_fen(position, full_moves), san.rstrip("!?"), position.key, move, undo)
+            except BranchingLimitReached:
+                raise InvalidPGN("Too many variations")
+            node = states.get_active_branch()
+        elif comment or line_comment:
+            text = comment[1:].rstrip("}") if comment else line_comment[1:]
+            text = " ".join(text.split())
+            if text:
+                annotation = node.get_annotation()
+                states.set_annotation(annotation + " " + text if annotation else text)
+        elif start_variation:
+            if previous is None:
+                raise InvalidPGN("Variation before any move")
+            variations.append((node, position, previous))
+            node, position = previous[0], previous[1].copy()
+            previous = None
+            states.set_branch(node.get_id(), node._state)
+        elif end_variation:
+            if not variations:
+                raise InvalidPGN("Unmatched variation end")
+            node, position, previous = variations.pop()
+            states.set_branch(node.get_id(), node._state)
+        elif result:
+            break
+    if variations:
+        raise InvalidPGN("Unterminated variation")
+
+    # The story opens at the start of the game
+    states.set_branch(0, 0)
+    states.mark_story_saved()
+    return states
+
+# Yields (headers, movetext) for every game of an iterable of pgn lines, without
+# reading the moves. Cheap enough to cut a file into games before handing them out.
+def split_games(lines):
+    headers = {}
+    movetext = []
+    open_comment = False
+    for line in lines:
+        stripped = line.strip()
+        if not open_comment and stripped.startswith("["):
+            match = HEADER_REGEX.match(stripped)
+            if match is None:
+                continue
+            # Tags after some movetext belong to the next game
+            if movetext:
+                yield headers, "\n".join(movetext)
+                headers, movetext = {}, []
+            headers[match.group(1)] = match.group(2).replace('\\"', '"')
+        elif stripped and not stripped.startswith("%"):
+            movetext.append(stripped)
+            open_comment = stripped.rfind("{") > stripped.rfind("}") or (open_comment and "}" not in stripped)
+    if movetext or headers:
+        yield headers, "\n".join(movetext)
+
+# Yields (headers, states) for every game of an iterable of pgn lines. A game that
+# can't be read stops the reading, unless a list of errors is given in which case
+# (game number, message) is added to it and the game is skipped.
+def read_games(lines, errors=None):
+    for number, (headers, movetext) in enumerate(split_games(lines), 1):
+        try:
+            states = read_game(headers, movetext)
+        except InvalidPGN as error:
+            if errors is None:
+                raise
+            errors.append((number, str(error)))
+            continue
+        yield headers, states
+
+def _write_comment(tokens, node):
+    annotation = node.get_annotation()
+    if annotation:
+        tokens.append("{" + annotation.replace("}", ")") + "}")
+        return True
+    return False
+
+# Pgn of a tree, the headers are completed with the seven tag roster and the
+# starting position if it isn't the standard one
+def write_game(states, headers=None):
+    headers = dict(headers or {})
+    root = states.get_root()
+    start = root.get_fen()
+    parsed = fen.parse_fen(start)
+    for tag, default in SEVEN_TAG_ROSTER:
+        headers.setdefault(tag, default)
+    if start != config.START_POSITION_NOTATION:
+        headers["SetUp"] = "1"
+        headers["FEN"] = start
+
+    roster = [tag for tag, _ in SEVEN_TAG_ROSTER] + [tag for tag in ("SetUp", "FEN") if tag in headers]
+    ordered = roster + sorted(set(headers) - set(roster))
+    lines = ['[{} "{}"]'.format(tag, headers[tag].replace('"', '\\"')) for tag in ordered]
+    lines.append("")
+
+    tokens = []
+    # Black moves get a number at the start of the game and after comments and variations
+    number_next = True
+    prefix = ""
+    _write_comment(tokens, root)
+
+    def after(node, position):
+        if node.get_played() is None:
+            return fen.parse_fen(node.get_fen()).position.copy()
+        position = position.copy()
+        position.push(node.get_played())
+        return position
+
+    # Work items are "(" or ")", ("move", node, position) for the move of a node played
+    # from a position and ("line", node, position) for the moves played after a node
+    work = [("line", root, parsed.position.copy())]
+    while work:
+        item = work.pop()
+        if isinstance(item, str):
+            # Brackets are written next to the moves they enclose, eg-> "(2. f4 exf4)"
+            if item == ")":
+                tokens[-1] += ")"
+            else:
+                prefix = "("
+            number_next = True
+            continue
+        kind, node, position = item
+        if kind == "line":
+            main = node.get_continuation()
+            if main is None:
+                continue
+            # Variations are written right after the move they replace
+            later = [("move", main, position)]
+            for child in node.get_children():
+                if child is not main:
+                    later.extend(("(", ("move", child, position), ("line", child, after(child, position)), ")"))
+            later.append(("line", main, after(main, position)))
+            work.extend(reversed(later))
+        else:
+            ply = parsed.turn + node._state - 1
+            number = str(parsed.full_moves + ply // 2)
+            san = make_san(position, node.get_played()) if node.get_played() is not None else node.get_move()
+            if ply % 2 == 0:
+                tokens.append(prefix + number + ". " + san)
+            else:
+                tokens.append(prefix + (number + "... " + san if number_next else san))
+            prefix = ""
+            number_next = _write_comment(tokens, node)
+
+    tokens.append(headers["Result"])
+    lines.extend(textwrap.wrap(" ".join(tokens), LINE_LENGTH, break_long_words=False, break_on_hyphens=False))
+    return "\n".join(lines) + "\n\n"
+
+# Writes the pgn of every (headers, states) pair of an iterable to an open file
+def write_games(stream, games):
+    for headers, states in games:
+        stream.write(write_game(states, headers))
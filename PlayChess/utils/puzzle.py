@@ -1,4 +1,5 @@
 from .chessboard import Chessboard
+from . import packed
 from ..config import Worker
 
 clry = Worker.worker
@@ -11,7 +12,10 @@ class Puzzle:
         self.rating = puzzle_obj['rating']
         self.public = puzzle_obj['public']
         self.start_pos = puzzle_obj['start_pos']
+        # Solutions may be stored packed, the moves are compared the way routes take them
         self.solution = puzzle_obj['solution']
+        if isinstance(self.solution, bytes):
+            self.solution = packed.unpack_moves(self.solution)
         self.moves = 0
         self.tags = puzzle_obj['tags']
         self.board = Chessboard(puzzle_obj['start_pos'])
@@ -22,8 +26,11 @@ class Puzzle:
     def generate_legal_moves(self, initial_pos):
         return self.board.generate_legal_moves(initial_pos)
 
+    def generate_all_legal_moves(self):
+        return self.board.generate_all_legal_moves()
+
     def make_move(self, initial_pos, final_pos, dest_piece=None):
-        res = { 'changes': [], 'success': False, 'puzzleOver': False }
+        res = { 'changes': [], 'success': False, 'puzzleOver': False, 'legal_moves': {} }
         notation = initial_pos + "-" + final_pos if dest_piece is None else initial_pos + "-" + final_pos + "-" + dest_piece
 
         if self.moves < len(self.solution) and self.solution[self.moves] ==  notation:
@@ -38,9 +45,11 @@ class Puzzle:
             else:
                 res['puzzleOver'] = True
 
+            res['legal_moves'] = self.board.generate_all_legal_moves()
             return res
             
         res['changes'] += self.board.make_move(initial_pos, final_pos, dest_piece=dest_piece)
+        res['legal_moves'] = self.board.generate_all_legal_moves()
         return res
 
     def get_score(self):
@@ -69,7 +78,10 @@ def addTag(db_object, puzzle_id, tag):
         {"$push": {'tags': tag}},
     )
 
-def createPuzzle(db_object, start_pos, solution, tags=[]):
+# Packed puzzles store the start position and the solution in the binary form of packed.py
+def createPuzzle(db_object, start_pos, solution, tags=[], pack=False):
+    if pack:
+        start_pos, solution = packed.pack_fen(start_pos), packed.pack_moves(solution)
     insert_id = db_object.puzzle.insert_one({
         'attempts': 0,
         'solved': 0,
@@ -0,0 +1,45 @@
+# Runs a single call at a time for every key.
+#
+# The first caller of a key runs the call, callers with the same key arriving while
+# it's running wait for its result (or its exception) instead of running the call
+# again. Once the call is over the key is free, so later callers run it anew.
+
+import concurrent.futures
+import threading
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        # Calls that ran and callers that waited on one of them instead
+        self.calls = 0
+        self.coalesced = 0
+
+    def do(self, key, func):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = concurrent.futures.Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": in_flight}
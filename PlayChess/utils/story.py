@@ -1,28 +1,98 @@
 # Utility tools to manipulate stories
+#
+# A story is stored as one document whose nodes are grouped by branch, see
+# StateManager.get_story_document. The first save inserts the whole tree and links
+# it to its author, every later save sends a single update that sets the nodes
+# added since the previous save and unsets the deleted ones. Loading only fetches
+# the header and the main line, other branches are fetched when they're reached.
 
 from .chessboard import Chessboard
+from .. import config
+
+STORY_HEADER = ('title', 'current_state', 'active_branch', 'branch_count', 'forks', 'depth')
 
 class Story:
     pass
 
+# Header and main line of a story, for Chessboard.load_story. Stories stored
+# before branches were kept apart are rewritten the first time they are loaded,
+# so that later saves and loads can work branch by branch.
 def loadStory(db_object, story_id):
-    story = db_object.story.find_one({
-        '_id': story_id,
-    })
-    return story
+    projection = {field: 1 for field in STORY_HEADER}
+    projection['branches.0'] = 1
+    projection['states'] = 1
+    story = db_object.story.find_one({'_id': story_id}, projection)
+    if story is None or 'states' not in story:
+        return story
+    board = Chessboard()
+    board.load_states(story)
+    document = board.get_story_document()
+    document['_id'] = story_id
+    db_object.story.replace_one({'_id': story_id}, document)
+    return document
+
+# Function fetching some branches of a story with a single projection query
+def branchLoader(db_object, story_id):
+    def load_branches(branch_ids):
+        story = db_object.story.find_one(
+            {'_id': story_id},
+            {'branches.' + str(branch_id): 1 for branch_id in branch_ids},
+        )
+        return story.get('branches', {}) if story else {}
+    return load_branches
 
 def deleteStory(db_object, story_id):
     db_object.story.delete_one({
         '_id': story_id,
     })
 
-def addStory(db_object, username, board):
-    story = board.get_states_as_json()
-    story_id = db_object.story.insert_one(story)
+# Saves the states of a board and returns the id of its story
+def saveStory(db_object, username, board):
+    story_id = board.get_story_id()
+    if story_id is None:
+        story = board.get_story_document()
+        story['author'] = username
+        story_id = db_object.story.insert_one(story).inserted_id
+        db_object.users.update_one(
+            {"username": username},
+            {"$push": {"story": story_id}},
+        )
+        board.set_story_id(story_id)
+    else:
+        header, changed, deleted = board.get_story_changes()
+        update = {"$set": header}
+        for node_key, node in changed.items():
+            header['branches.' + node_key] = node
+        if deleted:
+            update["$unset"] = {'branches.' + node_key: "" for node_key in deleted}
+        db_object.story.update_one({'_id': story_id}, update)
+    board.mark_story_saved()
+    return story_id
+
+# Stores every (headers, states) pair of an iterable as a story, sending them in
+# batches of insert_many. Returns the number of stories stored.
+def importStories(db_object, games, username=None, batch_size=config.PGN_IMPORT_BATCH_SIZE):
+    count = 0
+    batch = []
 
-    author = db_object.users.update_one(
-        {"username": username},
-        {"$push": {"story": story_id.inserted_id}},
-    )
+    def flush():
+        story_ids = db_object.story.insert_many(batch, ordered=False).inserted_ids
+        if username is not None:
+            db_object.users.update_one(
+                {"username": username},
+                {"$push": {"story": {"$each": story_ids}}},
+            )
+        del batch[:]
 
-    return True if author.matched_count > 0 else False
+    for headers, states in games:
+        story = states.get_story_document()
+        story['headers'] = headers
+        if username is not None:
+            story['author'] = username
+        batch.append(story)
+        count += 1
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return count
@@ -0,0 +1,177 @@
+# Checks dumps of positions and games against the rule engine on every core.
+#
+# Files are cut into chunks in the main process and the chunks are validated by a
+# pool of worker processes, each of which keeps a single Chessboard to load every
+# position into. Results come back chunk by chunk as soon as they're ready.
+#
+# Position files (.fen, .epd, anything but .pgn) hold one position per line,
+# optionally followed by moves to play from it and the status expected after them,
+# separated by "|", eg->
+#     6k1/ppR5/3B2p1/3p4/4rnK1/5P2/PP1r3P/8 b - - 0 1 | d2-g2 g4-h4 g6-g5 | checkmate
+# Moves are written the way routes take them ("e7-e8-Q" for promotions), the status
+# is one of those of Chessboard.fetch_game_status or "none". Epd positions may have
+# bm and am operations, whose moves should be legal.
+#
+# Pgn files have the moves of every game played on a Chessboard and the final
+# position checked against the result of the game.
+
+import concurrent.futures
+import os
+
+from . import bitboard, pgn
+from .chessboard import Chessboard
+from .exceptions import (
+    InvalidFenNotation, InvalidMoveError, InvalidPGN, SideNotAuthorizedToMakeMove, Checkmate, Draw,
+)
+
+# Lines of a position file, or games of a pgn file, validated by a single task
+CHUNK_SIZE = 500
+
+# Board of the worker process, created on its first task
+_board = None
+
+def _worker_board():
+    global _board
+    if _board is None:
+        _board = Chessboard()
+    return _board
+
+def _status(board):
+    game_status = board.fetch_game_status()
+    return game_status[1] if game_status[0] else "none"
+
+def _play(board, notation):
+    squares = notation.split("-")
+    if len(squares) not in (2, 3) or any(square not in bitboard.SQUARES for square in squares[:2]):
+        raise InvalidMoveError("Unreadable move", notation)
+    try:
+        # Fifty move and threefold repetition draws only end games that claim them
+        board.make_move(squares[0], squares[1], squares[2] if len(squares) == 3 else None, claim_draws=False)
+    except (InvalidMoveError, SideNotAuthorizedToMakeMove):
+        raise InvalidMoveError("Illegal move", notation)
+    except Checkmate:
+        raise InvalidMoveError("Move after checkmate", notation)
+    except Draw as draw:
+        raise InvalidMoveError("Move after " + draw.cause, notation)
+
+# Fen of an epd position along with its operations, eg->
+# '... w KQkq - bm Nf3; id "x";' -> ('... w KQkq - 0 1', {'bm': 'Nf3', 'id': '"x"'})
+def parse_epd(epd):
+    fields = epd.split(None, 4)
+    if len(fields) < 4:
+        raise InvalidFenNotation(epd)
+    operations = {}
+    for operation in (fields[4] if len(fields) == 5 else "").split(";"):
+        operation = operation.strip()
+        if operation:
+            opcode, _, operand = operation.partition(" ")
+            operations[opcode] = operand.strip()
+    counters = (operations.get("hmvc", "0"), operations.get("fmvn", "1"))
+    return " ".join(fields[:4]) + " " + " ".join(counters), operations
+
+# Message of what's wrong with a line of a position file, None if it's valid
+def validate_position(line):
+    board = _worker_board()
+    parts = [part.strip() for part in line.split("|")]
+    position = parts[0]
+    try:
+        operations = {}
+        if len(position.split()) != 6:
+            position, operations = parse_epd(position)
+        board.reset_chessboard(position, hard=True)
+    except InvalidFenNotation:
+        return "Invalid fen " + position
+
+    for opcode in ("bm", "am"):
+        for san in operations.get(opcode, "").split():
+            try:
+                pgn.parse_san(board._position, san)
+            except InvalidPGN:
+                return "Illegal {} move {}".format(opcode, san)
+
+    if len(parts) > 1:
+        for notation in parts[1].split():
+            try:
+                _play(board, notation)
+            except InvalidMoveError as error:
+                return "{} {}".format(*error.args)
+    if len(parts) > 2 and parts[2] and _status(board) != parts[2]:
+        return "Status is {}, expected {}".format(_status(board), parts[2])
+    return None
+
+# Message of what's wrong with a game of a pgn file, None if it's valid
+def validate_game(headers, movetext):
+    try:
+        states = pgn.read_game(headers, movetext)
+    except InvalidPGN as error:
+        return "Unreadable move " + str(error)
+
+    board = _worker_board()
+    node = states.get_root()
+    board.reset_chessboard(node.get_fen(), hard=True)
+    node = node.get_continuation()
+    while node is not None:
+        try:
+            _play(board, bitboard.move_notation(node.get_played()))
+        except InvalidMoveError as error:
+            return "{} {} at ply {}".format(error.args[0], node.get_move(), node._state)
+        if board.position_key != node.get_key():
+            return "Position differs from the bitboards at ply {}".format(node._state)
+        node = node.get_continuation()
+
+    # Only a game over on the board decides the result, others may end in any way
+    status = _status(board)
+    result = headers.get("Result", "*")
+    expected = None
+    if status == "checkmate":
+        expected = "0-1" if board.check_color() else "1-0"
+    elif status in ("stalemate", "insufficient material"):
+        expected = "1/2-1/2"
+    if expected is not None and result not in (expected, "*"):
+        return "Game ends in {} but the result is {}".format(status, result)
+    return None
+
+# Validates a chunk of a file, returns (path, items checked, [(line or game number, message)])
+def validate_chunk(path, kind, items):
+    errors = []
+    for number, item in items:
+        message = validate_game(*item) if kind == "pgn" else validate_position(item)
+        if message is not None:
+            errors.append((number, message))
+    return path, len(items), errors
+
+# Chunks of (path, kind, [(number, item)]) of every file
+def read_chunks(paths, chunk_size=CHUNK_SIZE):
+    for path in paths:
+        kind = "pgn" if path.lower().endswith(".pgn") else "position"
+        with open(path, encoding="utf-8", errors="replace") as dump:
+            if kind == "pgn":
+                items = enumerate(pgn.split_games(dump), 1)
+            else:
+                items = (
+                    (number, line.strip()) for number, line in enumerate(dump, 1)
+                    if line.strip() and not line.startswith("#")
+                )
+            chunk = []
+            for item in items:
+                chunk.append(item)
+                if len(chunk) >= chunk_size:
+                    yield path, kind, chunk
+                    chunk = []
+            if chunk:
+                yield path, kind, chunk
+
+# Yields the result of every chunk of the files as workers finish them. Only a few
+# chunks per worker are read ahead, so files of any size are validated in bounded memory.
+def validate_files(paths, workers=None, chunk_size=CHUNK_SIZE):
+    workers = workers or os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for chunk in read_chunks(paths, chunk_size):
+            pending.add(executor.submit(validate_chunk, *chunk))
+            if len(pending) >= 2 * workers:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
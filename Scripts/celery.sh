@@ -1 +1 @@
-celery worker -A run.celery --loglevel=info
\ No newline at end of file
+celery worker -A run.celery -Q celery,analysis --loglevel=info
\ No newline at end of file
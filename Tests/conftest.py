@@ -0,0 +1,52 @@
+import sys
+
+import pytest
+
+# Smallest uci engine answering e2e4 to everything, with up to three lines from the
+# start position, and only once stopped when searching without a limit. It logs the
+# commands it gets and dies when asked to search to depth 13
+FAKE_ENGINE = '''
+import os, sys
+log = open(sys.argv[1], "a")
+lines = 1
+for line in sys.stdin:
+    command = line.strip()
+    log.write(str(os.getpid()) + " " + command + "\\n")
+    log.flush()
+    if command == "uci":
+        print("id name fake")
+        print("option name Threads type spin default 1 min 1 max 64")
+        print("option name Hash type spin default 16 min 1 max 1024")
+        print("option name MultiPV type spin default 1 min 1 max 500")
+        print("uciok")
+    elif command == "isready":
+        print("readyok")
+    elif command == "go depth 13":
+        sys.exit(1)
+    elif command.startswith("setoption name MultiPV value"):
+        lines = int(command.split()[-1])
+    elif command.startswith("go"):
+        for number, pv in enumerate(["e2e4 e7e5", "d2d4 d7d5", "g1f3 g8f6"][:lines], 1):
+            print("info depth 12 multipv {} score cp {} nodes 5000 pv {}".format(number, 40 - 10 * number, pv))
+        if command != "go infinite":
+            print("bestmove e2e4 ponder e7e5")
+    elif command == "stop":
+        print("bestmove e2e4 ponder e7e5")
+    elif command == "quit":
+        break
+    sys.stdout.flush()
+'''
+
+@pytest.fixture
+def engine_log(tmp_path):
+    script = tmp_path / "engine.py"
+    script.write_text(FAKE_ENGINE)
+    log = tmp_path / "engine.log"
+    return [sys.executable, str(script), str(log)], log
+
+# Reads an engine log as [pid, command] pairs
+@pytest.fixture
+def logged_commands():
+    def read(log):
+        return [line.split(" ", 1) for line in log.read_text().splitlines()]
+    return read
@@ -0,0 +1,50 @@
+import threading
+
+import chess
+import chess.engine
+
+from PlayChess.utils import analysis
+from PlayChess.utils.engine_pool import EnginePool
+from PlayChess.utils.eval_cache import EvalCache
+
+def test_limited_analysis_streams_lines_and_is_cached(engine_log, logged_commands):
+    command, log = engine_log
+    pool = EnginePool(command, size=1)
+    cache = EvalCache()
+    events = []
+    limit = analysis.analysis_limit(0.1, 12)
+    emit = lambda event, data: events.append((event, data))
+
+    result = analysis.run_analysis(pool, chess.STARTING_FEN, limit, 2, emit, lambda: False, "job", cache)
+    assert [event for event, _ in events]==["analysis_info", "analysis_info", "analysis_done"]
+    assert [(data['multipv'], data['move'], data['job']) for _, data in events[:2]]==[(1, "e2e4", "job"), (2, "d2d4", "job")]
+    assert (result['best_move'], result['ponder'], len(result['lines']))==("e2e4", "e7e5", 2)
+
+    # The same analysis again comes from the cache, without asking the engine
+    del events[:]
+    analysis.run_analysis(pool, chess.STARTING_FEN, limit, 2, emit, lambda: False, "again", cache)
+    assert [(event, data['job']) for event, data in events]==[("analysis_done", "again")]
+    pool.close()
+    assert len([command for _, command in logged_commands(log) if command.startswith("go")])==1
+
+def test_infinite_analysis_runs_until_stopped(engine_log, logged_commands):
+    command, log = engine_log
+    pool = EnginePool(command, size=1)
+    events = []
+    stop = threading.Event()
+
+    def emit(event, data):
+        events.append((event, data))
+        stop.set()
+
+    result = analysis.run_analysis(pool, chess.STARTING_FEN, analysis.analysis_limit(), 1, emit, stop.is_set, "job")
+    assert analysis.analysis_limit() is None
+    assert [event for event, _ in events]==["analysis_info", "analysis_done"]
+    assert result['best_move']=="e2e4"
+    commands = [command for _, command in logged_commands(log)]
+    assert "go infinite" in commands and "stop" in commands
+
+    # The engine is free for the next job
+    with pool.engine() as engine:
+        assert engine.search(chess.Board(), chess.engine.Limit(depth=12))['best_move']=="e2e4"
+    pool.close()
@@ -0,0 +1,163 @@
+import chess
+
+from PlayChess.utils import bitboard
+from PlayChess.utils.chessboard import Chessboard
+from PlayChess.utils.perft import perft
+from PlayChess import config
+
+KIWIPETE = "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+ENPASSANT = "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3"
+PROMOTION = "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N w - - 0 1"
+
+# Legal moves of the side to move as "e2e4", promotions without their piece
+def legal_moves(chessboard):
+    color = bitboard.WHITE if chessboard._moves % 2 == 0 else bitboard.BLACK
+    return {
+        bitboard.SQUARE_NAMES[square] + final_pos
+        for square in bitboard.scan_forward(chessboard._position.occupied_co[color])
+        for final_pos in chessboard.generate_legal_moves(bitboard.SQUARE_NAMES[square])
+    }
+
+def test_legal_moves_match_python_chess():
+    for fen_notation in (config.START_POSITION_NOTATION, KIWIPETE, ENPASSANT, PROMOTION):
+        expected = {move.uci()[:4] for move in chess.Board(fen_notation).legal_moves}
+        assert legal_moves(Chessboard(fen_notation))==expected
+    assert len(legal_moves(Chessboard()))==20
+    assert len(legal_moves(Chessboard(KIWIPETE)))==48
+
+def test_fen_loads_bitboards():
+    for fen_notation in (config.START_POSITION_NOTATION, KIWIPETE, ENPASSANT, PROMOTION):
+        chessboard = Chessboard(fen_notation)
+        position = chessboard._position
+        assert chessboard.fen_notation==fen_notation
+        # Every bitboard agrees with the mailbox and the occupancy masks
+        for color in (bitboard.WHITE, bitboard.BLACK):
+            for piece_type in range(6):
+                for square in bitboard.scan_forward(position.pieces[color][piece_type]):
+                    assert position.board[square]==(color, piece_type)
+            assert position.occupied_co[color]==sum(position.pieces[color])
+        assert position.occupied==position.occupied_co[bitboard.WHITE] | position.occupied_co[bitboard.BLACK]
+        assert sum(piece is not None for piece in position.board)==bin(position.occupied).count("1")
+    assert Chessboard()._position.board[bitboard.SQUARES["e1"]]==(bitboard.WHITE, bitboard.KING)
+
+# Everything a move changes, for comparing a position before and after it's taken back
+def snapshot(position):
+    return (
+        [list(pieces) for pieces in position.pieces], list(position.occupied_co), position.occupied,
+        list(position.board), position.turn, position.castling, position.ep_square, position.halfmove_clock, position.key,
+    )
+
+def test_push_pop_restores_position():
+    for fen_notation in (KIWIPETE, ENPASSANT, PROMOTION):
+        position = Chessboard(fen_notation)._position
+        before = snapshot(position)
+        for move in position.generate_legal_moves():
+            undo = position.undo_info(move)
+            position.push(move)
+            assert position.key==position.compute_key()
+            position.pop()
+            assert snapshot(position)==before
+
+            # Taking a move back from its undo record alone gives the same position,
+            # with or without the key it had
+            position.push(move)
+            position.unpush(move, undo, before[-1])
+            assert snapshot(position)==before
+            position.push(move)
+            position.unpush(move, undo)
+            assert snapshot(position)==before
+
+def test_start_position_perft():
+    position = Chessboard()._position
+    before = snapshot(position)
+    assert perft(position, 3)==8902
+    assert snapshot(position)==before
+
+def uci(move):
+    promotion = bitboard.move_promotion(move)
+    return "".join((
+        bitboard.SQUARE_NAMES[bitboard.move_from_square(move)],
+        bitboard.SQUARE_NAMES[bitboard.move_to_square(move)],
+        "nbrq"[promotion - bitboard.KNIGHT] if promotion else "",
+    ))
+
+def test_legal_moves_under_checks_and_pins():
+    positions = {
+        # Knight pinned to its king, rook pinned along the file it moves on
+        "4k3/4r3/8/8/1b6/8/3NR3/4K3 w - - 0 1": {"e1d1", "e1f1", "e1f2", "e2e3", "e2e4", "e2e5", "e2e6", "e2e7"},
+        # Double check, only the king moves
+        "4k3/8/8/8/8/5n2/8/4K2r w - - 0 1": {"e1e2", "e1f2"},
+        # Enpassant would uncover a check along the rank of the king
+        "8/8/8/K2pP2r/8/8/8/7k w - d6 0 2": {"a5a4", "a5a6", "a5b4", "a5b5", "a5b6", "e5e6"},
+        # Check that can be blocked, captured or walked away from, but not castled out of
+        "4k3/8/8/8/4N2b/8/3P4/3QK1NR w K - 0 1": {"e1e2", "e1f1", "e4f2", "e4g3", "h1h4"},
+    }
+    for fen_notation, expected in positions.items():
+        position = Chessboard(fen_notation)._position
+        moves = {uci(move) for move in position.generate_legal_moves()}
+        assert moves=={move.uci() for move in chess.Board(fen_notation).legal_moves}
+        assert moves==expected
+
+    # Legal moves are the pseudo legal moves that don't leave the king in check
+    position = Chessboard(KIWIPETE)._position
+    for move in position.generate_legal_moves():
+        position.push(move)
+        legal = sorted(position.generate_legal_moves())
+        assert legal==sorted(move for move in position.generate_pseudo_legal_moves() if position.is_legal(move))
+        position.pop()
+
+# Enpassant, a capturing promotion and castling on both sides
+ATTACK_MAP_GAME = [
+    "e2-e4", "d7-d5", "e4-e5", "f7-f5", "e5-f6", "b8-c6", "f6-g7", "c8-e6",
+    "g7-h8-Q", "d8-d7", "g1-f3", "e8-c8", "f1-d3", "e6-g4", "e1-g1",
+]
+
+def test_attack_map_follows_push_and_pop():
+    board = chess.Board()
+    chessboard = Chessboard()
+    position = chessboard._position
+    attack_map = bitboard.AttackMap(position)
+    played = []
+    for notation in ATTACK_MAP_GAME:
+        board.push_uci(notation.replace("-", "").lower())
+        squares = notation.split("-")
+        promotion = bitboard.PIECE_TYPES["Queen"] if len(squares) == 3 else 0
+        move = bitboard.encode_move(bitboard.SQUARES[squares[0]], bitboard.SQUARES[squares[1]], promotion)
+        before = list(position.board)
+        touched = position.touched_squares(move)
+        position.push(move)
+        # Only the squares whose occupant changed are updated
+        changed = [square for square in range(64) if position.board[square] != before[square]]
+        assert sorted(touched)==changed
+        for square in changed:
+            attack_map.update(position, square)
+        assert attack_map.counts==bitboard.AttackMap(position).counts
+        played.append(changed)
+    assert [position.board[bitboard.SQUARES[square]] for square in ("c8", "d8", "g1", "f1", "h8")]==[
+        (bitboard.BLACK, bitboard.KING), (bitboard.BLACK, bitboard.ROOK),
+        (bitboard.WHITE, bitboard.KING), (bitboard.WHITE, bitboard.ROOK), (bitboard.WHITE, bitboard.QUEEN),
+    ]
+
+    while played:
+        position.pop()
+        for square in played.pop():
+            attack_map.update(position, square)
+        assert attack_map.counts==bitboard.AttackMap(position).counts
+    assert attack_map.counts==bitboard.AttackMap(Chessboard()._position).counts
+
+def test_chessboard_attack_map_follows_moves():
+    board = chess.Board()
+    chessboard = Chessboard()
+    for notation in ATTACK_MAP_GAME:
+        board.push_uci(notation.replace("-", "").lower())
+        chessboard.make_move(*notation.split("-"))
+        assert chessboard._attack_map.counts==bitboard.AttackMap(chessboard._position).counts
+    assert chessboard.fen_notation.split()[0]==board.board_fen()
+    for _ in ATTACK_MAP_GAME:
+        chessboard.get_prev_state()
+        assert chessboard._attack_map.counts==bitboard.AttackMap(chessboard._position).counts
+    assert chessboard.fen_notation==config.START_POSITION_NOTATION
+    for _ in ATTACK_MAP_GAME:
+        chessboard.get_next_state()
+        assert chessboard._attack_map.counts==bitboard.AttackMap(chessboard._position).counts
+    assert chessboard.fen_notation.split()[0]==board.board_fen()
@@ -0,0 +1,136 @@
+from PlayChess.utils import bitboard
+from PlayChess.utils.chessboard import Chessboard, PIECES, BLANK
+from PlayChess.utils.benchmark import bytes_per_board
+from PlayChess.utils.exceptions import InvalidFenNotation
+
+def test_pieces_are_shared():
+    first, second = Chessboard(), Chessboard()
+    assert first.convert_to_index('e1').piece is second.convert_to_index('e1').piece
+    assert first.convert_to_index('e1').piece is PIECES['white']['King']
+    assert first.convert_to_index('e4').piece is BLANK
+    first.make_move('e2', 'e4')
+    assert first.convert_to_index('e4').piece is PIECES['white']['Pawn']
+    assert second.convert_to_index('e4').piece is BLANK
+    assert first.convert_to_index('e4').html_class=="square light white-p"
+
+def test_insufficient_material():
+    assert Chessboard("8/8/4k3/8/8/3KB3/8/8 w - - 0 1").is_draw()[1]=="insufficient material"
+    assert Chessboard("8/8/4kb2/8/8/3KB3/8/8 w - - 0 1").is_draw()[1]=="insufficient material"
+    assert not Chessboard("8/8/4k1b1/8/8/3KB3/8/8 w - - 0 1").is_draw()[0]
+    assert not Chessboard("8/8/4kq2/8/8/3KB3/8/8 w - - 0 1").is_draw()[0]
+
+def test_board_memory():
+    # A loaded board used to take ~40KB of squares, pieces and html strings
+    assert bytes_per_board(20) < 8000
+
+def test_fen_round_trip():
+    fens = [
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        "rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3",
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 b - - 12 40",
+    ]
+    for fen_notation in fens:
+        assert Chessboard(fen_notation).fen_notation==fen_notation
+        # Second load comes from the cache and must not share the bitboards
+        chessboard = Chessboard(fen_notation)
+        assert chessboard.fen_notation==fen_notation
+    first, second = Chessboard(), Chessboard()
+    first.make_move('e2', 'e4')
+    assert second.fen_notation==Chessboard().fen_notation
+
+def test_invalid_fen():
+    start = Chessboard().fen_notation
+    for fen_notation in ["", "8/8/8 w - - 0 1", "rnbqkbnr/ppppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1"]:
+        assert Chessboard(fen_notation).fen_notation==start
+        try:
+            Chessboard().reset_chessboard(fen_notation)
+            assert False
+        except InvalidFenNotation:
+            pass
+
+def test_all_legal_moves_map():
+    chessboard = Chessboard()
+    legal_moves = chessboard.generate_all_legal_moves()
+    assert sum(len(moves) for moves in legal_moves.values())==20
+    assert sorted(legal_moves['e2'])==['e3', 'e4']
+    assert legal_moves['g1']==chessboard.generate_legal_moves('g1')
+    # Changing the returned map doesn't change the cached one
+    legal_moves['e2'].append('e5')
+    assert chessboard.generate_all_legal_moves()['e2']==chessboard.generate_legal_moves('e2')
+    chessboard.make_move('e2', 'e4')
+    assert 'e7' in chessboard.generate_all_legal_moves()
+    assert 'e2' not in chessboard.generate_all_legal_moves()
+
+KNIGHT_SHUFFLE = ["g1-f3", "g8-f6", "f3-g1", "f6-g8"]
+
+def play(chessboard, moves):
+    for move in moves:
+        chessboard.make_move(*move.split('-'))
+
+def test_threefold_repetition():
+    chessboard = Chessboard()
+    play(chessboard, KNIGHT_SHUFFLE)
+    assert chessboard.is_draw()[0]==False
+    play(chessboard, KNIGHT_SHUFFLE)
+    # The start position came up a third time
+    assert chessboard.threefold_repetition
+    assert chessboard.is_draw()==[True, "threefold repetition", "0.5"]
+
+    # Navigating counts the positions along the path to the state again
+    assert chessboard.get_state()['state']==8
+    chessboard.get_prev_state()
+    assert not chessboard.threefold_repetition
+    chessboard.get_next_state()
+    assert chessboard.is_draw()==[True, "threefold repetition", "0.5"]
+    for _ in range(4):
+        chessboard.get_prev_state()
+    assert chessboard._repetitions[chessboard.position_key]==2
+    for _ in range(4):
+        chessboard.get_next_state()
+    assert chessboard.is_draw()[1]=="threefold repetition"
+
+    # Positions before a pawn move can't come up again
+    chessboard = Chessboard()
+    play(chessboard, KNIGHT_SHUFFLE + ["e2-e4", "e7-e5"] + KNIGHT_SHUFFLE)
+    assert chessboard._repetitions[chessboard.position_key]==2
+    assert not chessboard.is_draw()[0]
+
+def test_legal_moves_generated_once_per_position(monkeypatch):
+    calls = []
+    generate_legal_moves = bitboard.Position.generate_legal_moves
+    def counted(position, *args):
+        calls.append(position)
+        return generate_legal_moves(position, *args)
+    monkeypatch.setattr(bitboard.Position, 'generate_legal_moves', counted)
+
+    # Every question about a position is answered from a single generation
+    def ask(chessboard):
+        chessboard.generate_all_legal_moves()
+        color = "white" if chessboard.check_color() else "black"
+        for square, moves in chessboard.generate_all_legal_moves().items():
+            assert chessboard.generate_legal_moves(square)==moves
+            assert chessboard.convert_to_index(square).piece.color==color
+        chessboard.fetch_game_status()
+        chessboard.is_draw()
+        return chessboard.is_checkmate, chessboard.stalemate, chessboard.in_check(chessboard._moves % 2)
+
+    chessboard = Chessboard()
+    ask(chessboard)
+    assert len(calls)==1
+    # Fool's mate
+    for move in ["f2-f3", "e7-e5", "g2-g4", "d8-h4"]:
+        del calls[:]
+        chessboard.make_move(*move.split('-'))
+        status = ask(chessboard)
+        assert len(calls)==1
+    assert status==(True, False, True)
+
+    for navigate in [chessboard.get_prev_state, chessboard.get_prev_state, chessboard.get_next_state]:
+        del calls[:]
+        navigate()
+        ask(chessboard)
+        assert len(calls)==1
+
+    del calls[:]
+    assert ask(Chessboard("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1"))==(False, True, False)
+    assert len(calls)==1
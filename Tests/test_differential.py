@@ -0,0 +1,17 @@
+from PlayChess.utils import differential
+from PlayChess.utils.chessboard import Chessboard
+
+def test_random_games_match_python_chess():
+    differences, throughput = differential.run_fuzz(games=20, seed=0, plies=120)
+    assert differences==[]
+    assert throughput['plies'] > 0
+
+def test_enpassant_capture_notation():
+    chessboard = Chessboard("rnbqkbnr/ppp1pppp/8/3pP3/8/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 3")
+    chessboard.make_move("e5", "d6")
+    assert chessboard.get_state()['move']=="exd6"
+
+def test_checkmate_is_not_stalemate():
+    chessboard = Chessboard("rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3")
+    assert chessboard.is_checkmate
+    assert not chessboard.stalemate
@@ -0,0 +1,59 @@
+import threading
+
+import chess
+import chess.engine
+import pytest
+
+from PlayChess.utils.engine_pool import EnginePool, ENGINE_ERRORS
+from PlayChess.utils.exceptions import EngineUnavailable
+
+def test_engines_are_reused_with_a_new_game(engine_log, logged_commands):
+    command, log = engine_log
+    pool = EnginePool(command, size=1, threads=2, hash_size=32)
+    for _ in range(2):
+        with pool.engine() as engine:
+            assert engine.play(chess.Board(), chess.engine.Limit(depth=1)).move==chess.Move.from_uci("e2e4")
+    pool.close()
+    commands = logged_commands(log)
+    assert len({pid for pid, _ in commands})==1
+    assert [command for _, command in commands].count("ucinewgame")==2
+    assert ["setoption name Threads value 2" in command for _, command in commands].count(True)==1
+
+def test_crashed_engines_are_restarted(engine_log, logged_commands):
+    command, log = engine_log
+    pool = EnginePool(command, size=1)
+    with pytest.raises(ENGINE_ERRORS):
+        with pool.engine() as engine:
+            engine.play(chess.Board(), chess.engine.Limit(depth=13))
+    with pool.engine() as engine:
+        engine.analyse(chess.Board(), chess.engine.Limit(depth=1))
+    assert pool.stats()['restarts']==1
+    assert pool.stats()['running']==1
+    pool.close()
+    assert len({pid for pid, _ in logged_commands(log)})==2
+
+def test_requests_wait_for_a_free_engine(engine_log, logged_commands):
+    command, log = engine_log
+    pool = EnginePool(command, size=1, queue_timeout=0.1)
+    busy = pool.checkout()
+    with pytest.raises(EngineUnavailable):
+        pool.checkout()
+    pool.queue_timeout = 5
+    threading.Timer(0.2, pool.checkin, (busy,)).start()
+    with pool.engine() as engine:
+        assert engine is busy
+    pool.close()
+    assert len({pid for pid, _ in logged_commands(log)})==1
+
+def test_single_search_gives_best_move_and_lines(engine_log, logged_commands):
+    command, log = engine_log
+    pool = EnginePool(command, size=1)
+    with pool.engine() as engine:
+        result = engine.search(chess.Board(), chess.engine.Limit(depth=12))
+        assert (result['best_move'], result['ponder'], result['evaluation'])==("e2e4", "e7e5", "+30")
+        assert (result['depth'], result['nodes'], result['pv'])==(12, 5000, ["e2e4", "e7e5"])
+        result = engine.search(chess.Board(), chess.engine.Limit(depth=12), lines=3)
+        assert [line['move'] for line in result['lines']]==["e2e4", "d2d4", "g1f3"]
+        assert result['best_move']=="e2e4"
+    pool.close()
+    assert [command for _, command in logged_commands(log)].count("go depth 12")==2
@@ -0,0 +1,93 @@
+import time
+
+import chess
+import chess.engine
+import pymongo.errors
+
+from PlayChess.utils.eval_cache import EvalCache, position_key
+
+# Collection holding documents in a dict, or failing every call when down
+class Collection:
+    def __init__(self, down=False):
+        self.documents = {}
+        self.indexes = []
+        self.down = down
+        self.finds = 0
+
+    def create_index(self, key, **options):
+        self.indexes.append((key, options))
+
+    def find_one(self, query):
+        self.finds += 1
+        if self.down:
+            raise pymongo.errors.ServerSelectionTimeoutError("down")
+        return self.documents.get(query["_id"])
+
+    def replace_one(self, query, document, upsert=False):
+        if self.down:
+            raise pymongo.errors.ServerSelectionTimeoutError("down")
+        self.documents[query["_id"]] = dict(document, _id=query["_id"])
+
+def result(depth, lines=1):
+    moves = ["e2e4", "d2d4", "g1f3"][:lines]
+    return {
+        "best_move": "e2e4", "ponder": "e7e5", "evaluation": "+30", "depth": depth, "pv": ["e2e4", "e7e5"], "nodes": 100,
+        "lines": [{"move": move, "evaluation": "+30", "depth": depth, "pv": [move], "nodes": 100} for move in moves],
+    }
+
+def test_deeper_results_answer_shallower_requests():
+    cache = EvalCache(size=8)
+    board = chess.Board()
+    cache.put(board, chess.engine.Limit(time=0.1, depth=20), 3, result(14, 3))
+    assert cache.get(board, chess.engine.Limit(time=0.1, depth=20), 2)['lines']==result(14, 2)['lines']
+    assert cache.get(board, chess.engine.Limit(time=0.01, depth=20))['depth']==14
+    assert cache.get(board, chess.engine.Limit(depth=12))['depth']==14
+    assert cache.get(board, chess.engine.Limit(time=1, depth=20)) is None
+    assert cache.get(board, chess.engine.Limit(time=0.1, depth=20), 4) is None
+    assert cache.stats()['memory_hits']==3 and cache.stats()['misses']==2
+
+def test_positions_ignore_move_counters():
+    board = chess.Board()
+    for move in ("g1f3", "g8f6", "f3g1", "f6g8"):
+        board.push_uci(move)
+    assert position_key(board)==position_key(chess.Board())
+    cache = EvalCache()
+    cache.put(chess.Board(), chess.engine.Limit(depth=10), 1, result(10))
+    assert cache.get(board, chess.engine.Limit(depth=10)) is not None
+
+def test_database_tier():
+    collection = Collection()
+    board = chess.Board()
+    EvalCache(collection).put(board, chess.engine.Limit(time=0.1, depth=20), 1, result(16))
+    assert collection.indexes[0][0]=="created" and "expireAfterSeconds" in collection.indexes[0][1]
+
+    # Another process finds it in the database, then in its own memory
+    cache = EvalCache(collection)
+    assert cache.get(board, chess.engine.Limit(time=0.1, depth=20))['depth']==16
+    assert cache.get(board, chess.engine.Limit(time=0.1, depth=20))['depth']==16
+    assert (cache.stats()['database_hits'], cache.stats()['memory_hits'])==(1, 1)
+
+    # A deeper request isn't asked of the database again for what was read from it
+    assert cache.get(board, chess.engine.Limit(time=1, depth=20)) is None
+    assert collection.finds==1
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        cache.get(board, chess.engine.Limit(time=0.1, depth=20))
+    assert (time.perf_counter() - start) / 1000 < 0.001
+
+    down = EvalCache(Collection(down=True))
+    assert down.get(board, chess.engine.Limit(depth=1)) is None
+    down.put(board, chess.engine.Limit(depth=1), 1, result(1))
+    assert down.get(board, chess.engine.Limit(depth=1)) is not None
+    assert down.stats()['database_errors']==2
+
+def test_least_recently_used_positions_are_dropped():
+    cache = EvalCache(size=2)
+    boards = [chess.Board(), chess.Board("8/8/8/8/8/8/8/K6k w - - 0 1"), chess.Board("8/8/8/8/8/8/8/K5k1 w - - 0 1")]
+    cache.put(boards[0], chess.engine.Limit(depth=1), 1, result(1))
+    cache.put(boards[1], chess.engine.Limit(depth=1), 1, result(1))
+    cache.get(boards[0], chess.engine.Limit(depth=1))
+    cache.put(boards[2], chess.engine.Limit(depth=1), 1, result(1))
+    assert cache.get(boards[1], chess.engine.Limit(depth=1)) is None
+    assert cache.get(boards[0], chess.engine.Limit(depth=1)) is not None
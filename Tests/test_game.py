@@ -0,0 +1,16 @@
+from PlayChess.utils.game import Game
+
+def test_legal_moves_only_for_the_player_on_move():
+    game = Game("alice-bob")
+    white, black = game.player1, game.player2
+    assert sorted(game.legal_moves_for(white)['e2'])==['e3', 'e4']
+    assert game.legal_moves_for(black)=={}
+
+    move = game.make_move('e2', 'e4', white)
+    assert move['success'] and move['legal_moves']=={}
+    assert 'legal_moves' not in game.prev_move
+    assert 'e7' in game.legal_moves_for(black)
+    assert game.legal_moves_for(white)=={}
+
+    # Moves out of turn are still refused
+    assert not game.make_move('d2', 'd4', white)['success']
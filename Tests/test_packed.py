@@ -0,0 +1,52 @@
+import pytest
+
+from PlayChess.utils import packed, fen
+from PlayChess.utils.chessboard import Chessboard
+from PlayChess.utils.exceptions import InvalidPackedPosition
+from PlayChess import config
+
+def test_positions_round_trip():
+    chessboard = Chessboard()
+    for move in ("e2-e4", "c7-c5", "e4-e5", "d7-d5", "g1-f3", "b8-c6"):
+        chessboard.make_move(*move.split("-"))
+        data = chessboard.packed_position
+        assert len(data)==packed.POSITION_SIZE
+        assert packed.unpack_fen(data)==chessboard.fen_notation
+        assert packed.pack_fen(chessboard.fen_notation)==data
+        loaded = Chessboard(data)
+        assert loaded.fen_notation==chessboard.fen_notation
+        assert loaded.position_key==chessboard.position_key
+
+def test_load_packed_flushes_states():
+    chessboard = Chessboard()
+    chessboard.make_move("e2", "e4")
+    data = packed.pack_fen(config.START_POSITION_NOTATION)
+    chessboard.load_packed(data)
+    assert chessboard.fen_notation==config.START_POSITION_NOTATION
+    assert chessboard._states.get_active_branch().get_fen()==config.START_POSITION_NOTATION
+    assert not chessboard.does_state_exist(0, 1)
+
+def test_invalid_packed_positions():
+    data = packed.pack_fen(config.START_POSITION_NOTATION)
+    with pytest.raises(InvalidPackedPosition):
+        packed.parse_packed(data[:-1])
+    with pytest.raises(InvalidPackedPosition):
+        packed.parse_packed(b"\xff" + data[1:])
+    assert Chessboard(b"\xff" + data[1:]).fen_notation==config.START_POSITION_NOTATION
+
+def test_moves_round_trip():
+    moves = ["e2-e4", "g8-f6", "e7-e8-Q", "b2-a1-N"]
+    assert [packed.unpack_move(packed.pack_move(move)) for move in moves]==moves
+    assert all(packed.pack_move(move) < 1 << 16 for move in moves)
+    data = packed.pack_moves(moves)
+    assert len(data)==2 * len(moves)
+    assert packed.unpack_moves(packed.from_text(packed.to_text(data)))==moves
+
+def test_counters_out_of_range():
+    # Fens take any counter, only their packed form is bounded
+    large = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 70000 70000"
+    assert fen.parse_fen(large).full_moves==70000
+    assert Chessboard(large).fen_notation==large
+    largest = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 65535 65535"
+    assert packed.unpack_fen(packed.pack_fen(largest))==largest
+    assert packed.pack_fen(large)==packed.pack_fen(largest)
@@ -0,0 +1,20 @@
+from PlayChess.utils.chessboard import Chessboard
+from PlayChess.utils.perft import PERFT_POSITIONS, divide, perft, run_suite
+
+def test_perft_reference_positions():
+    for result in run_suite(3):
+        assert result['nodes']==result['expected'], result['name']
+
+def test_perft_enpassant_depth():
+    # Enpassant captures that uncover a check along the rank only show up at depth 4
+    reference = PERFT_POSITIONS[2]
+    position = Chessboard(reference['fen'])._position
+    assert perft(position, 4)==reference['counts'][3]
+
+def test_perft_leaves_position_unchanged():
+    position = Chessboard(PERFT_POSITIONS[1]['fen'])._position
+    key = position.key
+    counts = divide(position, 2)
+    assert sum(counts.values())==PERFT_POSITIONS[1]['counts'][1]
+    assert position.key==key
+    assert position.key==position.compute_key()
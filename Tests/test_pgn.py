@@ -0,0 +1,65 @@
+import io
+
+from PlayChess.utils import bitboard, pgn
+from PlayChess.utils.chessboard import Chessboard
+
+GAMES = """[Event "Casual"]
+[White "White"]
+[Black "Black"]
+[Result "1-0"]
+
+{Italian} 1. e4 e5 2. Nf3 Nc6 3. Bc4 {aiming at f7} (3. Bb5 a6 (3... Nf6) 4. Ba4)
+3... Bc5 ; giuoco piano
+4. O-O Nf6 $1 5. d3 d6 1-0
+
+[Event "Broken"]
+
+1. e4 e5 2. Ke3 *
+
+[Event "Promotion"]
+[SetUp "1"]
+[FEN "4k3/P7/8/8/8/8/8/4K3 w - - 0 1"]
+
+1. a8=Q+ Kd7 *
+"""
+
+def test_read_variations_and_comments():
+    errors = []
+    games = list(pgn.read_games(io.StringIO(GAMES), errors))
+    assert [headers['Event'] for headers, _ in games]==['Casual', 'Promotion']
+    assert errors==[(2, 'Ke3')]
+
+    headers, states = games[0]
+    assert states.get_title()=='White vs Black'
+    root = states.get_root()
+    assert root.get_annotation()=='Italian'
+    states.set_branch(0, 5)
+    assert states.get_active_branch().get_annotation()=='aiming at f7'
+    assert [move for _, _, move in states.get_branch_state()]==['e4', 'e5', 'Nf3', 'Nc6', 'Bc4', 'Bc5', 'O-O', 'Nf6', 'd3', 'd6']
+    states.set_branch(0, 6)
+    assert states.get_active_branch().get_annotation()=='giuoco piano'
+
+    # Both variations are branches of the tree
+    bb5 = [child for child in states._nodes[(0, 4)].get_children() if child.get_move()=='Bb5'][0]
+    assert [child.get_move() for child in bb5.get_children()]==['a6', 'Nf6']
+
+def test_write_round_trip():
+    games = list(pgn.read_games(io.StringIO(GAMES), []))
+    for headers, states in games:
+        text = pgn.write_game(states, headers)
+        _, again = next(pgn.read_games(io.StringIO(text)))
+        assert again.get_states_as_json()==states.get_states_as_json()
+    text = pgn.write_game(games[0][1], games[0][0])
+    assert '(3. Bb5 a6 (3... Nf6) 4. Ba4) 3... Bc5' in text.replace('\n', ' ')
+    assert '[FEN "4k3/P7/8/8/8/8/8/4K3 w - - 0 1"]' in pgn.write_game(games[1][1], games[1][0])
+
+def test_san_disambiguation():
+    position = Chessboard("4k3/8/8/8/8/8/8/R4RK1 w - - 0 1")._position
+    move = pgn.parse_san(position, "Rad1")
+    assert move==bitboard.encode_move(bitboard.SQUARES['a1'], bitboard.SQUARES['d1'])
+    assert pgn.make_san(position, move)=='Rad1'
+    position = Chessboard("4k3/8/8/8/8/8/8/R3K2R w KQ - 0 1")._position
+    assert pgn.make_san(position, pgn.parse_san(position, "Rd1"))=='Rd1'
+    assert pgn.make_san(position, pgn.parse_san(position, "O-O"))=='O-O'
+    position = Chessboard("4k3/8/8/2N1N3/8/8/8/2N1K3 w - - 0 1")._position
+    assert pgn.make_san(position, pgn.parse_san(position, "Nc5d3"))=='Nc5d3'
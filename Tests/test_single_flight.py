@@ -0,0 +1,60 @@
+import threading
+import time
+
+from PlayChess.utils.single_flight import SingleFlight
+
+def test_identical_calls_share_a_single_run():
+    flight = SingleFlight()
+    runs = []
+    started = threading.Event()
+
+    def search():
+        runs.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "e2e4"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("start", search)))
+    leader.start()
+    started.wait()
+    waiters = [threading.Thread(target=lambda: results.append(flight.do("start", search))) for _ in range(5)]
+    for waiter in waiters:
+        waiter.start()
+    other = flight.do("other", lambda: "d2d4")
+    for thread in [leader] + waiters:
+        thread.join()
+
+    assert other=="d2d4"
+    assert results==["e2e4"] * 6
+    assert len(runs)==1
+    assert flight.stats()=={"calls": 2, "coalesced": 5, "in_flight": 0}
+
+    # Once over, a call runs again
+    assert flight.do("start", lambda: "c2c4")=="c2c4"
+
+def test_waiters_get_the_exception():
+    flight = SingleFlight()
+    started = threading.Event()
+    errors = []
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("engine died")
+
+    def call():
+        try:
+            flight.do("start", failing)
+        except ValueError as error:
+            errors.append(str(error))
+
+    threads = [threading.Thread(target=call)]
+    threads[0].start()
+    started.wait()
+    threads.append(threading.Thread(target=call))
+    threads[1].start()
+    for thread in threads:
+        thread.join()
+    assert errors==["engine died"] * 2
+    assert flight.stats()['coalesced']==1
@@ -0,0 +1,223 @@
+import json
+
+from PlayChess import config
+from PlayChess.utils.chessboard import Chessboard
+
+ITALIAN = ["e2-e4", "e7-e5", "g1-f3", "b8-c6", "f1-c4", "f8-c5", "e1-g1", "g8-f6"]
+
+def play(chessboard, moves):
+    for move in moves:
+        chessboard.make_move(*move.split('-'))
+
+def test_variation_and_line():
+    chessboard = Chessboard()
+    play(chessboard, ITALIAN)
+    chessboard.get_prev_state()
+    chessboard.get_prev_state()
+    play(chessboard, ["b1-c3", "g8-f6"])
+    assert chessboard.get_state()['branch']==1
+    line = chessboard.get_branch_state()
+    assert [move for _, _, move in line][-2:]==['Nc3', 'Nf6']
+    assert line[-1]==(1, 8, 'Nf6')
+    # Going back into the main line shows the main line again
+    chessboard.get_prev_state()
+    chessboard.get_prev_state()
+    assert chessboard.get_branch_state()[-1]==(0, 8, 'Nf6')
+    assert chessboard.get_next_state()
+    assert chessboard.get_state()['move']=='0-0'
+
+def test_transposition_reuses_node():
+    chessboard = Chessboard()
+    play(chessboard, ["g1-f3", "g8-f6", "b1-c3"])
+    chessboard.get_prev_state()
+    chessboard.get_prev_state()
+    chessboard.get_prev_state()
+    play(chessboard, ["b1-c3", "g8-f6", "g1-f3"])
+    # Nc3 opened a branch, Nf3 reached a position of the main line
+    assert chessboard.get_state()['branch']==0
+    assert chessboard.get_state()['state']==3
+
+def test_delete_branch():
+    chessboard = Chessboard()
+    play(chessboard, ITALIAN)
+    chessboard.get_prev_state()
+    play(chessboard, ["d7-d6"])
+    chessboard._states.delete_branch(1)
+    assert chessboard.get_state()['state']==7
+    assert chessboard.get_branch_state()[-1]==(0, 8, 'Nf6')
+
+def test_states_json_round_trip():
+    chessboard = Chessboard()
+    play(chessboard, ITALIAN)
+    chessboard.get_prev_state()
+    play(chessboard, ["d7-d6"])
+    states = json.loads(json.dumps(chessboard.get_states_as_json()))
+    loaded = Chessboard()
+    loaded.load_states(states)
+    assert loaded.get_states_as_json()==chessboard.get_states_as_json()
+    assert loaded.fen_notation==chessboard._states.get_active_branch().get_fen()
+    assert loaded.get_branch_state()==chessboard.get_branch_state()
+
+def test_navigation_returns_changed_squares():
+    chessboard = Chessboard()
+    play(chessboard, ITALIAN)
+    fens = [chessboard.fen_notation]
+    changes = chessboard.get_prev_state()
+    assert sorted(change['pos'] for change in changes)==['f6', 'g8']
+    fens.append(chessboard.fen_notation)
+    # Taking back castling puts back the king and the rook
+    changes = chessboard.get_prev_state()
+    assert sorted(change['pos'] for change in changes)==['e1', 'f1', 'g1', 'h1']
+    assert chessboard.fen_notation=="r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4"
+    chessboard.get_next_state()
+    assert chessboard.fen_notation==fens[1]
+    chessboard.get_next_state()
+    assert chessboard.fen_notation==fens[0]
+    assert chessboard.get_next_state() is None
+    assert chessboard.position_key==Chessboard(fens[0]).position_key
+
+def test_navigation_of_loaded_states():
+    chessboard = Chessboard()
+    play(chessboard, ITALIAN)
+    loaded = Chessboard()
+    loaded.load_states(json.loads(json.dumps(chessboard.get_states_as_json())))
+    changes = loaded.get_prev_state()
+    assert sorted(change['pos'] for change in changes)==['f6', 'g8']
+    assert loaded.get_branch_state()==chessboard.get_branch_state()
+
+def test_keyframes(monkeypatch):
+    monkeypatch.setattr(config, 'STATE_KEYFRAME_INTERVAL', 4)
+    chessboard = Chessboard()
+    fens = [chessboard.fen_notation]
+    for move in ITALIAN + ["d2-d3", "d7-d6"]:
+        play(chessboard, [move])
+        fens.append(chessboard.fen_notation)
+    states = chessboard.get_states_as_json()['states']
+    assert [('fen' in state['0']) for state in states]==[True, False, False, False, True, False, False, False, True, False, False]
+    assert states[5]['0']['played']=="f1-c4"
+    # Every state can still be loaded from the stored history, and moves read from it
+    # are taken back without reloading the board
+    loaded = Chessboard()
+    loaded.load_states(json.loads(json.dumps(chessboard.get_states_as_json())))
+    def load_state(self, node):
+        raise AssertionError("state {} was reloaded from its fen".format(node._state))
+    monkeypatch.setattr(Chessboard, '_load_state', load_state)
+    for fen in reversed(fens[:-1]):
+        loaded.get_prev_state()
+        assert loaded.fen_notation==fen
+    assert loaded.get_states_as_json()['states']==chessboard.get_states_as_json()['states']
+
+def test_states_stored_with_every_fen():
+    # Histories stored before keyframes have a fen in every state and no moves
+    chessboard = Chessboard()
+    fens = [chessboard.fen_notation]
+    for move in ITALIAN:
+        play(chessboard, [move])
+        fens.append(chessboard.fen_notation)
+    states = chessboard.get_states_as_json()
+    for index, state in enumerate(states['states']):
+        state['0'].pop('played', None)
+        state['0']['fen'] = fens[index]
+    loaded = Chessboard()
+    loaded.load_states(states)
+    assert loaded.fen_notation==fens[-1]
+    assert sorted(change['pos'] for change in loaded.get_prev_state())==['f6', 'g8']
+    assert loaded.fen_notation==fens[-2]
+
+def apply_story_changes(document, changes):
+    header, changed, deleted = changes
+    document.update(header)
+    for node_key, node in changed.items():
+        branch_id, state = node_key.split('.')
+        document['branches'].setdefault(branch_id, {})[state] = node
+    for node_key in deleted:
+        branch_id, state = node_key.split('.')
+        del document['branches'][branch_id][state]
+        if not document['branches'][branch_id]:
+            del document['branches'][branch_id]
+
+def test_story_changes_since_save():
+    chessboard = Chessboard()
+    play(chessboard, ITALIAN[:4])
+    document = chessboard.get_story_document()
+    assert sorted(document['branches']['0'])==['0', '1', '2', '3', '4']
+    chessboard.mark_story_saved()
+
+    chessboard.get_prev_state()
+    play(chessboard, ["g8-f6", "f1-c4"])
+    chessboard._states.delete_state(0, 4)
+    header, changed, deleted = chessboard.get_story_changes()
+    assert sorted(changed)==['1.4', '1.5']
+    assert deleted==['0.4']
+    assert header['active_branch']==1 and header['current_state']==5
+    assert header['forks']=={'1': [0, 3]}
+
+    # Applying the changes to the saved document gives the stored tree
+    apply_story_changes(document, (header, changed, deleted))
+    assert document==chessboard.get_story_document()
+
+    chessboard.mark_story_saved()
+    assert chessboard.get_story_changes()[1:]==({}, [])
+
+def test_story_loads_branches_when_reached():
+    chessboard = Chessboard()
+    play(chessboard, ITALIAN)
+    for _ in range(4):
+        chessboard.get_prev_state()
+    play(chessboard, ["d2-d3", "d7-d6"])
+    for _ in range(2):
+        chessboard.get_prev_state()
+    play(chessboard, ["d2-d4"])
+    chessboard._states.set_branch(0, 8)
+    document = json.loads(json.dumps(chessboard.get_story_document()))
+
+    requests = []
+    def branch_loader(branch_ids):
+        requests.append(branch_ids)
+        return {str(branch_id): document['branches'][str(branch_id)] for branch_id in branch_ids}
+
+    # Only the main line is read up front
+    stored = dict(document, branches={'0': document['branches']['0']})
+    loaded = Chessboard()
+    loaded.load_story(stored, branch_loader)
+    assert requests==[]
+    assert loaded.fen_notation==chessboard._states.get_active_branch().get_fen()
+    assert loaded.get_branch_state()==chessboard.get_branch_state()
+
+    # Going forward from the fork fetches the branches played from it
+    for _ in range(4):
+        loaded.get_prev_state()
+    assert requests==[]
+    loaded.get_next_state(1)
+    assert requests==[[1, 2]]
+    assert loaded.get_state()['branch']==1
+    assert loaded.get_story_changes()[1:]==({}, [])
+    assert loaded.get_story_document()['branches']==document['branches']
+    assert loaded.get_story_document()['forks']==document['forks']
+
+    # The active line is read when it isn't the main line
+    requests.clear()
+    chessboard._states.set_branch(2, 5)
+    stored = dict(chessboard.get_story_document(), branches={'0': document['branches']['0']})
+    loaded = Chessboard()
+    loaded.load_story(stored, branch_loader)
+    assert requests==[[2]]
+    assert loaded.fen_notation==chessboard._states.get_active_branch().get_fen()
+
+def test_repetitions_of_reloaded_story():
+    chessboard = Chessboard()
+    shuffle = ["g1-f3", "g8-f6", "f3-g1", "f6-g8"]
+    play(chessboard, shuffle + shuffle[:3])
+    document = json.loads(json.dumps(chessboard.get_story_document()))
+
+    # The story is reopened one move short of the third repetition
+    loaded = Chessboard()
+    loaded.load_story(document)
+    assert loaded._repetitions[loaded.position_key]==2
+    play(loaded, shuffle[3:])
+    assert loaded.is_draw()==[True, "threefold repetition", "0.5"]
+
+    loaded = Chessboard()
+    loaded.load_states(json.loads(json.dumps(chessboard.get_states_as_json())))
+    play(loaded, shuffle[3:])
+    assert loaded.is_draw()[1]=="threefold repetition"
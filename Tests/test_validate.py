@@ -0,0 +1,40 @@
+from PlayChess.utils import pgn, validate
+
+MATE_IN_TWO = "6k1/ppR5/3B2p1/3p4/4rnK1/5P2/PP1r3P/8 b - - 0 1"
+
+def test_validate_positions():
+    assert validate.validate_position(MATE_IN_TWO + " | d2-g2 g4-h4 g6-g5 | checkmate") is None
+    assert validate.validate_position(MATE_IN_TWO + " | d2-g2 g4-h4 | checkmate")=="Status is none, expected checkmate"
+    assert validate.validate_position(MATE_IN_TWO + " | d2-g2 g4-g5")=="Illegal move g4-g5"
+    assert validate.validate_position("8/8/8/8 w - - 0 1")=="Invalid fen 8/8/8/8 w - - 0 1"
+    epd = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - bm e4 Nf3; id \"start\";"
+    assert validate.validate_position(epd) is None
+    assert validate.validate_position(epd.replace("Nf3", "Nf4"))=="Illegal bm move Nf4"
+
+def test_validate_games():
+    fools_mate = '[Result "0-1"]\n\n1. f3 e5 2. g4 Qh4# 0-1\n'
+    (headers, movetext), = pgn.split_games(fools_mate.splitlines())
+    assert validate.validate_game(headers, movetext) is None
+    headers['Result'] = '1/2-1/2'
+    assert validate.validate_game(headers, movetext)=="Game ends in checkmate but the result is 1/2-1/2"
+    assert validate.validate_game({}, "1. e4 e5 2. Ke3") == "Unreadable move Ke3"
+
+def test_games_go_on_after_unclaimed_draws():
+    shuffle = "Nf3 Nf6 Ng1 Ng8 "
+    # The start position comes up a third time, nobody claims the draw
+    assert validate.validate_game({}, shuffle * 2 + "e4 e5") is None
+    # A fifth time ends the game
+    assert validate.validate_game({}, shuffle * 4 + "e4")=="Move after fivefold repetition e4 at ply 17"
+    # Fifty moves without a capture or a pawn move don't end it either, seventy five do
+    assert validate.validate_game({"FEN": "4k3/8/8/8/8/8/8/R3K3 w - - 98 60"}, "Ra2 Kd8 Ra1 Ke8") is None
+    assert validate.validate_game({"FEN": "4k3/8/8/8/8/8/8/R3K3 w - - 148 60"}, "Ra2 Kd8 Ra1")=="Move after seventy five move Ra1 at ply 3"
+
+def test_validate_files(tmp_path):
+    positions = tmp_path / "puzzles.fen"
+    positions.write_text("\n".join([MATE_IN_TWO + " | d2-g2 g4-h4 g6-g5 | checkmate"] * 5 + ["not a fen"]))
+    games = tmp_path / "games.pgn"
+    games.write_text('[Result "0-1"]\n\n1. f3 e5 2. g4 Qh4# 0-1\n\n[Result "*"]\n\n1. e4 e5 2. Ke3 *\n')
+    results = list(validate.validate_files([str(positions), str(games)], workers=2, chunk_size=2))
+    assert sum(count for _, count, _ in results)==8
+    errors = sorted((path, number) for path, _, chunk_errors in results for number, _ in chunk_errors)
+    assert errors==sorted([(str(positions), 6), (str(games), 2)])
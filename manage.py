@@ -10,7 +10,172 @@ import getpass
 USERNAME_REGEX = config.USERNAME_REGEX
 TERMINAL_COLORS = config.TERMINAL_COLORS
 
-if len(sys.argv) == 2:
+# Counts move tree nodes of the reference positions and reports nodes per second
+def perft(depth):
+    from PlayChess.utils.perft import run_suite
+
+    failed = False
+    total_nodes = 0
+    total_seconds = 0
+    for result in run_suite(depth):
+        total_nodes += result['nodes']
+        total_seconds += result['seconds']
+        color = TERMINAL_COLORS['CGREEN'] if result['passed'] else TERMINAL_COLORS['CRED']
+        print(
+            color +
+            "{name:<24} depth {depth}  nodes {nodes:>9}  expected {expected:>9}  {nps:>8} nodes/sec".format(**result) +
+            TERMINAL_COLORS['CEND']
+        )
+        failed = failed or not result['passed']
+    print(
+        TERMINAL_COLORS['CBOLD'] +
+        "Total {} nodes in {:.2f}s, {} nodes/sec".format(
+            total_nodes, total_seconds, int(total_nodes / total_seconds) if total_seconds else 0
+        ) +
+        TERMINAL_COLORS['CEND']
+    )
+    if failed:
+        sys.exit(1)
+
+# Imports every game of a pgn file as a story, optionally owned by a user
+def import_pgn(path, username=None):
+    from PlayChess.utils.pgn import read_games
+    from PlayChess.utils.story import importStories
+
+    errors = []
+    with open(path, encoding="utf-8", errors="replace") as pgn_file:
+        count = importStories(db, read_games(pgn_file, errors), username)
+    print(
+        TERMINAL_COLORS['CGREEN'] +
+        "Imported {} games".format(count) +
+        TERMINAL_COLORS['CEND']
+    )
+    for number, message in errors:
+        print(
+            TERMINAL_COLORS['CRED'] +
+            "Skipped game {}: {}".format(number, message) +
+            TERMINAL_COLORS['CEND']
+        )
+
+# Checks position and pgn files against the rule engine on every core
+def validate(paths):
+    import time
+    from PlayChess.utils.validate import validate_files
+
+    checked = 0
+    failed = 0
+    start = time.perf_counter()
+    for path, count, errors in validate_files(paths):
+        checked += count
+        failed += len(errors)
+        for number, message in errors:
+            print(
+                TERMINAL_COLORS['CRED'] +
+                "{}:{} {}".format(path, number, message) +
+                TERMINAL_COLORS['CEND']
+            )
+    seconds = time.perf_counter() - start
+    print(
+        TERMINAL_COLORS['CBOLD'] +
+        "Checked {} items in {:.2f}s, {} items/sec, {} invalid".format(
+            checked, seconds, int(checked / seconds) if seconds else 0, failed
+        ) +
+        TERMINAL_COLORS['CEND']
+    )
+    if failed:
+        sys.exit(1)
+
+# Plays random games through the chessboard and python-chess, reports where they differ
+def fuzz(games, seed):
+    from PlayChess.utils.differential import run_fuzz
+
+    differences, throughput = run_fuzz(games, seed)
+    for difference in differences:
+        print(
+            TERMINAL_COLORS['CRED'] +
+            "Seed {seed} ply {ply} {kind}: ours {ours} theirs {theirs} at {fen}".format(**difference) +
+            TERMINAL_COLORS['CEND']
+        )
+    print(
+        TERMINAL_COLORS['CBOLD'] +
+        "{} games, {} differences, {} plies: chessboard {} plies/sec, python-chess {} plies/sec".format(
+            games, len(differences), throughput['plies'], throughput['chessboard'], throughput['python-chess']
+        ) +
+        TERMINAL_COLORS['CEND']
+    )
+    if differences:
+        sys.exit(1)
+
+if len(sys.argv) >= 3 and sys.argv[1] == "validate":
+    try:
+        validate(sys.argv[2:])
+    except FileNotFoundError as error:
+        print(
+            TERMINAL_COLORS['CRED'] + 
+            "No such file : " + str(error.filename) + 
+            TERMINAL_COLORS['CEND']
+        )
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print(
+            TERMINAL_COLORS['CRED'] + 
+            "Process Cancelled" + 
+            TERMINAL_COLORS['CEND']
+        )
+        sys.exit(1)
+elif len(sys.argv) in (3, 4) and sys.argv[1] == "import_pgn":
+    try:
+        import_pgn(*sys.argv[2:])
+    except FileNotFoundError:
+        print(
+            TERMINAL_COLORS['CRED'] + 
+            "No such file : " + sys.argv[2] + 
+            TERMINAL_COLORS['CEND']
+        )
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print(
+            TERMINAL_COLORS['CRED'] + 
+            "Process Cancelled" + 
+            TERMINAL_COLORS['CEND']
+        )
+        sys.exit(1)
+elif len(sys.argv) in (2, 3, 4) and sys.argv[1] == "fuzz":
+    if not all(argument.isdigit() for argument in sys.argv[2:]):
+        print(
+            TERMINAL_COLORS['CRED'] + 
+            "Games and seed should be positive numbers" + 
+            TERMINAL_COLORS['CEND']
+        )
+        sys.exit(1)
+    try:
+        fuzz(*(int(argument) for argument in sys.argv[2:] + ["100", "0"][len(sys.argv) - 2:]))
+    except KeyboardInterrupt:
+        print(
+            TERMINAL_COLORS['CRED'] + 
+            "Process Cancelled" + 
+            TERMINAL_COLORS['CEND']
+        )
+        sys.exit(1)
+elif len(sys.argv) in (2, 3) and sys.argv[1] == "perft":
+    depth = sys.argv[2] if len(sys.argv) == 3 else "3"
+    if not depth.isdigit() or int(depth) < 1:
+        print(
+            TERMINAL_COLORS['CRED'] + 
+            "Depth should be a positive number" + 
+            TERMINAL_COLORS['CEND']
+        )
+        sys.exit(1)
+    try:
+        perft(int(depth))
+    except KeyboardInterrupt:
+        print(
+            TERMINAL_COLORS['CRED'] + 
+            "Process Cancelled" + 
+            TERMINAL_COLORS['CEND']
+        )
+        sys.exit(1)
+elif len(sys.argv) == 2:
     if sys.argv[1] == "create_admin":
         try:
             while True:
@@ -164,6 +329,25 @@ if len(sys.argv) == 2:
                 TERMINAL_COLORS['CEND']
             )
             sys.exit(1)
+    elif sys.argv[1] == "benchmark":
+        from PlayChess.utils.benchmark import run_benchmarks
+
+        for description, value, unit in run_benchmarks():
+            print(
+                TERMINAL_COLORS['CBLUE'] + 
+                "{:<32} {:>12} {}".format(description, value, unit) + 
+                TERMINAL_COLORS['CEND']
+            )
+    elif sys.argv[1] == "engine_benchmark":
+        from PlayChess.utils.benchmark import run_engine_benchmarks
+        from PlayChess.utils.engine_pool import get_pool
+
+        for description, value, unit in run_engine_benchmarks(get_pool()):
+            print(
+                TERMINAL_COLORS['CBLUE'] + 
+                "{:<32} {:>12} {}".format(description, value, unit) + 
+                TERMINAL_COLORS['CEND']
+            )
     elif sys.argv[1] == "mongo":
         try:
             print(
@@ -196,6 +380,12 @@ elif len(sys.argv) == 1:
     4) python manage.py prod            : Runs the production server
     5) python manage.py shell           : Runs the production shell
     6) python manage.py logs            : Shows production logs
+    7) python manage.py perft [depth]   : Checks move generation and reports nodes/sec
+    8) python manage.py benchmark       : Measures memory and speed of the chessboard
+    9) python manage.py import_pgn <file> [username] : Imports the games of a pgn file as stories
+    10) python manage.py validate <files>          : Checks fen, epd and pgn files against the rules
+    11) python manage.py fuzz [games] [seed]       : Compares the chessboard with python-chess on random games
+    12) python manage.py engine_benchmark          : Measures requests/sec a stockfish engine serves
     """
     print(TERMINAL_COLORS['CBLUE']+user_instruction+TERMINAL_COLORS['CEND'])
 else: